@@ -0,0 +1,352 @@
+#! /usr/bin/env python3
+import argparse
+import collections
+import importlib.util
+import inspect
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+CANDIDATE_FILE = os.path.join(BENCHMARK_DIR, "..", "src", "rzolut_mapper.py")
+MAPPER_PATH = "src/rzolut_mapper.py"
+
+# --keys for records one side could not produce at all
+MISSING_KEY = "!MISSING"
+ERROR_KEY = "!ERROR"
+
+
+# ----------------------------------------
+def load_mapper_module(module_name, file_name):
+    spec = importlib.util.spec_from_file_location(module_name, file_name)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# ----------------------------------------
+def construct_mapper(module, data_source, mapper_options):
+
+    # --mapper(data_source, options) since the library interface was added, the
+    # --versions before it read the data source from the module level args and
+    # --took what options they had as keywords
+    parameters = inspect.signature(module.mapper).parameters
+    if "data_source" in parameters:
+        return module.mapper(data_source, mapper_options)
+    module.args = argparse.Namespace(data_source=data_source, **mapper_options)
+    return module.mapper(
+        **{key: value for key, value in mapper_options.items() if key in parameters}
+    )
+
+
+# ----------------------------------------
+def init_worker(baseline_file, candidate_file, data_source, mapper_options):
+    global baseline_mapper, candidate_mapper, candidate_module
+
+    # --both versions are loaded side by side under their own module names
+    baseline_module = load_mapper_module("baseline_mapper", baseline_file)
+    candidate_module = load_mapper_module("candidate_mapper", candidate_file)
+    baseline_mapper = construct_mapper(baseline_module, data_source, mapper_options)
+    candidate_mapper = construct_mapper(candidate_module, data_source, mapper_options)
+
+
+# ----------------------------------------
+def normalize_record(json_data):
+
+    # --the order of FEATURES carries no meaning for the load, so it is sorted
+    if json_data and "FEATURES" in json_data:
+        json_data = dict(json_data)
+        json_data["FEATURES"] = sorted(
+            json_data["FEATURES"], key=lambda item: json.dumps(item, sort_keys=True)
+        )
+    return json_data
+
+
+# ----------------------------------------
+def differing_keys(baseline_record, candidate_record):
+    if not baseline_record or not candidate_record:
+        return [MISSING_KEY] if baseline_record != candidate_record else []
+
+    keys = set()
+    for key in set(baseline_record) | set(candidate_record):
+        if key != "FEATURES" and baseline_record.get(key) != candidate_record.get(key):
+            keys.add(key)
+
+    # --features are compared as multisets and reported by their attribute names
+    baseline_features = collections.Counter(
+        json.dumps(item, sort_keys=True) for item in baseline_record.get("FEATURES", [])
+    )
+    candidate_features = collections.Counter(
+        json.dumps(item, sort_keys=True)
+        for item in candidate_record.get("FEATURES", [])
+    )
+    for feature in (baseline_features - candidate_features) + (
+        candidate_features - baseline_features
+    ):
+        keys.update("FEATURES." + key for key in json.loads(feature))
+    return sorted(keys)
+
+
+# ----------------------------------------
+def map_record(mapper_obj, line):
+
+    # --every side parses its own copy, older versions clean the input in place
+    try:
+        return normalize_record(mapper_obj.map(json.loads(line))), None
+    except Exception as err:
+        return None, f"{type(err).__name__}: {err}"
+
+
+# ----------------------------------------
+def compare_chunk(chunk):
+    input_file, start_offset, end_offset, max_examples, max_diff_records = chunk
+    row_count = 0
+    diff_count = 0
+    bad_json_count = 0
+    key_counts = collections.Counter()
+    key_examples = collections.defaultdict(list)
+    diff_records = []
+
+    input_file_handle = candidate_module.open_input_file(input_file)
+    with input_file_handle:
+        byte_limit = None
+        if end_offset is not None:
+            input_file_handle.seek(start_offset)
+            byte_limit = end_offset - start_offset
+        for line in candidate_module.read_lines(input_file_handle, 8388608, byte_limit):
+            if not line.strip():
+                continue
+            row_count += 1
+            try:
+                uid = json.loads(line).get("uid")
+            except json.JSONDecodeError:
+                bad_json_count += 1
+                continue
+
+            baseline_record, baseline_error = map_record(baseline_mapper, line)
+            candidate_record, candidate_error = map_record(candidate_mapper, line)
+            if baseline_error or candidate_error:
+                keys = [ERROR_KEY] if baseline_error != candidate_error else []
+            else:
+                keys = differing_keys(baseline_record, candidate_record)
+            if not keys:
+                continue
+
+            diff_count += 1
+            for key in keys:
+                key_counts[key] += 1
+                if len(key_examples[key]) < max_examples:
+                    key_examples[key].append(uid)
+            if len(diff_records) < max_diff_records:
+                diff_records.append(
+                    {
+                        "uid": uid,
+                        "keys": keys,
+                        "baseline": baseline_record or baseline_error,
+                        "candidate": candidate_record or candidate_error,
+                    }
+                )
+
+    return row_count, diff_count, bad_json_count, key_counts, key_examples, diff_records
+
+
+# ----------------------------------------
+def plan_chunks(input_file, chunk_mb, worker_count, module):
+
+    # --line aligned byte ranges of an uncompressed file, a compressed one can
+    # --not be entered in the middle and is compared in one piece
+    if module.detect_compression(input_file, check_magic=True):
+        return [(0, None)]
+    file_size = os.path.getsize(input_file)
+    chunk_count = max(
+        worker_count, -(-file_size // int(chunk_mb * 1048576)) if file_size else 1
+    )
+    return [
+        module.shard_range(input_file, chunk_number, chunk_count)
+        for chunk_number in range(1, chunk_count + 1)
+    ]
+
+
+# ----------------------------------------
+def extract_revision(revision, temp_dir):
+    file_name = os.path.join(temp_dir, "baseline_mapper.py")
+    with open(file_name, "wb") as file_handle:
+        subprocess.run(
+            ["git", "show", f"{revision}:{MAPPER_PATH}"],
+            cwd=BENCHMARK_DIR,
+            stdout=file_handle,
+            check=True,
+        )
+    return file_name
+
+
+# ----------------------------------------
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-i", "--input_file", dest="input_file", help="the name of the input file"
+    )
+    parser.add_argument(
+        "-d", "--data_source", dest="data_source", help="data source code (required)"
+    )
+    parser.add_argument(
+        "--baseline_rev",
+        "--baseline-rev",
+        dest="baseline_rev",
+        default="HEAD",
+        help="git revision whose mapper is the baseline (default HEAD)",
+    )
+    parser.add_argument(
+        "--baseline",
+        dest="baseline",
+        help="baseline mapper script, instead of --baseline_rev",
+    )
+    parser.add_argument(
+        "--candidate",
+        dest="candidate",
+        default=CANDIDATE_FILE,
+        help="candidate mapper script (default the working tree src/rzolut_mapper.py)",
+    )
+    parser.add_argument(
+        "--reference_file",
+        "--reference-file",
+        dest="reference_file",
+        help="reference file both mappers load",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        dest="workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of worker processes (default one per cpu)",
+    )
+    parser.add_argument(
+        "--chunk_mb",
+        "--chunk-mb",
+        dest="chunk_mb",
+        type=float,
+        default=64.0,
+        help="input megabytes per unit of work (default 64)",
+    )
+    parser.add_argument(
+        "--max_examples",
+        "--max-examples",
+        dest="max_examples",
+        type=int,
+        default=10,
+        help="uids listed per differing key (default 10)",
+    )
+    parser.add_argument(
+        "-o",
+        "--diff_file",
+        dest="diff_file",
+        help="write the differing records, both sides, to this JSON lines file",
+    )
+    parser.add_argument(
+        "--max_diff_records",
+        "--max-diff-records",
+        dest="max_diff_records",
+        type=int,
+        default=1000,
+        help="differing records written to the diff file (default 1000)",
+    )
+    args = parser.parse_args()
+
+    if not args.input_file or not os.path.exists(args.input_file):
+        print("\nPlease supply a valid input file name on the command line\n")
+        sys.exit(1)
+    if not args.data_source:
+        print("\nPlease supply a data source code on the command line\n")
+        sys.exit(1)
+    if args.workers < 1 or args.chunk_mb <= 0:
+        print("\nPlease supply a positive number of workers and chunk size\n")
+        sys.exit(1)
+
+    proc_start_time = time.time()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        baseline_file = args.baseline
+        if not baseline_file:
+            try:
+                baseline_file = extract_revision(args.baseline_rev, temp_dir)
+            except subprocess.CalledProcessError:
+                print(f"\nCould not read {MAPPER_PATH} at {args.baseline_rev}\n")
+                sys.exit(1)
+        baseline_name = args.baseline or args.baseline_rev
+
+        # --loading both here first reports a broken mapper before any work starts
+        mapper_options = {"reference_file": args.reference_file}
+        try:
+            init_worker(baseline_file, args.candidate, args.data_source, mapper_options)
+        except Exception as err:
+            print(f"\nCould not load the mappers: {type(err).__name__}: {err}\n")
+            sys.exit(1)
+        chunks = [
+            (
+                args.input_file,
+                start_offset,
+                end_offset,
+                args.max_examples,
+                args.max_diff_records,
+            )
+            for start_offset, end_offset in plan_chunks(
+                args.input_file, args.chunk_mb, args.workers, candidate_module
+            )
+        ]
+        print(f"comparing {baseline_name} with {args.candidate} in {len(chunks)} chunks")
+
+        # --only the first differing records are kept, the rest are counted
+        row_count = diff_count = bad_json_count = 0
+        key_counts = collections.Counter()
+        key_examples = collections.defaultdict(list)
+        diff_records = []
+        with ProcessPoolExecutor(
+            max_workers=min(args.workers, len(chunks)),
+            initializer=init_worker,
+            initargs=(baseline_file, args.candidate, args.data_source, mapper_options),
+        ) as executor:
+            for chunk_result in executor.map(compare_chunk, chunks):
+                (
+                    chunk_row_count,
+                    chunk_diff_count,
+                    chunk_bad_json_count,
+                    chunk_key_counts,
+                    chunk_key_examples,
+                    chunk_diff_records,
+                ) = chunk_result
+                row_count += chunk_row_count
+                diff_count += chunk_diff_count
+                bad_json_count += chunk_bad_json_count
+                key_counts.update(chunk_key_counts)
+                for key, uids in chunk_key_examples.items():
+                    key_examples[key].extend(
+                        uids[: args.max_examples - len(key_examples[key])]
+                    )
+                diff_records.extend(
+                    chunk_diff_records[: args.max_diff_records - len(diff_records)]
+                )
+                print(f"{row_count} rows compared, {diff_count} differ")
+
+    if args.diff_file:
+        with open(args.diff_file, "w") as file_handle:
+            for diff_record in diff_records:
+                file_handle.write(json.dumps(diff_record, sort_keys=True) + "\n")
+
+    elapsed_mins = round((time.time() - proc_start_time) / 60, 1)
+    print(
+        f"\n{row_count} rows compared in {elapsed_mins} minutes, {diff_count} differ"
+        + (f", {bad_json_count} not valid JSON" if bad_json_count else "")
+    )
+    for key, count in key_counts.most_common():
+        uids = ", ".join(str(uid) for uid in key_examples[key])
+        print(f"  {key}: {count} records, uid {uids}")
+    if args.diff_file and diff_records:
+        print(f"\n{len(diff_records)} differing records written to {args.diff_file}")
+    print()
+
+    sys.exit(1 if diff_count else 0)
@@ -0,0 +1,523 @@
+#! /usr/bin/env python3
+import argparse
+import json
+import os
+import platform
+import random
+import shlex
+import statistics
+import string
+import subprocess
+import sys
+import tempfile
+import time
+
+from golden_compare import construct_mapper, extract_revision, load_mapper_module
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+MAPPER_DIR = os.path.join(BENCHMARK_DIR, "..", "src")
+MAPPER_MODULE = "rzolut_mapper"
+MAPPER_FILE = os.path.join(MAPPER_DIR, MAPPER_MODULE + ".py")
+SAMPLE_FILE = os.path.join(BENCHMARK_DIR, "..", "sample", "input.jsonl")
+DATA_SOURCE = "BENCHMARK"
+
+# --column prefixes of the parallel lists that make up one repeated entry, an
+# --alias is alias_name[i] with alias_type[i], alias_script[i] and so on
+LIST_FAMILIES = {
+    "aliases": ("alias_",),
+    "addresses": ("address_",),
+    "positions": ("position", "pep_type", "pep_level"),
+    "sources": ("source_type", "source_description", "external_sources"),
+    "identifiers": ("identifier_",),
+    "relationships": ("association_",),
+    "sanctions": ("sanctions_", "sanction_"),
+    "watchlists": ("watchlists_",),
+    "enforcement": ("enforcement_", "fine_"),
+    "litigation": ("litigation_",),
+    "others": ("others_",),
+    "apc": ("apc_",),
+}
+
+# --average entries per record, the count of each record is drawn around it so
+# --most records are small and a few are large, like the production feeds
+SHAPES = {
+    "typical": {
+        "aliases": 3,
+        "addresses": 2,
+        "positions": 3,
+        "sources": 5,
+        "identifiers": 2,
+        "relationships": 3,
+        "sanctions": 1,
+        "watchlists": 1,
+        "enforcement": 1,
+        "litigation": 1,
+        "others": 1,
+        "apc": 2,
+    },
+    "many_aliases": {"aliases": 100},
+    "many_sanctions": {"sanctions": 60, "watchlists": 20},
+    "heavy_apc": {"apc": 60},
+    "minimal": {family: 0 for family in LIST_FAMILIES},
+}
+
+# --flags set on a record when its family has entries, so the mapping sees the
+# --same combinations the real data has
+FAMILY_FLAGS = {
+    "sanctions": "is_sanction",
+    "watchlists": "is_watchlist",
+    "enforcement": "is_enforcement",
+    "apc": "is_apc",
+}
+
+# --words per value of the free text columns, everything else is a short value
+TEXT_COLUMNS = {
+    "apc_article_text": 180,
+    "apc_summary": 60,
+    "apc_summary_lede": 25,
+    "apc_event_chronology": 40,
+    "apc_network_map": 30,
+    "apc_heading": 10,
+    "source_description": 20,
+    "sanctions_additional_information": 30,
+    "watchlists_additional_information": 30,
+    "enforcement_profile_summary": 40,
+    "enforcement_reasoning_for_legal_actions": 25,
+    "others_event_summary": 30,
+}
+
+WORDS = (
+    "authority board bank capital company council court director enforcement "
+    "finance fund government group holding investment justice limited market "
+    "minister ministry national office order party police port public regional "
+    "republic report sanction security service shipping state trade trust union "
+    "alleged announced approved charged confirmed filed issued named ordered "
+    "reported signed under against after before during within between"
+).split()
+FIRST_NAMES = ["Ana", "Carlos", "Fernando", "Maria", "Olga", "Ivan", "Li", "Amir"]
+LAST_NAMES = ["Santos", "Silva", "Petrov", "Chen", "Haddad", "Kowalski", "Okafor"]
+ORG_SUFFIXES = ["Holdings Ltd", "Trading LLC", "Shipping SA", "Capital AG", "Bank"]
+# --share of identifiers whose type the mapper does not know, they take the
+# --other identifier path
+UNKNOWN_IDENTIFIER_SHARE = 0.1
+COUNTRIES = [
+    ("Angola", "AGO"),
+    ("Brazil", "BRA"),
+    ("China", "CHN"),
+    ("Germany", "DEU"),
+    ("Nigeria", "NGA"),
+    ("Russia", "RUS"),
+    ("United Arab Emirates", "ARE"),
+]
+
+
+# ----------------------------------------
+def synthetic_value(column, rng, identifier_types):
+    if column.endswith("_year"):
+        return rng.randint(1950, 2025)
+    if column.endswith("_month"):
+        return rng.randint(1, 12)
+    if column.endswith(("_date", "_day")):
+        return rng.randint(1, 28)
+    if "country_code" in column:
+        return rng.choice(COUNTRIES)[1]
+    if "country" in column:
+        return rng.choice(COUNTRIES)[0]
+    if column.endswith("uid"):
+        return str(rng.randint(10**14, 10**15))
+    if column.endswith("subject_type"):
+        return rng.choice(["Individual", "Organisation"])
+    if column in ("alias_name", "association_name") or "individual_name" in column:
+        return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    if "link" in column or column == "external_sources":
+        return f"https://news.example.com/{rng.randint(1, 10**9)}"
+    if column == "identifier_name":
+        if rng.random() < UNKNOWN_IDENTIFIER_SHARE:
+            return f"{rng.choice(WORDS).upper()} NUMBER"
+        return rng.choice(identifier_types)
+    if column == "identifier_value":
+        # --letters and digits, some with the leading zeros the mapper strips
+        prefix = "".join(rng.choices(string.ascii_uppercase, k=rng.randint(0, 3)))
+        return prefix + str(rng.randint(0, 10**9)).zfill(rng.randint(6, 12))
+    word_count = TEXT_COLUMNS.get(column) or rng.randint(1, 4)
+    return " ".join(rng.choices(WORDS, k=word_count))
+
+
+# ----------------------------------------
+def family_columns(template):
+    columns = {family: [] for family in LIST_FAMILIES}
+    for column, value in template.items():
+        for family, prefixes in LIST_FAMILIES.items():
+            if column.startswith(prefixes) and isinstance(value, list):
+                columns[family].append(column)
+                break
+    return columns
+
+
+# ----------------------------------------
+def synthesize_record(
+    template, columns, shape, organization_share, row_num, rng, identifier_types
+):
+    record = dict(template)
+    record["id"] = row_num
+    record["uid"] = 900000000000000 + row_num
+    record["merged_uids"] = [record["uid"]]
+    if rng.random() < organization_share:
+        record["subject_type"] = "Organisation"
+        record["name"] = f"{rng.choice(LAST_NAMES)} {rng.choice(ORG_SUFFIXES)}"
+        record["first_name"] = record["middle_name"] = record["last_name"] = None
+        record["gender"] = None
+    else:
+        record["subject_type"] = "Individual"
+        record["first_name"] = rng.choice(FIRST_NAMES)
+        record["last_name"] = rng.choice(LAST_NAMES)
+
+    for family, column_names in columns.items():
+        average = shape.get(family, SHAPES["typical"][family])
+        count = round(rng.expovariate(1 / average)) if average else 0
+        for column in column_names:
+            record[column] = [
+                synthetic_value(column, rng, identifier_types) for _ in range(count)
+            ]
+        if family in FAMILY_FLAGS:
+            record[FAMILY_FLAGS[family]] = count > 0
+    return record
+
+
+# ----------------------------------------
+def write_synthetic_file(file_name, record_count, shape, organization_share, seed):
+    with open(SAMPLE_FILE) as file_handle:
+        template = json.loads(file_handle.readline())
+    columns = family_columns(template)
+
+    # --identifier types the mapper knows, so identifiers take the mapped paths
+    identifier_types = list(
+        load_mapper_module(MAPPER_MODULE, MAPPER_FILE).IDENTIFIER_TYPES
+    )
+    rng = random.Random(seed)
+    with open(file_name, "w") as file_handle:
+        for row_num in range(1, record_count + 1):
+            record = synthesize_record(
+                template,
+                columns,
+                shape,
+                organization_share,
+                row_num,
+                rng,
+                identifier_types,
+            )
+            file_handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+# ----------------------------------------
+def measure_map(input_file, mapper_file):
+
+    # --runs in its own interpreter, only the map() calls are timed and the
+    # --records are read one at a time so the peak RSS is the mapper's own
+    module = load_mapper_module(MAPPER_MODULE, mapper_file)
+    mapper_obj = construct_mapper(module, DATA_SOURCE, {})
+    map_seconds = 0.0
+    record_count = 0
+    with open(input_file, "rb") as file_handle:
+        for line in file_handle:
+            input_row = json.loads(line)
+            start_time = time.perf_counter()
+            mapper_obj.map(input_row)
+            map_seconds += time.perf_counter() - start_time
+            record_count += 1
+    print(json.dumps({"seconds": map_seconds, "records": record_count}))
+
+
+# ----------------------------------------
+def run_child(command):
+
+    # --wait4 hands back the resource usage of just this child
+    start_time = time.perf_counter()
+    process = subprocess.Popen(
+        command, cwd=MAPPER_DIR, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    output = process.stdout.read()
+    _, status, rusage = os.wait4(process.pid, 0)
+    wall_seconds = time.perf_counter() - start_time
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command)
+
+    # --linux reports kilobytes, macos bytes
+    peak_rss_mb = rusage.ru_maxrss / (1048576 if sys.platform == "darwin" else 1024)
+    return output, wall_seconds, peak_rss_mb
+
+
+# ----------------------------------------
+def summarize(seconds_runs, rss_runs, record_count, input_bytes):
+    seconds = statistics.median(seconds_runs)
+    return {
+        "seconds": round(seconds, 3),
+        "records_per_sec": round(record_count / seconds, 1),
+        "mb_per_sec": round(input_bytes / 1048576 / seconds, 2),
+        "peak_rss_mb": round(max(rss_runs), 1),
+    }
+
+
+# ----------------------------------------
+def benchmark_map(
+    python, mapper_file, input_file, runs, record_count, input_bytes
+):
+    seconds_runs, rss_runs = [], []
+    for _ in range(runs):
+        output, _, peak_rss_mb = run_child(
+            [
+                python,
+                os.path.abspath(__file__),
+                "--measure_map",
+                input_file,
+                "--mapper",
+                mapper_file,
+            ]
+        )
+        seconds_runs.append(json.loads(output)["seconds"])
+        rss_runs.append(peak_rss_mb)
+    return summarize(seconds_runs, rss_runs, record_count, input_bytes)
+
+
+# ----------------------------------------
+def benchmark_cli(
+    python, mapper_file, input_file, runs, record_count, input_bytes, cli_args
+):
+    seconds_runs, rss_runs = [], []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_file = os.path.join(temp_dir, "output.json")
+        for _ in range(runs):
+            _, wall_seconds, peak_rss_mb = run_child(
+                [
+                    python,
+                    mapper_file,
+                    "-i",
+                    input_file,
+                    "-o",
+                    output_file,
+                    "-d",
+                    DATA_SOURCE,
+                ]
+                + cli_args
+            )
+            seconds_runs.append(wall_seconds)
+            rss_runs.append(peak_rss_mb)
+    return summarize(seconds_runs, rss_runs, record_count, input_bytes)
+
+
+# ----------------------------------------
+def git_revision():
+    try:
+        result = subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=BENCHMARK_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+# ----------------------------------------
+def print_comparison(results, baseline):
+
+    # --higher is better for the rates, lower for the rest
+    print(f"\ncompared to {baseline.get('revision')}:")
+    for benchmark_name, metrics in results["benchmarks"].items():
+        baseline_metrics = baseline.get("benchmarks", {}).get(benchmark_name, {})
+        for metric, value in metrics.items():
+            baseline_value = baseline_metrics.get(metric)
+            if not baseline_value:
+                continue
+            change = (value - baseline_value) / baseline_value * 100
+            better = change > 0 if metric.endswith("_per_sec") else change < 0
+            print(
+                f"  {benchmark_name:4} {metric:16} {baseline_value:>10} -> {value:>10}"
+                f" {change:+7.1f}% {'better' if better and change else ''}"
+            )
+
+
+# ----------------------------------------
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--measure_map", dest="measure_map", help=argparse.SUPPRESS)
+    parser.add_argument(
+        "--records",
+        dest="records",
+        type=int,
+        default=5000,
+        help="number of synthetic records (default 5000)",
+    )
+    parser.add_argument(
+        "--shape",
+        dest="shape",
+        default="typical",
+        choices=sorted(SHAPES),
+        help="record shape, the average number of aliases, articles, sanctions, ... (default typical)",
+    )
+    parser.add_argument(
+        "--organization_share",
+        "--organization-share",
+        dest="organization_share",
+        type=float,
+        default=0.5,
+        help="fraction of organization records, the rest are persons (default 0.5)",
+    )
+    parser.add_argument(
+        "--seed",
+        dest="seed",
+        type=int,
+        default=1,
+        help="random seed, the same seed gives the same records (default 1)",
+    )
+    parser.add_argument(
+        "-i",
+        "--input_file",
+        dest="input_file",
+        help="benchmark an existing input file instead of synthetic records",
+    )
+    parser.add_argument(
+        "--write_input",
+        "--write-input",
+        dest="write_input",
+        help="keep the synthetic records in this file",
+    )
+    parser.add_argument(
+        "--runs", dest="runs", type=int, default=3, help="number of runs (default 3)"
+    )
+    parser.add_argument(
+        "--skip",
+        dest="skip",
+        choices=["map", "cli"],
+        help="leave out the map() or the end to end benchmark",
+    )
+    parser.add_argument(
+        "--cli_args",
+        "--cli-args",
+        dest="cli_args",
+        default="",
+        help='extra mapper options for the end to end run, e.g. "-w 4 --no_stats"',
+    )
+    parser.add_argument(
+        "-o",
+        "--output_file",
+        dest="output_file",
+        help="write the results as JSON to this file",
+    )
+    parser.add_argument(
+        "--compare",
+        dest="compare",
+        help="results file of an earlier run to compare against",
+    )
+    parser.add_argument(
+        "--mapper",
+        dest="mapper",
+        default=MAPPER_FILE,
+        help="mapper script to measure (default the working tree src/rzolut_mapper.py)",
+    )
+    parser.add_argument(
+        "--mapper_rev",
+        "--mapper-rev",
+        dest="mapper_rev",
+        help="git revision whose mapper is measured, instead of --mapper",
+    )
+    parser.add_argument(
+        "--python",
+        dest="python",
+        default=sys.executable,
+        help="python interpreter to measure (default the current one)",
+    )
+    args = parser.parse_args()
+
+    if args.measure_map:
+        measure_map(args.measure_map, args.mapper)
+        sys.exit(0)
+
+    if args.runs < 1 or args.records < 1:
+        print("\nPlease supply a positive number of runs and records\n")
+        sys.exit(1)
+    if not 0 <= args.organization_share <= 1:
+        print("\nThe organization share must be between 0 and 1\n")
+        sys.exit(1)
+
+    temp_dir = tempfile.TemporaryDirectory()
+    mapper_file = os.path.abspath(args.mapper)
+    revision = git_revision() if args.mapper == MAPPER_FILE else args.mapper
+    if args.mapper_rev:
+        try:
+            mapper_file = extract_revision(args.mapper_rev, temp_dir.name)
+        except subprocess.CalledProcessError:
+            print(f"\nCould not read the mapper at {args.mapper_rev}\n")
+            sys.exit(1)
+        revision = args.mapper_rev
+
+    input_file = args.input_file
+    if not input_file:
+        input_file = args.write_input
+        if not input_file:
+            input_file = os.path.join(temp_dir.name, "input.jsonl")
+        print(f"writing {args.records} {args.shape} records ...")
+        write_synthetic_file(
+            input_file,
+            args.records,
+            SHAPES[args.shape],
+            args.organization_share,
+            args.seed,
+        )
+    input_file = os.path.abspath(input_file)
+    input_bytes = os.path.getsize(input_file)
+    with open(input_file, "rb") as file_handle:
+        record_count = sum(1 for _ in file_handle)
+
+    results = {
+        "revision": revision,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "input_file": args.input_file,
+        "shape": None if args.input_file else args.shape,
+        "seed": None if args.input_file else args.seed,
+        "organization_share": None if args.input_file else args.organization_share,
+        "records": record_count,
+        "input_mb": round(input_bytes / 1048576, 2),
+        "runs": args.runs,
+        "cli_args": args.cli_args,
+        "benchmarks": {},
+    }
+    if args.skip != "map":
+        print(f"timing map() over {record_count} records ...")
+        results["benchmarks"]["map"] = benchmark_map(
+            args.python, mapper_file, input_file, args.runs, record_count, input_bytes
+        )
+    if args.skip != "cli":
+        print(f"timing {MAPPER_MODULE}.py over {record_count} records ...")
+        results["benchmarks"]["cli"] = benchmark_cli(
+            args.python,
+            mapper_file,
+            input_file,
+            args.runs,
+            record_count,
+            input_bytes,
+            shlex.split(args.cli_args),
+        )
+    temp_dir.cleanup()
+
+    print(f"\n{record_count} records, {results['input_mb']} MB, median of {args.runs} runs")
+    for benchmark_name, metrics in results["benchmarks"].items():
+        print(
+            f"  {benchmark_name:4} {metrics['records_per_sec']:10.1f} records/sec"
+            f" {metrics['mb_per_sec']:8.2f} MB/sec {metrics['peak_rss_mb']:8.1f} MB peak RSS"
+        )
+
+    if args.output_file:
+        with open(args.output_file, "w") as file_handle:
+            json.dump(results, file_handle, indent=4)
+        print(f"\nresults written to {args.output_file}")
+
+    if args.compare:
+        with open(args.compare) as file_handle:
+            print_comparison(results, json.load(file_handle))
+    print()
@@ -0,0 +1,131 @@
+#! /usr/bin/env python3
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+MAPPER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+MAPPER_MODULE = "rzolut_mapper"
+
+# --modules that must never be loaded just by starting the mapper, they are only
+# --imported by the features that need them
+FORBIDDEN_MODULES = [
+    "pandas",
+    "dateutil",
+    "csv",
+    "ast",
+    "asyncio",
+    "sqlite3",
+    "shutil",
+    "concurrent.futures",
+    "multiprocessing",
+]
+
+
+# ----------------------------------------
+def measure_import(python):
+
+    # --one fresh interpreter per run, parsed from python -X importtime output:
+    # --"import time: self [us] | cumulative | imported package"
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {MAPPER_MODULE}"],
+        cwd=MAPPER_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    import_times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, module_name = line[len("import time:") :].split("|")
+        import_times[module_name.strip()] = (int(self_us), int(cumulative_us))
+    return import_times
+
+
+# ----------------------------------------
+def measure_cli(python):
+    start_time = time.perf_counter()
+    subprocess.run(
+        [python, MAPPER_MODULE + ".py", "--help"],
+        cwd=MAPPER_DIR,
+        capture_output=True,
+        check=True,
+    )
+    return time.perf_counter() - start_time
+
+
+# ----------------------------------------
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--runs", dest="runs", type=int, default=10, help="number of runs (default 10)"
+    )
+    parser.add_argument(
+        "--max_ms",
+        dest="max_ms",
+        type=float,
+        default=150.0,
+        help="fail when the median import time exceeds this many milliseconds (default 150)",
+    )
+    parser.add_argument(
+        "--top",
+        dest="top",
+        type=int,
+        default=10,
+        help="number of slowest imports to list (default 10)",
+    )
+    parser.add_argument(
+        "--python",
+        dest="python",
+        default=sys.executable,
+        help="python interpreter to measure (default the current one)",
+    )
+    args = parser.parse_args()
+
+    if args.runs < 1:
+        print("\nPlease supply a positive number of runs\n")
+        sys.exit(1)
+
+    # --the first run also warms the bytecode cache and is not counted
+    measure_import(args.python)
+    import_runs = []
+    cli_runs = []
+    for _ in range(args.runs):
+        import_times = measure_import(args.python)
+        import_runs.append(import_times[MAPPER_MODULE][1] / 1000)
+        cli_runs.append(measure_cli(args.python) * 1000)
+
+    import_ms = statistics.median(import_runs)
+    cli_ms = statistics.median(cli_runs)
+    print(f"\nimport {MAPPER_MODULE}: {import_ms:.1f} ms median of {args.runs} runs")
+    print(f"{MAPPER_MODULE}.py --help: {cli_ms:.1f} ms median wall time\n")
+
+    print("slowest imports (self time):")
+    for module_name, (self_us, cumulative_us) in sorted(
+        import_times.items(), key=lambda item: item[1][0], reverse=True
+    )[: args.top]:
+        print(f"  {self_us / 1000:8.1f} ms {cumulative_us / 1000:8.1f} ms  {module_name}")
+
+    failed = False
+    loaded_modules = [
+        module_name
+        for module_name in FORBIDDEN_MODULES
+        if any(
+            imported == module_name or imported.startswith(module_name + ".")
+            for imported in import_times
+        )
+    ]
+    if loaded_modules:
+        print(f"\nFAIL: imported at startup: {', '.join(loaded_modules)}")
+        failed = True
+    if import_ms > args.max_ms:
+        print(f"\nFAIL: import time {import_ms:.1f} ms is over {args.max_ms} ms")
+        failed = True
+    if not failed:
+        print(f"\nOK: import time is within {args.max_ms} ms\n")
+
+    sys.exit(1 if failed else 0)
@@ -1,1759 +1,2014 @@
 #! /usr/bin/env python3
 import argparse
-import ast
-import csv
+import bz2
+import collections
+import gzip
 import hashlib
+import io
 import json
+import lzma
+import math
+import mmap
 import os
 import random
 import signal
 import sys
 import time
 from datetime import datetime
+from functools import lru_cache
 from itertools import zip_longest
 
-import pandas as pd
-from dateutil.parser import parse as dateparse
+# --heavier modules (asyncio, concurrent.futures, sqlite3, shutil, dateutil) are
+# --imported where they are used so short runs and pool workers start fast
+
+# --optional fast json decoders, in order of preference for --json_backend auto
+JSON_BACKENDS = ["orjson", "simdjson", "ujson", "json"]
+
+# --mapper options and their defaults, see mapper_options() for the command line
+MAPPER_OPTIONS = {
+    "reference_file": None,
+    "json_backend": "auto",
+    "stats_sample_rate": 1.0,
+    "collect_stats": True,
+    "payload_store": None,
+    "include_groups": None,
+    "exclude_groups": None,
+    "fingerprint_algorithm": "auto",
+    "fingerprint_groups": None,
+    "time_groups": False,
+    "max_features": None,
+    "max_feature_bytes": None,
+}
+
+# --record fingerprint algorithms, fastest first
+FINGERPRINT_ALGORITHMS = ["xxhash", "blake2b", "md5"]
+
+# --top level attributes left out of a --fingerprint_groups hash, the source
+# --bumps them on any edit, also one in a group that does not count as a change
+FINGERPRINT_VOLATILE_ATTRIBUTES = {"CREATED_AT", "UPDATED_AT"}
+
+# --compressed files are recognised by their magic bytes or their extension
+COMPRESSION_MAGIC = {
+    b"\x1f\x8b": "gzip",
+    b"BZh": "bz2",
+    b"\x28\xb5\x2f\xfd": "zstd",
+    b"\xfd7zXZ\x00": "xz",
+}
+COMPRESSION_EXTENSIONS = {
+    ".gz": "gzip",
+    ".gzip": "gzip",
+    ".bz2": "bz2",
+    ".zst": "zstd",
+    ".zstd": "zstd",
+    ".xz": "xz",
+}
+COMPRESSION_DEFAULT_LEVELS = {"gzip": 6, "bz2": 9, "zstd": 3, "xz": 6}
+
+# --short strings (countries, scripts, languages, pep types ...) repeat millions
+# --of times, so their normalized form is kept in a bounded lru cache
+NORMALIZE_CACHE_MAX_LENGTH = 64
+NORMALIZE_CACHE_SIZE = 65536
+
+# --payload hashes remembered per process to skip re-sending shared payloads,
+# --older ones are forgotten and deduplicated by the store's INSERT OR IGNORE
+PAYLOAD_SEEN_SIZE = 65536
 
 
 # =========================
-class mapper:
+class json_codec:
 
     # ----------------------------------------
-    def __init__(self):
+    def __init__(self, backend="auto"):
 
-        self.load_reference_data()
-        self.stat_pack = {}
+        candidates = JSON_BACKENDS if backend == "auto" else [backend]
+        for candidate in candidates:
+            try:
+                module = __import__(candidate)
+            except ImportError:
+                continue
+            self.backend = candidate
+            self.fast_loads = module.loads
+            break
+        else:
+            raise ImportError(f"json backend {backend} is not installed")
 
-    # ----------------------------------------
-    def map(self, raw_data, input_row_num=None):
-        json_data = {}
+        # --output always goes through the stdlib C encoder, none of the fast
+        # --encoders can reproduce its default separators and ascii escaping
+        # --byte for byte, and downstream loads depend on that exact output
+        self.encode = json.JSONEncoder(check_circular=False).encode
+        if self.backend == "json":
+            self.loads = json.loads
 
-        # Clean the raw data values using the clean_value method
-        for attribute in raw_data:
-            raw_data[attribute] = self.clean_value(raw_data[attribute])
+        # --orjson decodes straight out of a memoryview, the others want bytes
+        self.accepts_memoryview = self.backend == "orjson"
 
-        json_data["FEATURES"] = (
-            []
-        )  # Initialize the FEATURES list to hold additional attributes
+    # ----------------------------------------
+    def loads(self, data):
+        try:
+            return self.fast_loads(data)
+        except ValueError:
+            # --the stdlib is more lenient (NaN, huge ints, lone surrogates)
+            # --and raises the json.JSONDecodeError the caller reports
+            if data.__class__ is memoryview:
+                data = data.tobytes()
+            return json.loads(data)
 
-        # Set essential fields for the JSON data
-        json_data["RECORD_ID"] = raw_data["uid"]  # Unique identifier for the record
-        json_data["DATA_SOURCE"] = args.data_source  # Source of the data
+    # ----------------------------------------
+    def dumps(self, json_data):
+        return (self.encode(json_data) + "\n").encode("ascii")
+
+
+# --feature groups in the order their FEATURES are emitted by mapper.map()
+# --  value:  append {feature: value} when the cleaned attribute is not empty
+# --  list:   append {feature: item} for each non-empty item of a list attribute
+# --  split:  append {feature: item} for each non-empty item of a "|" delimited string
+# --  date:   compose year, month and day lists into one date feature per entry
+# --  zip:    walk parallel list attributes and append one feature per entry
+# --  fields: append one feature built from scalar attributes
+# --  method: hand written mapping for groups with extra logic, "features" lists
+# --          the feature keys it can emit
+# --a zip group may also list "payloads": large text keys that are written once to
+# --the payload store and replaced by a <key>_REF hash when --payload_store is used
+FEATURE_GROUPS = [
+    {"group": "gender", "kind": "value", "feature": "GENDER", "column": "gender"},
+    {"group": "image", "kind": "value", "feature": "image_url", "column": "image_url"},
+    {
+        "group": "dates",
+        "kind": "date",
+        "feature": "DATE_OF_BIRTH",
+        "columns": ["date_of_birth_year", "date_of_birth_month", "date_of_birth_date"],
+    },
+    {
+        "group": "dates",
+        "kind": "date",
+        "feature": "DATE_OF_DEATH",
+        "columns": ["date_of_death_year", "date_of_death_month", "date_of_death_date"],
+        "required": "deceased_status",
+    },
+    {
+        "group": "addresses",
+        "kind": "zip",
+        "fields": [
+            ("ADDR_TYPE", "address_type"),
+            ("ADDR_LINE1", "address_street"),
+            ("ADDR_LINE2", "address_country"),
+            ("ADDR_CITY", "address_city"),
+            ("ADDR_STATE", "address_province"),
+            ("ADDR_POSTAL_CODE", "address_postal_code"),
+            ("ADDR_COUNTRY", "address_country_code"),
+        ],
+    },
+    {
+        "group": "positions",
+        "kind": "list",
+        "feature": "GROUP_ASSOCIATION_ORG_NAME",
+        "column": "organization_name",
+    },
+    {
+        "group": "positions",
+        "kind": "zip",
+        "fields": [
+            ("pep_types", "pep_type"),
+            ("pep_level", "pep_level"),
+            ("position", "position"),
+            ("position_organization", "organization_name"),
+            ("position_start_year", "position_start_date_year"),
+            ("position_start_month", "position_start_date_month"),
+            ("position_start_date", "position_start_date_date"),
+            ("position_end_year", "position_end_date_year"),
+            ("position_end_month", "position_end_date_month"),
+            ("position_end_date", "position_end_date_date"),
+        ],
+    },
+    {
+        "group": "aliases",
+        "kind": "method",
+        "method": "map_aliases",
+        "features": [
+            "ALIAS_NAME_FULL",
+            "ALIAS_NAME_ORG",
+            "ALIAS_TYPE",
+            "ALIAS_SCRIPT",
+            "ALIAS_LANGUAGE",
+        ],
+    },
+    {
+        "group": "relationships",
+        "kind": "method",
+        "method": "map_relationships",
+        "features": [
+            "RELATIONSHIP_SUBJECT_TYPE",
+            "RELATIONSHIP_NAME",
+            "RELATIONSHIP_TYPE",
+            "RELATIONSHIP_TYPE_DESCRIPTION",
+            "RELATIONSHIP_UID",
+            "REL_POINTER_KEY",
+            "REL_ANCHOR_DOMAIN",
+            "REL_ANCHOR_KEY",
+            "REL_POINTER_ROLE",
+        ],
+    },
+    {
+        "group": "pep_countries",
+        "kind": "zip",
+        "fields": [
+            ("PEP_COUNTRY", "pep_country"),
+            ("PEP_COUNTRY_CODE", "pep_country_code"),
+        ],
+    },
+    {
+        "group": "sources",
+        "kind": "zip",
+        "fields": [
+            ("SOURCE_TYPE", "source_type"),
+            ("SOURCE", "external_sources"),
+            ("SOURCE_DESCRIPTION", "source_description"),
+        ],
+    },
+    {
+        "group": "citizenship",
+        "kind": "zip",
+        "fields": [
+            ("CITIZENSHIP", "citizenship"),
+            ("CITIZENSHIP_COUNTRY_CODE", "citizenship_country_code"),
+        ],
+    },
+    {
+        "group": "nationality",
+        "kind": "zip",
+        "fields": [
+            ("NATIONALITY", "nationality_country"),
+            ("NATIONALITY_COUNTRY_CODE", "nationality_country_code"),
+        ],
+    },
+    {"group": "identifiers", "kind": "method", "method": "map_identifiers"},
+    {
+        "group": "vessel",
+        "kind": "zip",
+        "fields": [
+            ("VESSEL_TYPE", "vessel_type"),
+            ("VESSEL_CURRENT_COUNTRY", "current_country_flag"),
+            ("VESSEL_FORMER_COUNTRY", "former_country_flag"),
+        ],
+    },
+    {
+        "group": "aircraft",
+        "kind": "zip",
+        "fields": [
+            ("AIRCRAFT_MANUFACTURE_DATE", "aircraft_manufacture_date_date"),
+            ("AIRCRAFT_MANUFACTURE_MONTH", "aircraft_manufacture_date_month"),
+            ("AIRCRAFT_MANUFACTURE_YEAR", "aircraft_manufacture_date_year"),
+            ("AIRCRAFT_MODEL", "aircraft_model"),
+        ],
+    },
+    {
+        "group": "dates",
+        "kind": "date",
+        "feature": "REGISTRATION_DATE",
+        "columns": [
+            "date_of_incorporation_year",
+            "date_of_incorporation_month",
+            "date_of_incorporation_date",
+        ],
+    },
+    {
+        "group": "registration",
+        "kind": "list",
+        "feature": "REGISTRATION_COUNTRY",
+        "column": "country_code_of_incorporation",
+    },
+    {
+        "group": "registration",
+        "kind": "list",
+        "feature": "COUNTRY",
+        "column": "country_code_of_origin",
+    },
+    {
+        "group": "ownership",
+        "kind": "list",
+        "feature": "OWNERSHIP_DETAILS",
+        "column": "association_percentage_of_shareholding",
+    },
+    {"group": "physical", "kind": "list", "feature": "AGE_BRACKET", "column": "age"},
+    {
+        "group": "contacts",
+        "kind": "list",
+        "feature": "PHONE_NUMBER",
+        "column": "contact_number",
+    },
+    {
+        "group": "contacts",
+        "kind": "list",
+        "feature": "EMAIL_ADDRESS",
+        "column": "email_id",
+    },
+    {
+        "group": "contacts",
+        "kind": "list",
+        "feature": "WEBSITE_ADDRESS",
+        "column": "website",
+    },
+    {
+        "group": "physical",
+        "kind": "list",
+        "feature": "COLOR_HAIR",
+        "column": "color_of_hair",
+    },
+    {
+        "group": "physical",
+        "kind": "list",
+        "feature": "COLOR_EYES",
+        "column": "color_of_eyes",
+    },
+    {"group": "physical", "kind": "list", "feature": "HEIGHT", "column": "height"},
+    {"group": "physical", "kind": "list", "feature": "WEIGHT", "column": "weight"},
+    {
+        "group": "physical",
+        "kind": "list",
+        "feature": "DISTINGUISHING_MARKS",
+        "column": "distinguishing_marks_and_characteristics",
+    },
+    {
+        "group": "profile",
+        "kind": "list",
+        "feature": "PROFILE_SUMMARY",
+        "column": "profile_summary",
+    },
+    {
+        "group": "ownership",
+        "kind": "split",
+        "feature": "OWNERSHIP_DETAILS",
+        "column": "ownership_details",
+    },
+    {"group": "profile", "kind": "split", "feature": "REMARKS", "column": "remarks"},
+    {
+        "group": "countries",
+        "kind": "list",
+        "feature": "SUBJECT_COUNTRY",
+        "column": "subject_country",
+    },
+    {
+        "group": "names",
+        "kind": "value",
+        "feature": "OFFICIAL_NAME",
+        "column": "official_name",
+    },
+    {
+        "group": "names",
+        "kind": "value",
+        "feature": "OFFICIAL_NAME_IN_LOCAL_LANGUAGE",
+        "column": "official_name_in_local_language",
+    },
+    {"group": "codes", "kind": "value", "feature": "ISO_CODE", "column": "iso_code"},
+    {
+        "group": "names",
+        "kind": "list",
+        "feature": "ABBREVIATED_NAME",
+        "column": "abbreviated_name",
+    },
+    {
+        "group": "codes",
+        "kind": "list",
+        "feature": "OFFICIAL_LANGUAGE",
+        "column": "official_language",
+    },
+    {"group": "codes", "kind": "value", "feature": "UN_LO_CODE", "column": "un_locode"},
+    {"group": "codes", "kind": "value", "feature": "IATA_CODE", "column": "iata_code"},
+    {
+        "group": "codes",
+        "kind": "value",
+        "feature": "INTERNATIONAL_CALLING_CODE",
+        "column": "international_calling_code",
+    },
+    {
+        "group": "contacts",
+        "kind": "list",
+        "feature": "FAX_NUMBER",
+        "column": "fax_number",
+    },
+    {
+        "group": "status",
+        "kind": "split",
+        "feature": "STATUS_PEP",
+        "column": "pep_status",
+    },
+    {
+        "group": "remarks",
+        "kind": "list",
+        "feature": "PEP_REMARKS",
+        "column": "pep_remarks",
+    },
+    {
+        "group": "remarks",
+        "kind": "list",
+        "feature": "SANCTION_REMARKS",
+        "column": "sanctions_remarks",
+    },
+    {
+        "group": "remarks",
+        "kind": "list",
+        "feature": "WATCHLIST_REMARKS",
+        "column": "watchlists_remarks",
+    },
+    {
+        "group": "remarks",
+        "kind": "list",
+        "feature": "ENFORCEMENT_REMARKS",
+        "column": "enforcement_remarks",
+    },
+    {
+        "group": "remarks",
+        "kind": "list",
+        "feature": "APC_REMARKS",
+        "column": "apc_remarks",
+    },
+    {
+        "group": "status",
+        "kind": "value",
+        "feature": "STATUS_SANCTION",
+        "column": "sanctions_status",
+    },
+    {
+        "group": "status",
+        "kind": "value",
+        "feature": "STATUS_WATCHLIST",
+        "column": "watchlists_status",
+    },
+    {
+        "group": "status",
+        "kind": "value",
+        "feature": "STATUS_APC",
+        "column": "apc_status",
+    },
+    {
+        "group": "status",
+        "kind": "value",
+        "feature": "STATUS_ENFORCEMENT",
+        "column": "enforcement_status",
+    },
+    {
+        "group": "status",
+        "kind": "value",
+        "feature": "CHANGE_CATEGORY",
+        "column": "update_category",
+    },
+    {
+        "group": "sanctions",
+        "kind": "zip",
+        "fields": [
+            ("SANCTION_AUTHORITY", "sanctions_authority"),
+            ("SANCTION_AUTHORITY_COUNTRY", "sanctions_authority_country"),
+            ("SANCTION_ACTION_DATE_DATE", "sanctions_action_date_date"),
+            ("SANCTION_ACTION_DATE_MONTH", "sanctions_action_date_month"),
+            ("SANCTION_ACTION_DATE_YEAR", "sanctions_action_date_year"),
+            ("SANCTION_CHANGE_DATE_DATE", "sanctions_change_date_date"),
+            ("SANCTION_CHANGE_DATE_MONTH", "sanctions_change_date_month"),
+            ("SANCTION_CHANGE_DATE_YEAR", "sanctions_change_date_year"),
+            ("SANCTION_END_DATE_DATE", "sanctions_end_date_date"),
+            ("SANCTION_END_DATE_MONTH", "sanctions_end_date_month"),
+            ("SANCTION_END_DATE_YEAR", "sanctions_end_date_year"),
+            ("SANCTION_LEGAL_ACTION_TYPE", "sanctions_legal_action_type"),
+            ("SANCTION_ORDER_NUMBER", "sanctions_order_number"),
+            ("SANCTION_PROGRAMME_NAME", "sanctions_programme_name"),
+            ("SANCTION_PROGRAMME_COUNTRY", "sanctions_programme_country"),
+            ("SANCTION_PROGRAMME_COUNTRY_CODE", "sanctions_programme_country_code"),
+            ("SANCTION_AUTHORITY_ID", "sanction_authority_id"),
+            ("SANCTION_LIST_NAME", "sanctions_list_name"),
+        ],
+    },
+    {
+        "group": "associates",
+        "kind": "zip",
+        "fields": [
+            ("ASSOCIATED_INDIVIDUAL_NAME", "association_associated_individual_name"),
+            (
+                "ASSOCIATED_INDIVIDUAL_POSITION",
+                "association_associated_individual_position",
+            ),
+            ("ASSOCIATED_ENTITIES_NAME", "association_associated_entities_name"),
+        ],
+    },
+    {
+        "group": "restrictions",
+        "kind": "list",
+        "feature": "RESTRICTIONS",
+        "column": "restrictions",
+    },
+    {
+        "group": "watchlist",
+        "kind": "zip",
+        "fields": [
+            ("WATCHLIST_AUTHORITY", "watchlists_authority"),
+            ("WATCHLIST_LIST_NAME", "watchlists_list_name"),
+            ("WATCHLIST_LIST_ABBREVIATION", "watchlists_list_abbreviation"),
+            ("WATCHLIST_AUTHORITY_COUNTRY", "watchlists_authority_country"),
+            ("WATCHLIST_ACTION_DATE_DATE", "watchlists_action_date_date"),
+            ("WATCHLIST_ACTION_DATE_MONTH", "watchlists_action_date_month"),
+            ("WATCHLIST_ACTION_DATE_YEAR", "watchlists_action_date_year"),
+            ("WATCHLIST_ADDITIONAL_INFORMATION", "watchlists_additional_information"),
+            ("WATCHLIST_LIST_ID", "watchlists_list_id"),
+        ],
+    },
+    {
+        "group": "enforcement",
+        "kind": "zip",
+        "fields": [
+            ("ENFORCEMENT_LEGAL_ACTION_TYPE", "enforcement_legal_action_type"),
+            ("ENFORCEMENT_LEGAL_ACTION_DATE_DAY", "enforcement_legal_action_date_day"),
+            (
+                "ENFORCEMENT_LEGAL_ACTION_DATE_MONTH",
+                "enforcement_legal_action_date_month",
+            ),
+            (
+                "ENFORCEMENT_LEGAL_ACTION_DATE_YEAR",
+                "enforcement_legal_action_date_year",
+            ),
+            (
+                "ENFORCEMENT_IMPRISONMENT_OR_RESTRICTION",
+                "enforcement_imprisonment_or_restriction",
+            ),
+            (
+                "ENFORCEMENT_FINE_AMOUNT_IN_LOCAL_CURRENCY",
+                "enforcement_fine_amount_in_local_currency",
+            ),
+            (
+                "ENFORCEMENT_NAME_OF_LOCAL_CURRENCY",
+                "enforcement_name_of_local_currency",
+            ),
+            ("ENFORCEMENT_FINE_AMOUNT_IN_USD", "enforcement_fine_amount_in_usd"),
+            ("ENFORCEMENT_CONVERSION_RATE", "enforcement_conversion_rate"),
+            ("ENFORCEMENT_PRIMARY_REGULATORS", "enforcement_primary_regulators"),
+            ("ENFORCEMENT_STATED_REGULATIONS", "enforcement_stated_regulations"),
+            ("ENFORCEMENT_ENFORCEMENT_LIST_NAME", "enforcement_enforcement_list_name"),
+            ("ENFORCEMENT_PROFILE_SUMMARY", "enforcement_profile_summary"),
+            (
+                "ENFORCEMENT_REASONING_FOR_LEGAL_ACTIONS",
+                "enforcement_reasoning_for_legal_actions",
+            ),
+            ("ENFORCEMENT_TAXONOMY", "enforcement_taxonomy"),
+            ("ENFORCEMENT_EVENT_ID", "enforcement_event_id"),
+        ],
+    },
+    {
+        "group": "apc",
+        "kind": "zip",
+        "fields": [
+            ("APC_GROUP_ID", "apc_group_id"),
+            ("APC_ARTICLE_ID", "apc_article_id"),
+            ("APC_DATE_PUBLISHED", "date_published_date"),
+            ("APC_MONTH_PUBLISHED", "date_published_month"),
+            ("APC_YEAR_PUBLISHED", "date_published_year"),
+            ("APC_HEADING", "apc_heading"),
+            ("APC_NEWS_LINK", "apc_news_link"),
+            ("APC_LANGUAGE", "apc_language"),
+            ("APC_NEWS_PROVIDER", "apc_news_provider"),
+            ("APC_SENTIMENT", "apc_sentiment"),
+            ("APC_SUMMARY", "apc_summary"),
+            ("APC_SOURCE_REPUTATION", "apc_source_reputation"),
+            ("APC_ARTICLE_TEXT", "apc_article_text"),
+            ("APC_SUMMARY_LEDE", "apc_summary_lede"),
+            ("APC_FRAMEWORKS_NAME", "apc_frameworks_name"),
+            ("APC_FRAMEWORKS_VERSION", "apc_frameworks_version"),
+            ("APC_RISK_SCORE", "apc_risk_score"),
+            ("APC_CATEGORIES", "apc_categories"),
+            ("APC_RISK_AREAS", "apc_risk_areas"),
+            ("APC_EVENTS", "apc_events"),
+            ("APC_KEYWORDS", "apc_keywords"),
+            ("APC_EVENT_STAGE", "apc_event_stage"),
+            ("APC_NER_TYPE", "apc_ner_type"),
+            ("APC_NER_ENTITIES", "apc_ner_entities"),
+            ("APC_NER_ATTRIBUTES", "apc_ner_attributes"),
+            ("APC_RELEVANCE_SCORE", "apc_relevance_score"),
+            ("APC_LOCATIONS", "apc_locations"),
+            ("APC_ARTICLE_CATEGORY", "apc_article_category"),
+            ("APC_NETWORK_MAP", "apc_network_map"),
+            ("APC_RISK_EVENT", "apc_risk_event"),
+            ("APC_EVENT_CHRONOLOGY", "apc_event_chronology"),
+            ("APC_REGULATORY_ACTION", "apc_regulatory_action"),
+            ("APC_REGULATOR", "apc_regulator"),
+            ("APC_PENALTY_AMOUNT", "apc_penalty_amount"),
+        ],
+        "payloads": [
+            "APC_SUMMARY",
+            "APC_ARTICLE_TEXT",
+            "APC_SUMMARY_LEDE",
+            "APC_NETWORK_MAP",
+            "APC_EVENT_CHRONOLOGY",
+        ],
+    },
+    {
+        "group": "litigation",
+        "kind": "zip",
+        "fields": [
+            ("LITIGATION_COURT_NAME", "litigation_court_name"),
+            ("LITIGATION_NUMBER_OF_CASES", "litigation_number_of_cases"),
+            ("LITIGATION_CASE_NUMBER", "litigation_case_number"),
+            ("LITIGATION_DATE_DATE", "litigation_date_date"),
+            ("LITIGATION_DATE_MONTH", "litigation_date_month"),
+            ("LITIGATION_DATE_YEAR", "litigation_date_year"),
+        ],
+    },
+    {
+        "group": "pincode",
+        "kind": "fields",
+        "fields": [
+            ("PINCODE_HIGH_RISK_AREA", "pincode_high_risk_area"),
+            ("PINCODE_RISK_TYPE", "pincode_risk_type"),
+            ("PINCODE_CITY", "pincode_city"),
+            ("PINCODE_DISTRICT", "pincode_district"),
+            ("PINCODE_STATE", "pincode_state"),
+            ("PINCODE_COUNTRY", "pincode_country"),
+        ],
+    },
+    {
+        "group": "others",
+        "kind": "zip",
+        "fields": [
+            ("OTHERS_AUTHORITY", "others_authority"),
+            ("OTHERS_LIST_NAME", "others_list_name"),
+            ("OTHERS_ORDER", "others_order"),
+            ("OTHERS_PROGRAMME", "others_programme"),
+            ("OTHERS_EVENT_START_DATE_DATE", "others_event_start_date_date"),
+            ("OTHERS_EVENT_START_DATE_MONTH", "others_event_start_date_month"),
+            ("OTHERS_EVENT_START_DATE_YEAR", "others_event_start_date_year"),
+            ("OTHERS_EVENT_END_DATE_DATE", "others_event_end_date_date"),
+            ("OTHERS_EVENT_END_DATE_MONTH", "others_event_end_date_month"),
+            ("OTHERS_EVENT_END_DATE_YEAR", "others_event_end_date_year"),
+            ("OTHERS_ASSOCIATED_SUBJECT_TYPE", "others_associated_subject_type"),
+            ("OTHERS_EVENT_SUMMARY", "others_event_summary"),
+            ("OTHERS_REASONING_TAXONOMY", "others_reasoning_taxonomy"),
+        ],
+    },
+]
+
+
+# --identifier types and the feature each one maps to, "$name" values are filled
+# --in from the identifier ($raw_type, $value, $country, $country_code,
+# --$issuing_authority, $issue_date, $expiry_date), anything else is a literal
+# --more types can be added with --reference_file without a code release
+IDENTIFIER_TYPES = {
+    "LEGAL ENTITY IDENTIFIER (LEI)": {
+        "LEI_NUMBER": "$value",
+    },
+    "DRIVER'S LICENSE NUMBER": {
+        "DRIVERS_LICENSE_NUMBER": "$value",
+        "DRIVERS_LICENSE_STATE": "$country_code",
+    },
+    "SOCIAL SECURITY NUMBER (SSN)": {
+        "SSN_NUMBER": "$value",
+    },
+    "NATIONAL PROVIDER IDENTIFIER": {
+        "NPI_NUMBER": "$value",
+    },
+    "PASSPORT NUMBER": {
+        "PASSPORT_NUMBER": "$value",
+        "PASSPORT_COUNTRY": "$country_code",
+        "PASSPORT_ISSUE_DT": "$issue_date",
+        "PASSPORT_EXPIRE_DT": "$expiry_date",
+    },
+    "DIRECTOR IDENTIFICATION NUMBER (DIN)": {
+        "NATIONAL_ID_TYPE": "DIN",
+        "NATIONAL_ID_NUMBER": "$value",
+        "NATIONAL_ID_COUNTRY": "$country_code",
+    },
+    "CORPORATE IDENTIFICATION NUMBER (CIN)": {
+        "NATIONAL_ID_TYPE": "CIN",
+        "NATIONAL_ID_NUMBER": "$value",
+        "NATIONAL_ID_COUNTRY": "$country_code",
+    },
+    "LIMITED LIABILITY PARTNERSHIP IDENTIFICATION NUMBER (LLPIN)": {
+        "NATIONAL_ID_TYPE": "LLPIN",
+        "NATIONAL_ID_NUMBER": "$value",
+        "NATIONAL_ID_COUNTRY": "$country_code",
+    },
+    "FCRN NUMBER": {
+        "NATIONAL_ID_TYPE": "FCRN",
+        "NATIONAL_ID_NUMBER": "$value",
+        "NATIONAL_ID_COUNTRY": "$country_code",
+    },
+    "FIRM REGISTRATION NUMBER (FRN)": {
+        "NATIONAL_ID_TYPE": "FRN",
+        "NATIONAL_ID_NUMBER": "$value",
+        "NATIONAL_ID_COUNTRY": "$country_code",
+    },
+    "CEDULA NUMBER": {
+        "NATIONAL_ID_TYPE": "CEDULA",
+        "NATIONAL_ID_NUMBER": "$value",
+        "NATIONAL_ID_COUNTRY": "$country_code",
+    },
+    "PRIMARY STATE REGISTRATION NUMBER (OGRN)": {
+        "NATIONAL_ID_TYPE": "OGRN",
+        "NATIONAL_ID_NUMBER": "$value",
+        "NATIONAL_ID_COUNTRY": "$country_code",
+    },
+    "SYSTÈME D'IDENTIFICATION DU RÉPERTOIRE DES ENTREPRISES (SIREN) NUMBER": {
+        "NATIONAL_ID_TYPE": "SIREN",
+        "NATIONAL_ID_NUMBER": "$value",
+        "NATIONAL_ID_COUNTRY": "$country_code",
+    },
+    "PERMANENT ACCOUNT NUMBER (PAN)": {
+        "TAX_ID_TYPE": "PAN",
+        "TAX_ID_NUMBER": "$value",
+        "TAX_ID_COUNTRY": "$country_code",
+        "TAX_ID_ISSUE_DT": "$issue_date",
+        "TAX_ID_EXPIRE_DT": "$expiry_date",
+    },
+    "LICENSE NUMBER": {
+        "OTHER_ID_TYPE": "LICENSE",
+        "OTHER_ID_NUMBER": "$value",
+        "OTHER_ID_COUNTRY": "$country_code",
+        "OTHER_ID_ISSUE_DT": "$issue_date",
+        "OTHER_ID_EXPIRE_DT": "$expiry_date",
+    },
+    "CADASTRO NACIONAL DA PESSOA JURÍDICA (CNPJ)": {
+        "TAX_ID_TYPE": "CNPJ",
+        "TAX_ID_NUMBER": "$value",
+        "TAX_ID_COUNTRY": "$country_code",
+    },
+    "GST NUMBER": {
+        "TAX_ID_TYPE": "GST",
+        "TAX_ID_NUMBER": "$value",
+        "TAX_ID_COUNTRY": "$country_code",
+    },
+    "TAX IDENTIFICATION NUMBER (TIN)": {
+        "TAX_ID_TYPE": "TIN",
+        "TAX_ID_NUMBER": "$value",
+        "TAX_ID_COUNTRY": "$country_code",
+    },
+    "CADASTRO DE PESSOAS FÍSICAS (CPF)": {
+        "TAX_ID_TYPE": "CPF",
+        "TAX_ID_NUMBER": "$value",
+        "TAX_ID_COUNTRY": "$country_code",
+    },
+    "INN NUMBER": {
+        "TAX_ID_TYPE": "INN",
+        "TAX_ID_NUMBER": "$value",
+        "TAX_ID_COUNTRY": "$country_code",
+    },
+    "VALUE ADDED TAX NUMBER (VAT)": {
+        "TAX_ID_TYPE": "VAT",
+        "TAX_ID_NUMBER": "$value",
+        "TAX_ID_COUNTRY": "$country_code",
+    },
+}
+
+# --identifier types not in the table above map to an OTHER_ID
+OTHER_IDENTIFIER_TYPE = {
+    "OTHER_ID_TYPE": "$raw_type",
+    "OTHER_ID_NUMBER": "$value",
+    "OTHER_ID_COUNTRY": "$country_code",
+    "OTHER_ID_ISSUE_DT": "$issue_date",
+    "OTHER_ID_EXPIRE_DT": "$expiry_date",
+}
+IDENTIFIER_FIELDS = (
+    "raw_type",
+    "value",
+    "country",
+    "country_code",
+    "issuing_authority",
+    "issue_date",
+    "expiry_date",
+)
 
-        # Record type is optional, but should be 'PERSON' or 'ORGANIZATION'
-        self.update_stat(
-            raw_data.get("subject_type", "").upper(), raw_data["uid"]
-        )  # Update statistics based on type
-        json_data["RECORD_TYPE"] = (
-            "PERSON"
-            if raw_data.get("subject_type", "") == "Individual"
-            else "ORGANIZATION"
-        )
-        json_data["TYPE"] = raw_data.get(
-            "subject_type"
-        )  # Store the type from raw_data, if available
 
-        # Set primary names
-        json_data["PRIMARY_NAME_FIRST"] = raw_data.get("first_name")  # First name
-        json_data["PRIMARY_NAME_MIDDLE"] = raw_data.get("middle_name")  # Middle name
-        json_data["PRIMARY_NAME_LAST"] = raw_data.get("last_name")  # Last name
+# =========================
+class record_fingerprinter:
 
-        # Primary name of the organization
-        json_data["PRIMARY_NAME_ORG"] = raw_data.get("name")
+    # ----------------------------------------
+    def __init__(self, algorithm="auto", ignored_keys=None):
 
-        # Append gender information if available
-        if raw_data.get("gender", ""):
-            json_data["FEATURES"].append({"GENDER": raw_data.get("gender", "")})
-
-        # Process image URLs, split by '|', and add to FEATURES
-        if raw_data.get("image_url"):
-            img = raw_data.get("image_url", "")
-            if img.strip():  # Ensure the image URL is not empty
-                json_data["FEATURES"].append({"image_url": img.strip()})
-
-        # Process date of birth information
-        date_of_birth_year_list = raw_data.get("date_of_birth_year", []) or []
-        date_of_birth_month_list = raw_data.get("date_of_birth_month", []) or []
-        date_of_birth_date_list = raw_data.get("date_of_birth_date", []) or []
-
-        # Loop through each component of the date of birth
-        for year, month, date in zip_longest(
-            date_of_birth_year_list,
-            date_of_birth_month_list,
-            date_of_birth_date_list,
-            fillvalue="",
-        ):
-            try:
-                y = self.clean_val(year)  # Year
-                m = self.clean_val(month)  # Month
-                d = self.clean_val(date)  # Day
-
-                # Construct date of birth based on available components
-                if y and m and d:
-                    json_data["FEATURES"].append({"DATE_OF_BIRTH": f"{y}-{m}-{d}"})
-                elif y and m:
-                    json_data["FEATURES"].append({"DATE_OF_BIRTH": f"{y}-{m}"})
-                elif m and d:
-                    json_data["FEATURES"].append({"DATE_OF_BIRTH": f"{m}/{d}"})
-                elif y:
-                    json_data["FEATURES"].append({"DATE_OF_BIRTH": y})
-            except Exception as ex:
-                print(
-                    f"id {raw_data['uid']} date_of_birth parse error {ex}"
-                )  # Log parsing errors
-
-        # Process date of death information
-        date_of_death_year_list = raw_data.get("date_of_death_year", []) or []
-        date_of_death_month_list = raw_data.get("date_of_death_month", []) or []
-        date_of_death_date_list = raw_data.get("date_of_death_date", []) or []
-        is_deceased = raw_data.get(
-            "deceased_status", ""
-        )  # Check if the individual is deceased
-        json_data["country"] = is_deceased  # Store deceased status in 'country' field
-
-        if is_deceased:
-            # Loop through each component of the date of death
-            for year, month, date in zip_longest(
-                date_of_death_year_list,
-                date_of_death_month_list,
-                date_of_death_date_list,
-                fillvalue="",
-            ):
+        candidates = FINGERPRINT_ALGORITHMS if algorithm == "auto" else [algorithm]
+        for candidate in candidates:
+            if candidate == "xxhash":
                 try:
-                    y = self.clean_val(year)  # Year
-                    m = self.clean_val(month)  # Month
-                    d = self.clean_val(date)  # Day
-
-                    # Construct date of death based on available components
-                    if y and m and d:
-                        json_data["FEATURES"].append({"DATE_OF_DEATH": f"{y}-{m}-{d}"})
-                    elif y and m:
-                        json_data["FEATURES"].append({"DATE_OF_DEATH": f"{y}-{m}"})
-                    elif m and d:
-                        json_data["FEATURES"].append({"DATE_OF_DEATH": f"{m}/{d}"})
-                    elif y:
-                        json_data["FEATURES"].append({"DATE_OF_DEATH": y})
-                except Exception as ex:
-                    print(
-                        f"id {raw_data['uid']} date_of_death parse error {ex}"
-                    )  # Log parsing errors
-
-        # Retrieve and split address-related data into lists
-        address_type_list = raw_data.get("address_type", []) or []
-        address_street_list = raw_data.get("address_street", []) or []
-        address_city_list = raw_data.get("address_city", []) or []
-        address_province_list = raw_data.get("address_province", []) or []
-        address_postal_code_list = raw_data.get("address_postal_code", []) or []
-        address_country_list = raw_data.get("address_country", []) or []
-        address_country_code_list = raw_data.get("address_country_code", []) or []
-
-        # Iterate through each address entry to construct address data
-        for (
-            addr_type,
-            street,
-            country,
-            city,
-            province,
-            postal,
-            country_code,
-        ) in zip_longest(
-            address_type_list,
-            address_street_list,
-            address_country_list,
-            address_city_list,
-            address_province_list,
-            address_postal_code_list,
-            address_country_code_list,
-            fillvalue="",
-        ):
-            try:
-                _data = {
-                    "ADDR_TYPE": self.clean_val(addr_type),
-                    "ADDR_LINE1": self.clean_val(street),
-                    "ADDR_LINE2": self.clean_val(
-                        country
-                    ),  # <-- you may want to change this to proper ADDRESS_LINE2
-                    "ADDR_CITY": self.clean_val(city),
-                    "ADDR_STATE": self.clean_val(province),
-                    "ADDR_POSTAL_CODE": self.clean_val(postal),
-                    "ADDR_COUNTRY": self.clean_val(country_code),
-                }
+                    import xxhash
+                except ImportError:
+                    continue
+                self.new_hash = xxhash.xxh3_128
+            elif candidate == "blake2b":
+                self.new_hash = lambda data=b"": hashlib.blake2b(data, digest_size=16)
+            else:
+                self.new_hash = hashlib.md5
+            self.algorithm = candidate
+            break
+        else:
+            raise ImportError(f"fingerprint algorithm {algorithm} is not installed")
 
-                # Append only if at least one field is present
-                if any(v for v in _data.values()):
-                    json_data["FEATURES"].append(_data)
+        # --features whose keys belong to an unselected group are left out
+        self.ignored_keys = ignored_keys
+        self.encode = json.JSONEncoder(check_circular=False).encode
 
-            except Exception as ex:
-                print(f"id {raw_data.get('uid')} address parse error {ex}")
+    # ----------------------------------------
+    def fingerprint(self, json_data, encoded_record=None):
+
+        # --the whole record: hash the bytes that were already encoded for the
+        # --output, the mapper emits keys in a fixed order so they are canonical
+        if not self.ignored_keys:
+            if encoded_record is None:
+                encoded_record = self.encode(json_data).encode("ascii")
+            return self.new_hash(encoded_record).hexdigest()
+
+        # --a subset of groups: the stable top level attributes plus the chosen
+        # --features
+        ignored_keys = self.ignored_keys
+        hasher = self.new_hash()
+        for key, value in json_data.items():
+            if key != "FEATURES":
+                if key not in FINGERPRINT_VOLATILE_ATTRIBUTES:
+                    hasher.update(self.encode({key: value}).encode("ascii"))
+                continue
+            for feature in value:
+                for feature_key in feature:
+                    if feature_key not in ignored_keys:
+                        hasher.update(self.encode(feature).encode("ascii"))
+                    break
+        return hasher.hexdigest()
 
-        # Set SOE status based on raw data
-        json_data["soe_status"] = (
-            "Yes" if "Yes" in raw_data.get("soe_status", "") else ""
-        )
 
-        # Retrieve and split PEP-related data into lists
-        pep_type_list = raw_data.get("pep_type", []) or []
-        pep_level_list = raw_data.get("pep_level", []) or []
-        position_list = raw_data.get("position", []) or []
-        org_name_list = raw_data.get("organization_name", []) or []
+# =========================
+class buffered_writer:
 
-        # Retrieve and split position date-related data into lists
-        # Parse position dates as lists
-        position_start_date_year_list = (
-            raw_data.get("position_start_date_year", []) or []
-        )
-        position_start_date_month_list = (
-            raw_data.get("position_start_date_month", []) or []
-        )
-        position_start_date_date_list = (
-            raw_data.get("position_start_date_date", []) or []
-        )
+    # ----------------------------------------
+    def __init__(self, file_handle, buffer_size):
+        self.file_handle = file_handle
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.buffered_bytes = 0
 
-        position_end_date_year_list = raw_data.get("position_end_date_year", []) or []
-        position_end_date_month_list = raw_data.get("position_end_date_month", []) or []
-        position_end_date_date_list = raw_data.get("position_end_date_date", []) or []
-
-        # Add group associations to json_data from organization names
-        for name in org_name_list:
-            if (
-                name.strip() and name != "~"
-            ):  # Check if the organization name is not empty
-                json_data["FEATURES"].append(
-                    {"GROUP_ASSOCIATION_ORG_NAME": name.strip()}
-                )
+    # ----------------------------------------
+    def write(self, data):
+        self.buffer.append(data)
+        self.buffered_bytes += len(data)
+        if self.buffered_bytes >= self.buffer_size:
+            self.flush()
 
-        # Iterate through positions and create data for each
-        for (
-            pep_type,
-            pep_level,
-            position,
-            org_name,
-            start_y,
-            start_m,
-            start_d,
-            end_y,
-            end_m,
-            end_d,
-        ) in zip_longest(
-            pep_type_list,
-            pep_level_list,
-            position_list,
-            org_name_list,
-            position_start_date_year_list,
-            position_start_date_month_list,
-            position_start_date_date_list,
-            position_end_date_year_list,
-            position_end_date_month_list,
-            position_end_date_date_list,
-            fillvalue="",
-        ):
-            try:
-                _data = {
-                    "pep_types": self.clean_val(pep_type),
-                    "pep_level": self.clean_val(pep_level),
-                    "position": self.clean_val(position),
-                    "position_organization": self.clean_val(org_name),
-                    "position_start_year": self.clean_val(start_y),
-                    "position_start_month": self.clean_val(start_m),
-                    "position_start_date": self.clean_val(start_d),
-                    "position_end_year": self.clean_val(end_y),
-                    "position_end_month": self.clean_val(end_m),
-                    "position_end_date": self.clean_val(end_d),
-                }
+    # ----------------------------------------
+    def writelines(self, lines):
+        for data in lines:
+            self.write(data)
 
-                if any(value for value in _data.values()):
-                    json_data["FEATURES"].append(_data)
+    # ----------------------------------------
+    def flush(self):
+        # --one large write per buffer instead of one per record
+        if self.buffer:
+            self.file_handle.write(b"".join(self.buffer))
+            self.buffer = []
+            self.buffered_bytes = 0
 
-            except Exception as ex:
-                print(
-                    f"id {raw_data.get('uid', 'unknown')} pep details parse error {ex}"
-                )
+    # ----------------------------------------
+    def sync(self):
+        # --make everything written so far durable and return its size
+        self.flush()
+        self.file_handle.flush()
+        os.fsync(self.file_handle.fileno())
+        return self.file_handle.tell()
 
-        # Check if 'alias_name' exists in the raw data
-        if raw_data.get("alias_name"):
-            # Split alias-related data into lists
-            alias_names = raw_data.get("alias_name", []) or []
-            alias_types = raw_data.get("alias_type", []) or []
-            alias_scripts = raw_data.get("alias_script", []) or []
-            alias_languages = raw_data.get("alias_language", []) or []
-
-            # Iterate through the alias lists simultaneously
-            for alias_name, alias_type, alias_script, alias_language in zip_longest(
-                alias_names, alias_types, alias_scripts, alias_languages
-            ):
-                alias_name = self.clean_val(alias_name)
-                alias_type = self.clean_val(alias_type)
-                alias_script = self.clean_val(alias_script)
-                alias_language = self.clean_val(alias_language)
-
-                if alias_name:  # Ensure alias_name is not empty
-                    if json_data["RECORD_TYPE"] == "PERSON":
-                        # Append person-specific alias data
-                        json_data["FEATURES"].append(
-                            {
-                                "ALIAS_NAME_FULL": alias_name,
-                                "ALIAS_TYPE": alias_type,
-                                "ALIAS_SCRIPT": alias_script,
-                                "ALIAS_LANGUAGE": alias_language,
-                            }
-                        )
-                    else:
-                        json_data["FEATURES"].append(
-                            {
-                                "ALIAS_NAME_ORG": alias_name,
-                                "ALIAS_TYPE": alias_type,
-                                "ALIAS_SCRIPT": alias_script,
-                                "ALIAS_LANGUAGE": alias_language,
-                            }
-                        )
+    # ----------------------------------------
+    def close(self):
+        self.flush()
+        self.file_handle.close()
 
-        # Retrieve relationship-related data
-        relationship_subject_type_list = (
-            raw_data.get("association_subject_type", []) or []
-        )
-        relationship_name_list = raw_data.get("association_name", []) or []
-        relationship_type_list = raw_data.get("association_relationship_type", []) or []
-        relationship_type_desc_list = (
-            raw_data.get("association_relationship_type_description", []) or []
-        )
-        relationship_uid_list = raw_data.get("association_relationship_uid", []) or []
 
-        # Append relationship details to json_data
-        for rel_subject_type, rel_name, rel_type, rel_type_desc, rel_uid in zip_longest(
-            relationship_subject_type_list,
-            relationship_name_list,
-            relationship_type_list,
-            relationship_type_desc_list,
-            relationship_uid_list,
-        ):
-            try:
-                rel_subject_type = self.clean_val(rel_subject_type)
-                rel_name = self.clean_val(rel_name)
-                rel_type = self.clean_val(rel_type)
-                rel_type_desc = self.clean_val(rel_type_desc)
-                rel_uid = self.clean_val(rel_uid)
+# =========================
+class payload_store:
 
-                # Always append the base relationship record
-                json_data["FEATURES"].append(
-                    {
-                        "RELATIONSHIP_SUBJECT_TYPE": rel_subject_type,
-                        "RELATIONSHIP_NAME": rel_name,
-                        "RELATIONSHIP_TYPE": rel_type,
-                        "RELATIONSHIP_TYPE_DESCRIPTION": rel_type_desc,
-                        "RELATIONSHIP_UID": rel_uid,
-                    }
-                )
+    # ----------------------------------------
+    def __init__(self, file_name=None, flush_count=1000, seen_size=PAYLOAD_SEEN_SIZE):
+
+        # --content addressed: a payload is keyed by its hash so an article shared
+        # --by many subjects is stored once; without a file name (pool workers)
+        # --new payloads are only collected for the parent to write; the pipeline
+        # --writer thread uses the connection, but never at the same time as another
+        self.connection = None
+        if file_name:
+            import sqlite3
+
+            self.connection = sqlite3.connect(file_name, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=OFF")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS payloads "
+                "(hash TEXT PRIMARY KEY, payload TEXT) WITHOUT ROWID"
+            )
+        self.flush_count = flush_count
+        self.pending = {}
+        self.seen = collections.OrderedDict()
+        self.seen_size = seen_size
+        self.stored_count = 0
 
-                # Append relationship pointers if we have a UID
-                if rel_uid:
-                    json_data["FEATURES"].append({"REL_POINTER_KEY": rel_uid})
-                    json_data["FEATURES"].append(
-                        {"REL_ANCHOR_DOMAIN": args.data_source + "_UID"}
-                    )
-                    json_data["FEATURES"].append({"REL_ANCHOR_KEY": raw_data["uid"]})
-                    if rel_type:
-                        json_data["FEATURES"].append({"REL_POINTER_ROLE": rel_type})
+    # ----------------------------------------
+    def put(self, payload):
+        payload_hash = hashlib.blake2b(
+            payload.encode("utf-8"), digest_size=16
+        ).hexdigest()
+        if self.first_sighting(payload_hash):
+            self.pending[payload_hash] = payload
+            if self.connection and len(self.pending) >= self.flush_count:
+                self.flush()
+        return payload_hash
 
-            except Exception as ex:
-                print(f"id {raw_data.get('uid')} relationship parse error {ex}")
+    # ----------------------------------------
+    def first_sighting(self, payload_hash):
+
+        # --a bounded lru of recent hashes, so memory stays flat however many
+        # --payloads a run stores
+        seen = self.seen
+        if payload_hash in seen:
+            seen.move_to_end(payload_hash)
+            return False
+        seen[payload_hash] = None
+        if len(seen) > self.seen_size:
+            seen.popitem(last=False)
+        return True
 
-        # Retrieve pep-country data as lists
-        pep_country_list = raw_data.get("pep_country", []) or []
-        pep_country_code_list = raw_data.get("pep_country_code", []) or []
+    # ----------------------------------------
+    def take_pending(self):
+        pending = self.pending
+        self.pending = {}
+        return pending
 
-        # Append source details to json_data
-        for pep_country, pep_country_code in zip_longest(
-            pep_country_list, pep_country_code_list
-        ):
-            pep_country = self.clean_val(pep_country)
-            pep_country_code = self.clean_val(pep_country_code)
+    # ----------------------------------------
+    def add_pending(self, payloads):
+        for payload_hash, payload in payloads.items():
+            if self.first_sighting(payload_hash):
+                self.pending[payload_hash] = payload
+        if len(self.pending) >= self.flush_count:
+            self.flush()
 
-            json_data["FEATURES"].append(
-                {"PEP_COUNTRY": pep_country, "PEP_COUNTRY_CODE": pep_country_code}
+    # ----------------------------------------
+    def flush(self):
+        if self.connection and self.pending:
+            cursor = self.connection.executemany(
+                "INSERT OR IGNORE INTO payloads (hash, payload) VALUES (?, ?)",
+                self.pending.items(),
             )
+            self.stored_count += cursor.rowcount
+            self.connection.commit()
+            self.pending = {}
 
-        # Retrieve source-related data as lists
-        source_type_list = raw_data.get("source_type", []) or []
-        source_list = raw_data.get("external_sources", []) or []
-        source_description_list = raw_data.get("source_description", []) or []
+    # ----------------------------------------
+    def close(self):
+        self.flush()
+        if self.connection:
+            self.connection.close()
 
-        # Append source details to json_data
-        for source_type, source, source_description in zip_longest(
-            source_type_list, source_list, source_description_list
-        ):
-            source_type = self.clean_val(source_type)
-            source = self.clean_val(source)
-            source_description = self.clean_val(source_description)
-
-            json_data["FEATURES"].append(
-                {
-                    "SOURCE_TYPE": source_type,
-                    "SOURCE": source,
-                    "SOURCE_DESCRIPTION": source_description,
-                }
-            )
 
-        # Add timestamps to json_data
-        json_data["CREATED_AT"] = raw_data["entered"]
-        json_data["UPDATED_AT"] = raw_data["updated"]
+# =========================
+class state_index:
 
-        # Process citizenship data as lists
-        citizenship_country_list = raw_data.get("citizenship", []) or []
-        citizenship_country_code_list = (
-            raw_data.get("citizenship_country_code", []) or []
-        )
+    # ----------------------------------------
+    def __init__(self, file_name, flush_count=10000):
+
+        # --RECORD_ID -> record hash of the last completed run; every record seen
+        # --is stamped with this run's number so the ones left behind are deletes
+        import sqlite3
+
+        self.connection = sqlite3.connect(file_name, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS records "
+            "(record_id TEXT PRIMARY KEY, record_hash TEXT, run_number INTEGER) "
+            "WITHOUT ROWID"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS runs (run_number INTEGER PRIMARY KEY)"
+        )
+        last_run = self.connection.execute("SELECT MAX(run_number) FROM runs")
+        self.run_number = (last_run.fetchone()[0] or 0) + 1
+        self.flush_count = flush_count
+        self.pending = []
+        self.changed_count = 0
+        self.unchanged_count = 0
+        self.deleted_count = 0
 
-        for citizenship_country, citizenship_country_code in zip_longest(
-            citizenship_country_list, citizenship_country_code_list
-        ):
-            citizenship_country = self.clean_val(citizenship_country)
-            citizenship_country_code = self.clean_val(citizenship_country_code)
+    # ----------------------------------------
+    def changed(self, record_id, record_hash):
+        row = self.connection.execute(
+            "SELECT record_hash FROM records WHERE record_id = ?", (record_id,)
+        ).fetchone()
+        self.pending.append((record_id, record_hash, self.run_number))
+        if len(self.pending) >= self.flush_count:
+            self.flush()
+        if row and row[0] == record_hash:
+            self.unchanged_count += 1
+            return False
+        self.changed_count += 1
+        return True
 
-            json_data["FEATURES"].append(
-                {
-                    "CITIZENSHIP": citizenship_country,
-                    "CITIZENSHIP_COUNTRY_CODE": citizenship_country_code,
-                }
+    # ----------------------------------------
+    def flush(self):
+        # --nothing is committed until close() so an aborted run leaves the
+        # --index exactly as the last completed run left it
+        if self.pending:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO records (record_id, record_hash, run_number) "
+                "VALUES (?, ?, ?)",
+                self.pending,
             )
+            self.pending = []
 
-        # Process nationality data as lists
-        nationality_country_list = raw_data.get("nationality_country", []) or []
-        nationality_country_code_list = (
-            raw_data.get("nationality_country_code", []) or []
+    # ----------------------------------------
+    def deleted_record_ids(self):
+        self.flush()
+        cursor = self.connection.execute(
+            "SELECT record_id FROM records WHERE run_number < ?", (self.run_number,)
+        )
+        for (record_id,) in cursor:
+            self.deleted_count += 1
+            yield record_id
+        self.connection.execute(
+            "DELETE FROM records WHERE run_number < ?", (self.run_number,)
         )
 
-        for nationality_country, nationality_country_code in zip_longest(
-            nationality_country_list, nationality_country_code_list
-        ):
-            nationality_country = self.clean_val(nationality_country)
-            nationality_country_code = self.clean_val(nationality_country_code)
-
-            json_data["FEATURES"].append(
-                {
-                    "NATIONALITY": nationality_country,
-                    "NATIONALITY_COUNTRY_CODE": nationality_country_code,
-                }
+    # ----------------------------------------
+    def close(self, commit=True):
+        if commit:
+            self.flush()
+            self.connection.execute(
+                "INSERT INTO runs (run_number) VALUES (?)", (self.run_number,)
             )
+            self.connection.commit()
+        else:
+            self.connection.rollback()
+        self.connection.close()
 
-        # Process identifiers
-        # Parse identifier lists as proper Python lists
-        identifier_name_list = raw_data.get("identifier_name", []) or []
-        identifier_value_list = raw_data.get("identifier_value", []) or []
-        identifier_country_list = raw_data.get("identifier_country", []) or []
-        identifier_country_code_list = raw_data.get("identifier_country_code", []) or []
-        identifier_issuing_authority_list = (
-            raw_data.get("identifier_issuing_authority", []) or []
-        )
 
-        identifier_issue_date_date_list = (
-            raw_data.get("identifier_issue_date_date", []) or []
-        )
-        identifier_issue_date_month_list = (
-            raw_data.get("identifier_issue_date_month", []) or []
-        )
-        identifier_issue_date_year_list = (
-            raw_data.get("identifier_issue_date_year", []) or []
-        )
+# =========================
+class bounded_features(list):
 
-        identifier_expiry_date_date_list = (
-            raw_data.get("identifier_expiry_date_date", []) or []
-        )
-        identifier_expiry_date_month_list = (
-            raw_data.get("identifier_expiry_date_month", []) or []
-        )
-        identifier_expiry_date_year_list = (
-            raw_data.get("identifier_expiry_date_year", []) or []
-        )
+    # ----------------------------------------
+    def __init__(self, max_features=None, max_bytes=None, encode=None):
+        super().__init__()
+        self.max_features = max_features or math.inf
+        self.max_bytes = max_bytes or math.inf
+        self.encode = encode
+        self.byte_count = 0
+        self.dropped_count = 0
 
-        for (
-            raw_type,
-            value,
-            country,
-            country_code,
-            issuing_authority,
-            issue_y,
-            issue_m,
-            issue_d,
-            expiry_y,
-            expiry_m,
-            expiry_d,
-        ) in zip_longest(
-            identifier_name_list,
-            identifier_value_list,
-            identifier_country_list,
-            identifier_country_code_list,
-            identifier_issuing_authority_list,
-            identifier_issue_date_year_list,
-            identifier_issue_date_month_list,
-            identifier_issue_date_date_list,
-            identifier_expiry_date_year_list,
-            identifier_expiry_date_month_list,
-            identifier_expiry_date_date_list,
-            fillvalue="",
-        ):
-            try:
-                raw_type = self.clean_val(raw_type).upper()
-                value = self.clean_val(value).upper().lstrip("0")
-                country = self.clean_val(country)
-                country_code = self.clean_val(country_code)
-                issuing_authority = self.clean_val(issuing_authority)
-                identifier_issue_date = ""
-                identifier_expiry_date = ""
+    # ----------------------------------------
+    def prune(self, item):
+
+        # --pruned as it arrives the way remove_empty_tags would, so the caps
+        # --count real features and nothing past them is kept around
+        if not any(item.values()):
+            return None
+        for value in item.values():
+            if is_empty_tag(value):
+                return {
+                    key: value for key, value in item.items() if not is_empty_tag(value)
+                }
+        return item
 
-                try:
-                    y = self.clean_val(issue_y)  # Year
-                    m = self.clean_val(issue_m)  # Month
-                    d = self.clean_val(issue_d)  # Day
-
-                    # Construct date of birth based on available components
-                    if y and m and d:
-                        identifier_issue_date = f"{y}-{m}-{d}"
-                    elif y and m:
-                        identifier_issue_date = f"{y}-{m}"
-                    elif m and d:
-                        identifier_issue_date = f"{m}/{d}"
-                    elif y:
-                        identifier_issue_date = y
-                except Exception as ex:
-                    print(
-                        f"id {raw_data['uid']} identifier_issue_date parse error {ex}"
-                    )  # Log parsing errors
+    # ----------------------------------------
+    def append(self, item):
+        self.extend((item,))
 
-                try:
-                    y = self.clean_val(expiry_y)  # Year
-                    m = self.clean_val(expiry_m)  # Month
-                    d = self.clean_val(expiry_d)  # Day
-
-                    # Construct date of birth based on available components
-                    if y and m and d:
-                        identifier_expiry_date = f"{y}-{m}-{d}"
-                    elif y and m:
-                        identifier_expiry_date = f"{y}-{m}"
-                    elif m and d:
-                        identifier_expiry_date = f"{m}/{d}"
-                    elif y:
-                        identifier_expiry_date = y
-                except Exception as ex:
-                    print(
-                        f"id {raw_data['uid']} identifier_expiry_date parse error {ex}"
-                    )  # Log parsing errors
+    # ----------------------------------------
+    def extend(self, items):
+
+        # --the items go in as one unit or not at all, so a feature that only
+        # --means something together with the ones next to it is never cut apart
+        items = [item for item in map(self.prune, items) if item]
+        if not items:
+            return
+
+        # --once one feature is dropped all later ones are too, FEATURES stays
+        # --the same prefix whatever the size of the dropped features
+        if self.dropped_count or len(self) + len(items) > self.max_features:
+            self.dropped_count += len(items)
+            return
+        if self.max_bytes != math.inf:
+            item_bytes = sum(len(self.encode(item)) for item in items)
+            if self.byte_count + item_bytes > self.max_bytes:
+                self.dropped_count += len(items)
+                return
+            self.byte_count += item_bytes
+        super().extend(items)
 
-                # Update statistics for identifier type
-                self.update_stat("!IDTYPE", raw_type, value)
 
-                if raw_type == "LEGAL ENTITY IDENTIFIER (LEI)":
-                    json_data["FEATURES"].append(
-                        {
-                            "LEI_NUMBER": value
-                        }
-                    )
+# =========================
+class stats_log_writer:
 
-                elif raw_type == "DRIVER'S LICENSE NUMBER":
-                    json_data["FEATURES"].append(
-                        {
-                            "DRIVERS_LICENSE_NUMBER": value,
-                            "DRIVERS_LICENSE_STATE": country_code
-                        }
-                    )
+    # ----------------------------------------
+    def __init__(self, log_file, snapshot_rows, input_row_count=0):
+        self.log_file = log_file
+        self.snapshot_rows = snapshot_rows
+        self.start_time = self.snapshot_time = time.time()
+        self.start_row_count = self.snapshot_row_count = input_row_count
+        if snapshot_rows:
+            self.next_snapshot_count = input_row_count + snapshot_rows
+        else:
+            self.next_snapshot_count = math.inf
 
-                elif raw_type == "SOCIAL SECURITY NUMBER (SSN)":
-                    json_data["FEATURES"].append(
-                        {
-                            "SSN_NUMBER": value
-                        }
-                    )
+    # ----------------------------------------
+    def write(self, mapper_obj, input_row_count, output_row_count, status="running"):
+
+        # --throughput covers this run only, a resumed run starts counting again
+        now = time.time()
+        elapsed_seconds = now - self.start_time
+        run_rows = input_row_count - self.start_row_count
+        recent_seconds = now - self.snapshot_time
+        recent_rows = input_row_count - self.snapshot_row_count
+        mapper_obj.capture_counter_stats()
+        run_info = {
+            "status": status,
+            "data_source": mapper_obj.data_source,
+            "input_file": args.input_file,
+            "shard": args.shard,
+            "started_at": datetime.fromtimestamp(self.start_time).isoformat(),
+            "updated_at": datetime.fromtimestamp(now).isoformat(),
+            "elapsed_seconds": round(elapsed_seconds, 1),
+            "input_row_count": input_row_count,
+            "output_row_count": output_row_count,
+            "rows_per_sec": round(run_rows / elapsed_seconds, 1)
+            if elapsed_seconds
+            else 0,
+            "recent_rows_per_sec": round(recent_rows / recent_seconds, 1)
+            if recent_seconds
+            else 0,
+        }
+        write_stat_pack(self.log_file, mapper_obj.stat_pack, run_info)
+        self.snapshot_time = now
+        self.snapshot_row_count = input_row_count
+        if self.snapshot_rows:
+            self.next_snapshot_count = input_row_count + self.snapshot_rows
 
-                elif raw_type == "NATIONAL PROVIDER IDENTIFIER":
-                    json_data["FEATURES"].append(
-                        {
-                            "NPI_NUMBER": value
-                        }
-                    )
 
-                # Append identifier details based on type
-                elif raw_type == "PASSPORT NUMBER":
-                    json_data["FEATURES"].append(
-                        {
-                            "PASSPORT_NUMBER": value,
-                            "PASSPORT_COUNTRY": country_code,
-                            "PASSPORT_ISSUE_DT": identifier_issue_date,
-                            "PASSPORT_EXPIRE_DT": identifier_expiry_date,
-                        }
-                    )
-                elif raw_type == "DIRECTOR IDENTIFICATION NUMBER (DIN)":
-                    json_data["FEATURES"].append(
-                        {"NATIONAL_ID_TYPE": "DIN", "NATIONAL_ID_NUMBER": value, "NATIONAL_ID_COUNTRY": country_code}
-                    )
-                elif raw_type == "CORPORATE IDENTIFICATION NUMBER (CIN)":
-                    json_data["FEATURES"].append(
-                        {"NATIONAL_ID_TYPE": "CIN", "NATIONAL_ID_NUMBER": value, "NATIONAL_ID_COUNTRY": country_code}
-                    )
-                elif raw_type == "LIMITED LIABILITY PARTNERSHIP IDENTIFICATION NUMBER (LLPIN)":
-                    json_data["FEATURES"].append(
-                        {"NATIONAL_ID_TYPE": "LLPIN", "NATIONAL_ID_NUMBER": value, "NATIONAL_ID_COUNTRY": country_code}
-                    )
-                elif raw_type == "FCRN NUMBER":
-                    json_data["FEATURES"].append(
-                        {"NATIONAL_ID_TYPE": "FCRN", "NATIONAL_ID_NUMBER": value, "NATIONAL_ID_COUNTRY": country_code}
-                    )
-                elif raw_type == "FIRM REGISTRATION NUMBER (FRN)":
-                    json_data["FEATURES"].append(
-                        {"NATIONAL_ID_TYPE": "FRN", "NATIONAL_ID_NUMBER": value, "NATIONAL_ID_COUNTRY": country_code}
-                    )
-                elif raw_type == "CEDULA NUMBER":
-                    json_data["FEATURES"].append(
-                        {"NATIONAL_ID_TYPE": "CEDULA", "NATIONAL_ID_NUMBER": value, "NATIONAL_ID_COUNTRY": country_code}
-                    )
-                elif raw_type == "PRIMARY STATE REGISTRATION NUMBER (OGRN)":
-                    json_data["FEATURES"].append(
-                        {"NATIONAL_ID_TYPE": "OGRN", "NATIONAL_ID_NUMBER": value, "NATIONAL_ID_COUNTRY": country_code}
-                    )
-                elif raw_type == "SYSTÈME D'IDENTIFICATION DU RÉPERTOIRE DES ENTREPRISES (SIREN) NUMBER":
-                    json_data["FEATURES"].append(
-                        {"NATIONAL_ID_TYPE": "SIREN", "NATIONAL_ID_NUMBER": value, "NATIONAL_ID_COUNTRY": country_code}
-                    )
-                elif raw_type == "PERMANENT ACCOUNT NUMBER (PAN)":
-                    json_data["FEATURES"].append(
-                        {
-                            "TAX_ID_TYPE": "PAN",
-                            "TAX_ID_NUMBER": value,
-                            "TAX_ID_COUNTRY": country_code,
-                            "TAX_ID_ISSUE_DT": identifier_issue_date,
-                            "TAX_ID_EXPIRE_DT": identifier_expiry_date,
-                        }
-                    )
-                elif raw_type == "LICENSE NUMBER":
-                    json_data["FEATURES"].append(
-                        {
-                            "OTHER_ID_TYPE": "LICENSE",
-                            "OTHER_ID_NUMBER": value,
-                            "OTHER_ID_COUNTRY": country_code,
-                            "OTHER_ID_ISSUE_DT": identifier_issue_date,
-                            "OTHER_ID_EXPIRE_DT": identifier_expiry_date,
-                        }
-                    )
-                elif raw_type == "CADASTRO NACIONAL DA PESSOA JURÍDICA (CNPJ)":
-                    json_data["FEATURES"].append(
-                        {"TAX_ID_TYPE": "CNPJ","TAX_ID_NUMBER": value,"TAX_ID_COUNTRY": country_code}
-                    )
-                elif raw_type == "GST NUMBER":
-                    json_data["FEATURES"].append(
-                        {"TAX_ID_TYPE": "GST","TAX_ID_NUMBER": value,"TAX_ID_COUNTRY": country_code}
-                    )
-                elif raw_type == "TAX IDENTIFICATION NUMBER (TIN)":
-                    json_data["FEATURES"].append(
-                        {"TAX_ID_TYPE": "TIN","TAX_ID_NUMBER": value,"TAX_ID_COUNTRY": country_code}
-                    )
-                elif raw_type == "CADASTRO DE PESSOAS FÍSICAS (CPF)":
-                    json_data["FEATURES"].append(
-                        {"TAX_ID_TYPE": "CPF","TAX_ID_NUMBER": value,"TAX_ID_COUNTRY": country_code}
-                    )
-                elif raw_type == "INN NUMBER":
-                    json_data["FEATURES"].append(
-                        {"TAX_ID_TYPE": "INN","TAX_ID_NUMBER": value,"TAX_ID_COUNTRY": country_code}
-                    )
-                elif raw_type == "VALUE ADDED TAX NUMBER (VAT)":
-                    json_data["FEATURES"].append(
-                        {"TAX_ID_TYPE": "VAT","TAX_ID_NUMBER": value,"TAX_ID_COUNTRY": country_code}
-                    )
-                else:
-                    json_data["FEATURES"].append(
-                        {
-                            "OTHER_ID_TYPE": raw_type,
-                            "OTHER_ID_NUMBER": value,
-                            "OTHER_ID_COUNTRY": country_code,
-                            "OTHER_ID_ISSUE_DT": identifier_issue_date,
-                            "OTHER_ID_EXPIRE_DT": identifier_expiry_date,
-                        }
-                    )
-            except Exception as ex:
-                print(
-                    f"id {raw_data['uid']} identifier parse error {ex}"
-                )  # Log any parsing errors
+# =========================
+class batch_collector:
 
-        # Process vessel information as lists
-        vessel_type_list = raw_data.get("vessel_type", []) or []
-        current_country_flag_list = raw_data.get("current_country_flag", []) or []
-        former_country_flag_list = raw_data.get("former_country_flag", []) or []
+    # ----------------------------------------
+    def __init__(
+        self, output_file_handle, mapper_obj, progress, state=None, stats_log=None
+    ):
+        self.output_file_handle = output_file_handle
+        self.mapper_obj = mapper_obj
+        self.progress = progress
+        self.state = state
+        self.stats_log = stats_log
+        input_row_count = progress["input_row_count"]
+        self.next_progress_count = (input_row_count // 1000 + 1) * 1000
+        self.next_checkpoint_count = input_row_count + args.checkpoint_rows
 
-        # Compile vessel data into features
-        for vessel_type, curr_country, form_country in zip_longest(
-            vessel_type_list, current_country_flag_list, former_country_flag_list
-        ):
-            vessel_type = self.clean_val(vessel_type)
-            curr_country = self.clean_val(curr_country)
-            form_country = self.clean_val(form_country)
-
-            json_data["FEATURES"].append(
-                {
-                    "VESSEL_TYPE": vessel_type,
-                    "VESSEL_CURRENT_COUNTRY": curr_country,
-                    "VESSEL_FORMER_COUNTRY": form_country,
-                }
+    # ----------------------------------------
+    def __call__(self, batch_result):
+
+        # --write one mapped batch and fold its stats, payloads and counters in
+        (
+            batch_row_count,
+            input_bytes,
+            output_lines,
+            stat_pack,
+            payloads,
+            record_hashes,
+            bad_row_count,
+        ) = batch_result
+        if self.state:
+            output_lines = [
+                output_line
+                for output_line, (record_id, record_hash) in zip(
+                    output_lines, record_hashes
+                )
+                if record_id is None or self.state.changed(record_id, record_hash)
+            ]
+        self.output_file_handle.writelines(output_lines)
+        self.mapper_obj.merge_stat_pack(stat_pack)
+        if payloads:
+            self.mapper_obj.payload_store.add_pending(payloads)
+
+        progress = self.progress
+        progress["input_offset"] += input_bytes
+        progress["input_row_count"] += batch_row_count
+        progress["output_row_count"] += len(output_lines)
+        progress["bad_row_count"] += bad_row_count
+        input_row_count = progress["input_row_count"]
+        if input_row_count >= self.next_progress_count:
+            print(
+                f"{input_row_count} rows processed, "
+                f"{progress['output_row_count']} rows written"
             )
-
-        # Process aircraft information
-        # Process aircraft information as lists
-        aircraft_manufacture_date_date_list = (
-            raw_data.get("aircraft_manufacture_date_date", []) or []
-        )
-        aircraft_manufacture_date_month_list = (
-            raw_data.get("aircraft_manufacture_date_month", []) or []
-        )
-        aircraft_manufacture_date_year_list = (
-            raw_data.get("aircraft_manufacture_date_year", []) or []
-        )
-        aircraft_model = raw_data.get("aircraft_model", "")
-
-        # Compile aircraft data into features
-        for d, m, y, model in zip_longest(
-            aircraft_manufacture_date_date_list,
-            aircraft_manufacture_date_month_list,
-            aircraft_manufacture_date_year_list,
-            aircraft_model,
-            fillvalue="",
-        ):
-            json_data["FEATURES"].append(
-                {
-                    "AIRCRAFT_MANUFACTURE_DATE": self.clean_val(d),
-                    "AIRCRAFT_MANUFACTURE_MONTH": self.clean_val(m),
-                    "AIRCRAFT_MANUFACTURE_YEAR": self.clean_val(y),
-                    "AIRCRAFT_MODEL": self.clean_val(model),
-                }
+            self.next_progress_count = (input_row_count // 1000 + 1) * 1000
+        if args.checkpoint_rows and input_row_count >= self.next_checkpoint_count:
+            save_checkpoint(self.output_file_handle, self.mapper_obj, progress)
+            self.next_checkpoint_count = input_row_count + args.checkpoint_rows
+        stats_log = self.stats_log
+        if stats_log and input_row_count >= stats_log.next_snapshot_count:
+            stats_log.write(
+                self.mapper_obj, input_row_count, progress["output_row_count"]
             )
 
-        # Extract incorporation date information
-        date_of_incorporation_year_list = (
-            raw_data.get("date_of_incorporation_year", []) or []
-        )
-        date_of_incorporation_month_list = (
-            raw_data.get("date_of_incorporation_month", []) or []
-        )
-        date_of_incorporation_date_list = (
-            raw_data.get("date_of_incorporation_date", []) or []
-        )
 
-        # Loop through incorporation date lists using zip_longest
-        for year, month, date in zip_longest(
-            date_of_incorporation_year_list,
-            date_of_incorporation_month_list,
-            date_of_incorporation_date_list,
-            fillvalue="",
-        ):
-            try:
-                y = self.clean_val(year)  # Year
-                m = self.clean_val(month)  # Month
-                d = self.clean_val(date)  # Day
-                # Append the formatted registration date based on available components
-                if y and m and d:
-                    json_data["FEATURES"].append({"REGISTRATION_DATE": f"{y}-{m}-{d}"})
-                elif y and m:
-                    json_data["FEATURES"].append({"REGISTRATION_DATE": f"{y}-{m}"})
-                elif m and d:
-                    json_data["FEATURES"].append({"REGISTRATION_DATE": f"{m}/{d}"})
-                elif y:
-                    json_data["FEATURES"].append({"REGISTRATION_DATE": y})
-            except Exception as ex:
-                print(f"id {raw_data['uid']} date_of_incorporation parse error {ex}")
+# =========================
+class cleaned_record:
 
-        # Extract and append country of incorporation to json_data['FEATURES']
-        country_code_of_incorporation_list = (
-            raw_data.get("country_code_of_incorporation", []) or []
-        )
-        for incorporation_code in country_code_of_incorporation_list:
-            incorporation_code = self.clean_val(incorporation_code)
-            if incorporation_code:
-                json_data["FEATURES"].append(
-                    {"REGISTRATION_COUNTRY": incorporation_code}
-                )
+    # ----------------------------------------
+    def __init__(self, raw_data, mapper_obj):
+        self.raw_data = raw_data
+        self.clean_value = mapper_obj.clean_value
+        self.clean_item = mapper_obj.clean_item
+        self.clean_val = mapper_obj.clean_val
+        self.cleaned = {}
+        self.columns = {}
 
-        # Extract and append country of origin to json_data['FEATURES']
-        country_code_of_origin_list = raw_data.get("country_code_of_origin", []) or []
-        for origin_code in country_code_of_origin_list:
-            origin_code = self.clean_val(origin_code)
-            if origin_code:
-                json_data["FEATURES"].append({"COUNTRY": origin_code})
+    # ----------------------------------------
+    def get(self, attribute, default=None):
 
-        # Extract and append ownership details to json_data['FEATURES']
-        percentage_of_shareholding_list = (
-            raw_data.get("association_percentage_of_shareholding", []) or []
-        )
-        for shareholding in percentage_of_shareholding_list:
-            shareholding = self.clean_val(shareholding)
-            if shareholding:
-                json_data["FEATURES"].append({"OWNERSHIP_DETAILS": shareholding})
-
-        # Process age information
-        age_in_yrs_list = raw_data.get("age", []) or []
-        for age in age_in_yrs_list:
-            age = self.clean_val(age)
-            if age:
-                json_data["FEATURES"].append({"AGE_BRACKET": age})
-
-        # Process contact numbers
-        contact_number_list = raw_data.get("contact_number", []) or []
-        for phone in contact_number_list:
-            phone = self.clean_val(phone)
-            if phone:
-                json_data["FEATURES"].append({"PHONE_NUMBER": phone})
-
-        # Process email addresses
-        email_id_list = raw_data.get("email_id", []) or []
-        for email in email_id_list:
-            email = self.clean_val(email)
-            if email:
-                json_data["FEATURES"].append({"EMAIL_ADDRESS": email})
-
-        # Process website addresses
-        website_list = raw_data.get("website", []) or []
-        for site in website_list:
-            site = self.clean_val(site)
-            if site:
-                json_data["FEATURES"].append({"WEBSITE_ADDRESS": site})
-
-        # Process hair color information
-        color_of_hair_list = raw_data.get("color_of_hair", []) or []
-        for hair_color in color_of_hair_list:
-            hair_color = self.clean_val(hair_color)
-            if hair_color:
-                json_data["FEATURES"].append({"COLOR_HAIR": hair_color})
-
-        # Process eye color information
-        color_of_eyes_list = raw_data.get("color_of_eyes", []) or []
-        for eye_color in color_of_eyes_list:
-            eye_color = self.clean_val(eye_color)
-            if eye_color:
-                json_data["FEATURES"].append({"COLOR_EYES": eye_color})
-
-        # Process height information
-        height_list = raw_data.get("height", []) or []
-        for height in height_list:
-            height = self.clean_val(height)
-            if height:
-                json_data["FEATURES"].append({"HEIGHT": height})
-
-        # Process weight information
-        weight_list = raw_data.get("weight", []) or []
-        for weight in weight_list:
-            weight = self.clean_val(weight)
-            if weight:
-                json_data["FEATURES"].append({"WEIGHT": weight})
-
-        # Process distinguishing marks and characteristics
-        distinguishing_marks_list = (
-            raw_data.get("distinguishing_marks_and_characteristics", []) or []
-        )
-        for mark in distinguishing_marks_list:
-            mark = self.clean_val(mark)
-            if mark:
-                json_data["FEATURES"].append({"DISTINGUISHING_MARKS": mark})
-
-        # Process profile summaries
-        profile_summary_list = raw_data.get("profile_summary", []) or []
-        for summary in profile_summary_list:
-            summary = self.clean_val(summary)
-            if summary:
-                json_data["FEATURES"].append({"PROFILE_SUMMARY": summary})
-
-        # Process ownership details
-        for item in raw_data.get("ownership_details", "").split("|"):
-            if item.strip():
-                json_data["FEATURES"].append({"OWNERSHIP_DETAILS": item.strip()})
-
-        # Process remarks
-        for item in raw_data.get("remarks", "").split("|"):
-            if item.strip():
-                json_data["FEATURES"].append({"REMARKS": item.strip()})
-
-        # Process subject country
-        subject_country_list = raw_data.get("subject_country", []) or []
-        for country in subject_country_list:
-            country = self.clean_val(country)
-            if country:
-                json_data["FEATURES"].append({"SUBJECT_COUNTRY": country})
-
-        # Process official name
-        official_name = self.clean_val(raw_data.get("official_name", ""))
-        if official_name:
-            json_data["FEATURES"].append({"OFFICIAL_NAME": official_name})
-
-        # Process official name in local language
-        official_name_local = self.clean_val(
-            raw_data.get("official_name_in_local_language", "")
-        )
-        if official_name_local:
-            json_data["FEATURES"].append(
-                {"OFFICIAL_NAME_IN_LOCAL_LANGUAGE": official_name_local}
-            )
+        # --same as raw_data.get() once every attribute has been through
+        # --clean_value(), but only the attributes actually read get cleaned
+        if attribute in self.cleaned:
+            return self.cleaned[attribute]
+        if attribute not in self.raw_data:
+            return default
+        value = self.cleaned[attribute] = self.clean_value(self.raw_data[attribute])
+        return value
 
-        # Process ISO code
-        iso_code = self.clean_val(raw_data.get("iso_code", ""))
-        if iso_code:
-            json_data["FEATURES"].append({"ISO_CODE": iso_code})
-
-        # Process abbreviated name
-        abbreviated_name_list = raw_data.get("abbreviated_name", []) or []
-        for name in abbreviated_name_list:
-            name = self.clean_val(name)
-            if name:
-                json_data["FEATURES"].append({"ABBREVIATED_NAME": name})
-
-        # Process official language
-        official_language_list = raw_data.get("official_language", []) or []
-        for lang in official_language_list:
-            lang = self.clean_val(lang)
-            if lang:
-                json_data["FEATURES"].append({"OFFICIAL_LANGUAGE": lang})
-
-        # Process UN LO Code
-        un_lo_code = self.clean_val(raw_data.get("un_locode", ""))
-        if un_lo_code:
-            json_data["FEATURES"].append({"UN_LO_CODE": un_lo_code})
-
-        # Process IATA Code
-        iata_code = self.clean_val(raw_data.get("iata_code", ""))
-        if iata_code:
-            json_data["FEATURES"].append({"IATA_CODE": iata_code})
-
-        # Process International Calling Code
-        intl_calling_code = self.clean_val(
-            raw_data.get("international_calling_code", "")
-        )
-        if intl_calling_code:
-            json_data["FEATURES"].append(
-                {"INTERNATIONAL_CALLING_CODE": intl_calling_code}
-            )
+    # ----------------------------------------
+    def __getitem__(self, attribute):
+        if attribute not in self.raw_data:
+            raise KeyError(attribute)
+        return self.get(attribute)
 
-        # Process fax numbers
-        fax_number_list = raw_data.get("fax_number", []) or []
-        for fax in fax_number_list:
-            fax = self.clean_val(fax)
-            if fax:
-                json_data["FEATURES"].append({"FAX_NUMBER": fax})
-
-        for item in raw_data.get("pep_status", "").split("|"):
-            if item.strip():
-                json_data["FEATURES"].append({"STATUS_PEP": item.strip()})
-
-        # Process PEP remarks
-        pep_remarks_list = raw_data.get("pep_remarks", []) or []
-        for remark in pep_remarks_list:
-            remark = self.clean_val(remark)
-            if remark:
-                json_data["FEATURES"].append({"PEP_REMARKS": remark})
-
-        # Process Sanction remarks
-        sanction_remarks_list = raw_data.get("sanctions_remarks", []) or []
-        for remark in sanction_remarks_list:
-            remark = self.clean_val(remark)
-            if remark:
-                json_data["FEATURES"].append({"SANCTION_REMARKS": remark})
-
-        # Process Watchlist remarks
-        watchlist_remarks_list = raw_data.get("watchlists_remarks", []) or []
-        for remark in watchlist_remarks_list:
-            remark = self.clean_val(remark)
-            if remark:
-                json_data["FEATURES"].append({"WATCHLIST_REMARKS": remark})
-
-        # Process Enforcement remarks
-        enforcement_remarks_list = raw_data.get("enforcement_remarks", []) or []
-        for remark in enforcement_remarks_list:
-            remark = self.clean_val(remark)
-            if remark:
-                json_data["FEATURES"].append({"ENFORCEMENT_REMARKS": remark})
-
-        # Process APC remarks
-        apc_remarks_list = raw_data.get("apc_remarks", []) or []
-        for remark in apc_remarks_list:
-            remark = self.clean_val(remark)
-            if remark:
-                json_data["FEATURES"].append({"APC_REMARKS": remark})
-
-        # Process sanctions status
-        sanctions_status = self.clean_val(raw_data.get("sanctions_status", ""))
-        if sanctions_status:
-            json_data["FEATURES"].append({"STATUS_SANCTION": sanctions_status})
-
-        # Process watchlist status
-        watchlist_status = self.clean_val(raw_data.get("watchlists_status", ""))
-        if watchlist_status:
-            json_data["FEATURES"].append({"STATUS_WATCHLIST": watchlist_status})
-
-        # Process sanctions status
-        apc_status = self.clean_val(raw_data.get("apc_status", ""))
-        if apc_status:
-            json_data["FEATURES"].append({"STATUS_APC": apc_status})
-
-        # Process sanctions status
-        enforcement_status = self.clean_val(raw_data.get("enforcement_status", ""))
-        if enforcement_status:
-            json_data["FEATURES"].append({"STATUS_ENFORCEMENT": enforcement_status})
-
-        # Process update category
-        change_category = self.clean_val(raw_data.get("update_category", ""))
-        if change_category:
-            json_data["FEATURES"].append({"CHANGE_CATEGORY": change_category})
-
-        # Append PEP, sanction, and watchlist statuses to json_data
-        # Function to convert string representations to boolean
-        def str_to_bool(value):
-            if isinstance(value, str):
-                value = value.lower()  # Normalize to lowercase
-                if value in ("true", "t", "1"):
-                    return "True"
-                elif value in ("false", "f", "0"):
-                    return "False"
-            return (
-                "True" if bool(value) else "False"
-            )  # Convert to boolean and return as string
+    # ----------------------------------------
+    def column(self, attribute):
 
-        # Extract and set statuses related to PEP, sanctions, and watchlists
-        json_data["PEP_STATUS"] = str_to_bool(
-            raw_data.get("is_pep", False)
-        )  # Default to False if not found
-        json_data["SANCTION_STATUS"] = str_to_bool(
-            raw_data.get("is_sanction", False)
-        )  # Default to False if not found
-        json_data["WATCHLIST_STATUS"] = str_to_bool(
-            raw_data.get("is_watchlist", False)
-        )  # Default to False if not found
-        json_data["ENFORCEMENT_STATUS"] = str_to_bool(
-            raw_data.get("is_enforcement", False)
-        )  # Default to False if not found
-        json_data["APC_STATUS"] = str_to_bool(
-            raw_data.get("is_apc", False)
-        )  # Default to False if not found
+        # --the items of a list attribute already through clean_val(), i.e.
+        # --[clean_val(x) for x in raw_data.get(attribute, []) or []]
+        if attribute in self.columns:
+            return self.columns[attribute]
+        raw_value = self.raw_data.get(attribute)
+        if isinstance(raw_value, list):
+            clean_item = self.clean_item
+            items = [clean_item(x) for x in raw_value]
+        else:
+            # --a scalar where a list is expected is walked character by character
+            items = [self.clean_val(x) for x in self.get(attribute) or []]
+        self.columns[attribute] = items
+        return items
 
-        # Process sanction information as lists
-        sanction_authority_list = raw_data.get("sanctions_authority", []) or []
-        sanction_authority_country_list = (
-            raw_data.get("sanctions_authority_country", []) or []
-        )
-        sanction_action_date_date_list = (
-            raw_data.get("sanctions_action_date_date", []) or []
-        )
-        sanction_action_date_month_list = (
-            raw_data.get("sanctions_action_date_month", []) or []
-        )
-        sanction_action_date_year_list = (
-            raw_data.get("sanctions_action_date_year", []) or []
-        )
-        sanction_change_date_date_list = (
-            raw_data.get("sanctions_change_date_date", []) or []
-        )
-        sanction_change_date_month_list = (
-            raw_data.get("sanctions_change_date_month", []) or []
-        )
-        sanction_change_date_year_list = (
-            raw_data.get("sanctions_change_date_year", []) or []
-        )
-        sanction_end_date_date_list = raw_data.get("sanctions_end_date_date", []) or []
-        sanction_end_date_month_list = (
-            raw_data.get("sanctions_end_date_month", []) or []
-        )
-        sanction_end_date_year_list = raw_data.get("sanctions_end_date_year", []) or []
-        sanction_legal_action_type_list = (
-            raw_data.get("sanctions_legal_action_type", []) or []
-        )
-        sanction_order_number_list = raw_data.get("sanctions_order_number", []) or []
-        sanction_programme_name_list = (
-            raw_data.get("sanctions_programme_name", []) or []
-        )
-        sanction_programme_country_list = (
-            raw_data.get("sanctions_programme_country", []) or []
-        )
-        sanction_programme_country_code_list = (
-            raw_data.get("sanctions_programme_country_code", []) or []
-        )
-        sanction_authority_ids_list = raw_data.get("sanction_authority_id", []) or []
-        sanction_list_names_list = raw_data.get("sanctions_list_name", []) or []
+    # ----------------------------------------
+    def value(self, attribute):
 
-        # Compile sanction data into features
-        for (
-            sanction_authority,
-            sanction_authority_country,
-            sanction_action_date_date,
-            sanction_action_date_month,
-            sanction_action_date_year,
-            sanction_change_date_date,
-            sanction_change_date_month,
-            sanction_change_date_year,
-            sanction_end_date_date,
-            sanction_end_date_month,
-            sanction_end_date_year,
-            sanction_legal_action_type,
-            sanction_order_number,
-            sanction_programme_name,
-            sanction_programme_country,
-            sanction_programme_country_code,
-            sanction_authority_id,
-            sanction_list_name,
-        ) in zip_longest(
-            sanction_authority_list,
-            sanction_authority_country_list,
-            sanction_action_date_date_list,
-            sanction_action_date_month_list,
-            sanction_action_date_year_list,
-            sanction_change_date_date_list,
-            sanction_change_date_month_list,
-            sanction_change_date_year_list,
-            sanction_end_date_date_list,
-            sanction_end_date_month_list,
-            sanction_end_date_year_list,
-            sanction_legal_action_type_list,
-            sanction_order_number_list,
-            sanction_programme_name_list,
-            sanction_programme_country_list,
-            sanction_programme_country_code_list,
-            sanction_authority_ids_list,
-            sanction_list_names_list,
-        ):
-            sanction_authority = self.clean_val(sanction_authority)
-            sanction_authority_country = self.clean_val(sanction_authority_country)
-            sanction_action_date_date = self.clean_val(sanction_action_date_date)
-            sanction_action_date_month = self.clean_val(sanction_action_date_month)
-            sanction_action_date_year = self.clean_val(sanction_action_date_year)
-            sanction_change_date_date = self.clean_val(sanction_change_date_date)
-            sanction_change_date_month = self.clean_val(sanction_change_date_month)
-            sanction_change_date_year = self.clean_val(sanction_change_date_year)
-            sanction_end_date_date = self.clean_val(sanction_end_date_date)
-            sanction_end_date_month = self.clean_val(sanction_end_date_month)
-            sanction_end_date_year = self.clean_val(sanction_end_date_year)
-            sanction_legal_action_type = self.clean_val(sanction_legal_action_type)
-            sanction_order_number = self.clean_val(sanction_order_number)
-            sanction_programme_name = self.clean_val(sanction_programme_name)
-            sanction_programme_country = self.clean_val(sanction_programme_country)
-            sanction_programme_country_code = self.clean_val(
-                sanction_programme_country_code
-            )
-            sanction_authority_id = self.clean_val(sanction_authority_id)
-            sanction_list_name = self.clean_val(sanction_list_name)
-
-            json_data["FEATURES"].append(
-                {
-                    "SANCTION_AUTHORITY": sanction_authority,
-                    "SANCTION_AUTHORITY_COUNTRY": sanction_authority_country,
-                    "SANCTION_ACTION_DATE_DATE": sanction_action_date_date,
-                    "SANCTION_ACTION_DATE_MONTH": sanction_action_date_month,
-                    "SANCTION_ACTION_DATE_YEAR": sanction_action_date_year,
-                    "SANCTION_CHANGE_DATE_DATE": sanction_change_date_date,
-                    "SANCTION_CHANGE_DATE_MONTH": sanction_change_date_month,
-                    "SANCTION_CHANGE_DATE_YEAR": sanction_change_date_year,
-                    "SANCTION_END_DATE_DATE": sanction_end_date_date,
-                    "SANCTION_END_DATE_MONTH": sanction_end_date_month,
-                    "SANCTION_END_DATE_YEAR": sanction_end_date_year,
-                    "SANCTION_LEGAL_ACTION_TYPE": sanction_legal_action_type,
-                    "SANCTION_ORDER_NUMBER": sanction_order_number,
-                    "SANCTION_PROGRAMME_NAME": sanction_programme_name,
-                    "SANCTION_PROGRAMME_COUNTRY": sanction_programme_country,
-                    "SANCTION_PROGRAMME_COUNTRY_CODE": sanction_programme_country_code,
-                    "SANCTION_AUTHORITY_ID": sanction_authority_id,
-                    "SANCTION_LIST_NAME": sanction_list_name,
-                }
-            )
+        # --a scalar attribute through clean_val(), "" when it is missing
+        if attribute not in self.raw_data:
+            return ""
+        return self.clean_item(self.raw_data[attribute])
 
-        # Process associated individual and entity information as lists
-        associated_individual_name_list = (
-            raw_data.get("association_associated_individual_name", []) or []
-        )
-        associated_individual_position_list = (
-            raw_data.get("association_associated_individual_position", []) or []
-        )
-        associated_entities_name_list = (
-            raw_data.get("association_associated_entities_name", []) or []
-        )
 
-        # Compile associated data into features
-        for (
-            associated_individual_name,
-            associated_individual_position,
-            associated_entities_name,
-        ) in zip_longest(
-            associated_individual_name_list,
-            associated_individual_position_list,
-            associated_entities_name_list,
-        ):
-            associated_individual_name = self.clean_val(associated_individual_name)
-            associated_individual_position = self.clean_val(
-                associated_individual_position
-            )
-            associated_entities_name = self.clean_val(associated_entities_name)
+class stat_slot:
 
-            json_data["FEATURES"].append(
-                {
-                    "ASSOCIATED_INDIVIDUAL_NAME": associated_individual_name,
-                    "ASSOCIATED_INDIVIDUAL_POSITION": associated_individual_position,
-                    "ASSOCIATED_ENTITIES_NAME": associated_entities_name,
-                }
-            )
+    __slots__ = ("count", "examples", "offered", "next_offer", "weight")
 
-        # Extract and append restrictions to json_data['FEATURES']
-        restrictions_list = raw_data.get("restrictions", []) or []
-        for restrictions in restrictions_list:
-            restrictions = self.clean_val(restrictions)
-            if restrictions:
-                json_data["FEATURES"].append({"RESTRICTIONS": restrictions})
-
-        # Extract lists from raw_data related to watchlist information
-        watchlist_authority_list = raw_data.get("watchlists_authority", []) or []
-        watchlist_list_name_list = raw_data.get("watchlists_list_name", []) or []
-        watchlist_list_abbreviation_list = (
-            raw_data.get("watchlists_list_abbreviation", []) or []
-        )
-        watchlist_authority_country_list = (
-            raw_data.get("watchlists_authority_country", []) or []
-        )
-        watchlist_action_date_date_list = (
-            raw_data.get("watchlists_action_date_date", []) or []
-        )
-        watchlist_action_date_month_list = (
-            raw_data.get("watchlists_action_date_month", []) or []
-        )
-        watchlist_action_date_year_list = (
-            raw_data.get("watchlists_action_date_year", []) or []
-        )
-        watchlist_additional_information_list = (
-            raw_data.get("watchlists_additional_information", []) or []
-        )
-        watchlist_list_id_list = raw_data.get("watchlists_list_id", []) or []
+    # ----------------------------------------
+    def __init__(self):
+        self.count = 0
+        self.examples = []
+        self.offered = 0
+        self.next_offer = 0
+        self.weight = 1.0
 
-        # Loop through the watchlist-related lists simultaneously
-        for (
-            watchlist_authority,
-            watchlist_list_name,
-            watchlist_list_abbreviation,
-            watchlist_authority_country,
-            watchlist_action_date_date,
-            watchlist_action_date_month,
-            watchlist_action_date_year,
-            watchlist_additional_information,
-            watchlist_list_id,
-        ) in zip_longest(
-            watchlist_authority_list,
-            watchlist_list_name_list,
-            watchlist_list_abbreviation_list,
-            watchlist_authority_country_list,
-            watchlist_action_date_date_list,
-            watchlist_action_date_month_list,
-            watchlist_action_date_year_list,
-            watchlist_additional_information_list,
-            watchlist_list_id_list,
-        ):
-            watchlist_authority = self.clean_val(watchlist_authority)
-            watchlist_list_name = self.clean_val(watchlist_list_name)
-            watchlist_list_abbreviation = self.clean_val(watchlist_list_abbreviation)
-            watchlist_authority_country = self.clean_val(watchlist_authority_country)
-            watchlist_action_date_date = self.clean_val(watchlist_action_date_date)
-            watchlist_action_date_month = self.clean_val(watchlist_action_date_month)
-            watchlist_action_date_year = self.clean_val(watchlist_action_date_year)
-            watchlist_additional_information = self.clean_val(
-                watchlist_additional_information
-            )
-            watchlist_list_id = self.clean_val(watchlist_list_id)
-
-            # Append each watchlist-related attribute to json_data['FEATURES']
-            json_data["FEATURES"].append(
-                {
-                    "WATCHLIST_AUTHORITY": watchlist_authority,
-                    "WATCHLIST_LIST_NAME": watchlist_list_name,
-                    "WATCHLIST_LIST_ABBREVIATION": watchlist_list_abbreviation,
-                    "WATCHLIST_AUTHORITY_COUNTRY": watchlist_authority_country,
-                    "WATCHLIST_ACTION_DATE_DATE": watchlist_action_date_date,
-                    "WATCHLIST_ACTION_DATE_MONTH": watchlist_action_date_month,
-                    "WATCHLIST_ACTION_DATE_YEAR": watchlist_action_date_year,
-                    "WATCHLIST_ADDITIONAL_INFORMATION": watchlist_additional_information,
-                    "WATCHLIST_LIST_ID": watchlist_list_id,
-                }
-            )
+    # ----------------------------------------
+    def offer(self, example, max_examples):
+
+        # --reservoir sampling (algorithm L): fill the reservoir, then jump
+        # --straight to the next offer that wins a place instead of drawing a
+        # --random number for every example
+        self.offered += 1
+        examples = self.examples
+        if len(examples) < max_examples:
+            if example not in examples:
+                examples.append(example)
+                if len(examples) == max_examples:
+                    self.weight = math.exp(math.log(random.random()) / max_examples)
+                    self.skip_ahead()
+            return
+        if self.offered < self.next_offer:
+            return
+        if example not in examples:
+            examples[random.randrange(max_examples)] = example
+        self.weight *= math.exp(math.log(random.random()) / max_examples)
+        self.skip_ahead()
 
-        # Extract lists from raw_data related to Enforcement information
-        enforcement_legal_action_type_list = (
-            raw_data.get("enforcement_legal_action_type", []) or []
-        )
-        enforcement_legal_action_date_day_list = (
-            raw_data.get("enforcement_legal_action_date_day", []) or []
-        )
-        enforcement_legal_action_date_month_list = (
-            raw_data.get("enforcement_legal_action_date_month", []) or []
-        )
-        enforcement_legal_action_date_year_list = (
-            raw_data.get("enforcement_legal_action_date_year", []) or []
-        )
-        enforcement_imprisonment_or_restriction_list = (
-            raw_data.get("enforcement_imprisonment_or_restriction", []) or []
-        )
-        enforcement_fine_amount_in_local_currency_list = (
-            raw_data.get("enforcement_fine_amount_in_local_currency", []) or []
-        )
-        enforcement_name_of_local_currency_list = (
-            raw_data.get("enforcement_name_of_local_currency", []) or []
-        )
-        enforcement_fine_amount_in_usd_list = (
-            raw_data.get("enforcement_fine_amount_in_usd", []) or []
-        )
-        enforcement_conversion_rate_list = (
-            raw_data.get("enforcement_conversion_rate", []) or []
-        )
-        enforcement_primary_regulators_list = (
-            raw_data.get("enforcement_primary_regulators", []) or []
-        )
-        enforcement_stated_regulations_list = (
-            raw_data.get("enforcement_stated_regulations", []) or []
-        )
-        enforcement_enforcement_list_name_list = (
-            raw_data.get("enforcement_enforcement_list_name", []) or []
-        )
-        enforcement_profile_summary_list = (
-            raw_data.get("enforcement_profile_summary", []) or []
-        )
-        enforcement_reasoning_for_legal_actions_list = (
-            raw_data.get("enforcement_reasoning_for_legal_actions", []) or []
-        )
-        enforcement_taxonomy_list = raw_data.get("enforcement_taxonomy", []) or []
-        enforcement_event_id_list = raw_data.get("enforcement_event_id", []) or []
+    # ----------------------------------------
+    def merge(self, other_examples, share, max_examples):
+
+        # --each merged example stands in for a share of the other side's offers
+        # --so a large worker batch is not outweighed by a small one
+        examples = self.examples
+        for example in other_examples:
+            self.offered += share
+            if len(examples) < max_examples:
+                if example not in examples:
+                    examples.append(example)
+            elif example not in examples:
+                if random.random() * self.offered < max_examples * share:
+                    examples[random.randrange(max_examples)] = example
 
-        # Loop through the Enforcement-related lists simultaneously
-        for (
-            enforcement_legal_action_type,
-            enforcement_legal_action_date_day,
-            enforcement_legal_action_date_month,
-            enforcement_legal_action_date_year,
-            enforcement_imprisonment_or_restriction,
-            enforcement_fine_amount_in_local_currency,
-            enforcement_name_of_local_currency,
-            enforcement_fine_amount_in_usd,
-            enforcement_conversion_rate,
-            enforcement_primary_regulators,
-            enforcement_stated_regulations,
-            enforcement_enforcement_list_name,
-            enforcement_profile_summary,
-            enforcement_reasoning_for_legal_actions,
-            enforcement_taxonomy,
-            enforcement_event_id,
-        ) in zip_longest(
-            enforcement_legal_action_type_list,
-            enforcement_legal_action_date_day_list,
-            enforcement_legal_action_date_month_list,
-            enforcement_legal_action_date_year_list,
-            enforcement_imprisonment_or_restriction_list,
-            enforcement_fine_amount_in_local_currency_list,
-            enforcement_name_of_local_currency_list,
-            enforcement_fine_amount_in_usd_list,
-            enforcement_conversion_rate_list,
-            enforcement_primary_regulators_list,
-            enforcement_stated_regulations_list,
-            enforcement_enforcement_list_name_list,
-            enforcement_profile_summary_list,
-            enforcement_reasoning_for_legal_actions_list,
-            enforcement_taxonomy_list,
-            enforcement_event_id_list,
-        ):
-            enforcement_legal_action_type = self.clean_val(
-                enforcement_legal_action_type
-            )
-            enforcement_legal_action_date_day = self.clean_val(
-                enforcement_legal_action_date_day
-            )
-            enforcement_legal_action_date_month = self.clean_val(
-                enforcement_legal_action_date_month
-            )
-            enforcement_legal_action_date_year = self.clean_val(
-                enforcement_legal_action_date_year
-            )
-            enforcement_imprisonment_or_restriction = self.clean_val(
-                enforcement_imprisonment_or_restriction
-            )
-            enforcement_fine_amount_in_local_currency = self.clean_val(
-                enforcement_fine_amount_in_local_currency
-            )
-            enforcement_name_of_local_currency = self.clean_val(
-                enforcement_name_of_local_currency
-            )
-            enforcement_fine_amount_in_usd = self.clean_val(
-                enforcement_fine_amount_in_usd
-            )
-            enforcement_conversion_rate = self.clean_val(enforcement_conversion_rate)
-            enforcement_primary_regulators = self.clean_val(
-                enforcement_primary_regulators
-            )
-            enforcement_stated_regulations = self.clean_val(
-                enforcement_stated_regulations
+    # ----------------------------------------
+    def skip_ahead(self):
+        try:
+            skip = math.floor(math.log(random.random()) / math.log(1.0 - self.weight))
+        except (ValueError, ZeroDivisionError):
+            skip = 0
+        self.next_offer = self.offered + skip + 1
+
+
+# =========================
+class stats_collector:
+
+    # ----------------------------------------
+    def __init__(self, sample_rate=1.0, max_examples=5, enabled=True):
+        self.sample_rate = sample_rate
+        self.max_examples = max_examples
+        self.enabled = enabled
+        self.categories = {}
+
+    # ----------------------------------------
+    def category(self, cat1):
+        slots = self.categories.get(cat1)
+        if slots is None:
+            slots = self.categories[cat1] = {}
+        return slots
+
+    # ----------------------------------------
+    def slot(self, cat1, cat2):
+        slots = self.category(cat1)
+        slot = slots.get(cat2)
+        if slot is None:
+            slot = slots[cat2] = stat_slot()
+        return slot
+
+    # ----------------------------------------
+    def update(self, cat1, cat2, example=None):
+        if not self.enabled:
+            return
+        slot = self.slot(cat1, cat2)
+        slot.count += 1
+        if example:
+            slot.offer(example, self.max_examples)
+
+    # ----------------------------------------
+    def add_count(self, cat1, cat2, count):
+        if self.enabled and count:
+            self.slot(cat1, cat2).count += count
+
+    # ----------------------------------------
+    def capture_record(self, json_data):
+        if not self.enabled:
+            return
+
+        # --only a sample of records has its mapped attributes walked, the
+        # --skipped ones are counted so the totals can be scaled back up
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self.slot("!STATS_SAMPLE", "SKIPPED").count += 1
+            return
+
+        # --resolve the data source slots once per record rather than per key
+        slots = self.category(json_data.get("DATA_SOURCE", "UNKNOWN_DSRC"))
+        max_examples = self.max_examples
+        for key1, value1 in json_data.items():
+            if type(value1) != list:
+                slot = slots.get(key1)
+                if slot is None:
+                    slot = slots[key1] = stat_slot()
+                slot.count += 1
+                if value1:
+                    slot.offer(value1, max_examples)
+            else:
+                for subrecord in value1:
+                    for key2, value2 in subrecord.items():
+                        slot = slots.get(key2)
+                        if slot is None:
+                            slot = slots[key2] = stat_slot()
+                        slot.count += 1
+                        if value2:
+                            slot.offer(value2, max_examples)
+
+    # ----------------------------------------
+    def stat_pack(self):
+
+        # --materialize the classic {cat1: {cat2: {count, examples}}} layout
+        stat_pack = {}
+        for cat1, slots in self.categories.items():
+            stat_pack[cat1] = {}
+            for cat2, slot in slots.items():
+                stat_pack[cat1][cat2] = {"count": slot.count}
+                if slot.examples:
+                    stat_pack[cat1][cat2]["examples"] = list(slot.examples)
+        return stat_pack
+
+    # ----------------------------------------
+    def merge(self, other_stat_pack):
+
+        # --fold another stat pack (e.g. from a pool worker) into this one
+        for cat1, other_stats in other_stat_pack.items():
+            slots = self.category(cat1)
+            for cat2, other_stat in other_stats.items():
+                slot = slots.get(cat2)
+                if slot is None:
+                    slot = slots[cat2] = stat_slot()
+                slot.count += other_stat["count"]
+                other_examples = other_stat.get("examples") or []
+                if other_examples:
+                    slot.merge(
+                        other_examples,
+                        other_stat["count"] / len(other_examples),
+                        self.max_examples,
+                    )
+
+    # ----------------------------------------
+    def reset(self):
+        self.categories = {}
+
+
+# =========================
+class mapper:
+
+    # ----------------------------------------
+    def __init__(self, data_source, options=None):
+
+        # --everything the mapping needs is passed in, so the class works the same
+        # --embedded in another program as it does under this script
+        unknown_options = sorted(set(options or {}) - set(MAPPER_OPTIONS))
+        if unknown_options:
+            raise ValueError(f"unknown mapper option {', '.join(unknown_options)}")
+        options = {**MAPPER_OPTIONS, **(options or {})}
+        if options["time_groups"] and not options["collect_stats"]:
+            raise ValueError(
+                "time_groups needs collect_stats, the timing is a statistic"
             )
-            enforcement_enforcement_list_name = self.clean_val(
-                enforcement_enforcement_list_name
+        self.data_source = data_source
+        self.options = options
+
+        self.load_reference_data(options["reference_file"])
+        self.codec = json_codec(options["json_backend"])
+        self.stats = stats_collector(
+            options["stats_sample_rate"], enabled=options["collect_stats"]
+        )
+        # --a store opened here from a file name is the mapper's to close, one
+        # --passed in belongs to the caller
+        self.payload_store = options["payload_store"]
+        self.owned_payload_store = None
+        if isinstance(self.payload_store, str):
+            self.payload_store = payload_store(self.payload_store)
+            self.owned_payload_store = self.payload_store
+        self.normalize_short_value = lru_cache(maxsize=NORMALIZE_CACHE_SIZE)(
+            self.normalize_value
+        )
+        self.normalize_cache_captured = {"HITS": 0, "MISSES": 0}
+        self.group_timing = {} if options["time_groups"] else None
+        self.feature_limits = None
+        if options["max_features"] or options["max_feature_bytes"]:
+            self.feature_limits = (
+                options["max_features"],
+                options["max_feature_bytes"],
             )
-            enforcement_profile_summary = self.clean_val(enforcement_profile_summary)
-            enforcement_reasoning_for_legal_actions = self.clean_val(
-                enforcement_reasoning_for_legal_actions
+        self.feature_groups = self.compile_feature_groups(
+            select_feature_groups(
+                FEATURE_GROUPS, options["include_groups"], options["exclude_groups"]
             )
-            enforcement_taxonomy = self.clean_val(enforcement_taxonomy)
-            enforcement_event_id = self.clean_val(enforcement_event_id)
-
-            # Append each Enforcement-related attribute to json_data['FEATURES']
-            json_data["FEATURES"].append(
-                {
-                    "ENFORCEMENT_LEGAL_ACTION_TYPE": enforcement_legal_action_type,
-                    "ENFORCEMENT_LEGAL_ACTION_DATE_DAY": enforcement_legal_action_date_day,
-                    "ENFORCEMENT_LEGAL_ACTION_DATE_MONTH": enforcement_legal_action_date_month,
-                    "ENFORCEMENT_LEGAL_ACTION_DATE_YEAR": enforcement_legal_action_date_year,
-                    "ENFORCEMENT_IMPRISONMENT_OR_RESTRICTION": enforcement_imprisonment_or_restriction,
-                    "ENFORCEMENT_FINE_AMOUNT_IN_LOCAL_CURRENCY": enforcement_fine_amount_in_local_currency,
-                    "ENFORCEMENT_NAME_OF_LOCAL_CURRENCY": enforcement_name_of_local_currency,
-                    "ENFORCEMENT_FINE_AMOUNT_IN_USD": enforcement_fine_amount_in_usd,
-                    "ENFORCEMENT_CONVERSION_RATE": enforcement_conversion_rate,
-                    "ENFORCEMENT_PRIMARY_REGULATORS": enforcement_primary_regulators,
-                    "ENFORCEMENT_STATED_REGULATIONS": enforcement_stated_regulations,
-                    "ENFORCEMENT_ENFORCEMENT_LIST_NAME": enforcement_enforcement_list_name,
-                    "ENFORCEMENT_PROFILE_SUMMARY": enforcement_profile_summary,
-                    "ENFORCEMENT_REASONING_FOR_LEGAL_ACTIONS": enforcement_reasoning_for_legal_actions,
-                    "ENFORCEMENT_TAXONOMY": enforcement_taxonomy,
-                    "ENFORCEMENT_EVENT_ID": enforcement_event_id,
-                }
+        )
+        ignored_keys = None
+        if options["fingerprint_groups"]:
+            ignored_keys = self.feature_keys(FEATURE_GROUPS) - self.feature_keys(
+                select_feature_groups(FEATURE_GROUPS, options["fingerprint_groups"])
             )
+        self.fingerprinter = record_fingerprinter(
+            options["fingerprint_algorithm"], ignored_keys
+        )
 
-        # Extract lists from raw_data related to APC information
-        apc_group_id_list = raw_data.get("apc_group_id", []) or []
-        apc_article_id_list = raw_data.get("apc_article_id", []) or []
-        apc_date_published_list = raw_data.get("date_published_date", []) or []
-        apc_heading_list = raw_data.get("apc_heading", []) or []
-        apc_news_link_list = raw_data.get("apc_news_link", []) or []
-        apc_language_list = raw_data.get("apc_language", []) or []
-        apc_news_provider_list = raw_data.get("apc_news_provider", []) or []
-        apc_sentiment_list = raw_data.get("apc_sentiment", []) or []
-        apc_summary_list = raw_data.get("apc_summary", []) or []
-        apc_source_reputation_list = raw_data.get("apc_source_reputation", []) or []
-        apc_article_text_list = raw_data.get("apc_article_text", []) or []
-        apc_summary_lede_list = raw_data.get("apc_summary_lede", []) or []
-        apc_month_published_list = raw_data.get("date_published_month", []) or []
-        apc_year_published_list = raw_data.get("date_published_year", []) or []
-        apc_frameworks_name_list = raw_data.get("apc_frameworks_name", []) or []
-        apc_frameworks_version_list = raw_data.get("apc_frameworks_version", []) or []
-        apc_risk_score_list = raw_data.get("apc_risk_score", []) or []
-        apc_categories_list = raw_data.get("apc_categories", []) or []
-        apc_risk_areas_list = raw_data.get("apc_risk_areas", []) or []
-        apc_events_list = raw_data.get("apc_events", []) or []
-        apc_keywords_list = raw_data.get("apc_keywords", []) or []
-        apc_event_stage_list = raw_data.get("apc_event_stage", []) or []
-        apc_ner_type_list = raw_data.get("apc_ner_type", []) or []
-        apc_ner_entities_list = raw_data.get("apc_ner_entities", []) or []
-        apc_ner_attributes_list = raw_data.get("apc_ner_attributes", []) or []
-        apc_relevance_score_list = raw_data.get("apc_relevance_score", []) or []
-        apc_locations_list = raw_data.get("apc_locations", []) or []
-        apc_article_category_list = raw_data.get("apc_article_category", []) or []
-        apc_network_map_list = raw_data.get("apc_network_map", []) or []
-        apc_risk_event_list = raw_data.get("apc_risk_event", []) or []
-        apc_event_chronology_list = raw_data.get("apc_event_chronology", []) or []
-        apc_regulatory_action_list = raw_data.get("apc_regulatory_action", []) or []
-        apc_regulator_list = raw_data.get("apc_regulator", []) or []
-        apc_penalty_amount_list = raw_data.get("apc_penalty_amount", []) or []
-
-        # Loop through the APC-related lists simultaneously
-        for (
-            apc_group_id,
-            apc_article_id,
-            apc_date_published,
-            apc_month_published,
-            apc_year_published,
-            apc_heading,
-            apc_news_link,
-            apc_language,
-            apc_news_provider,
-            apc_sentiment,
-            apc_summary,
-            apc_source_reputation,
-            apc_article_text,
-            apc_summary_lede,
-            apc_frameworks_name,
-            apc_frameworks_version,
-            apc_risk_score,
-            apc_categories,
-            apc_risk_areas,
-            apc_events,
-            apc_keywords,
-            apc_event_stage,
-            apc_ner_type,
-            apc_ner_entities,
-            apc_ner_attributes,
-            apc_relevance_score,
-            apc_locations,
-            apc_article_category,
-            apc_network_map,
-            apc_risk_event,
-            apc_event_chronology,
-            apc_regulatory_action,
-            apc_regulator,
-            apc_penalty_amount,
-        ) in zip_longest(
-            apc_group_id_list,
-            apc_article_id_list,
-            apc_date_published_list,
-            apc_month_published_list,
-            apc_year_published_list,
-            apc_heading_list,
-            apc_news_link_list,
-            apc_language_list,
-            apc_news_provider_list,
-            apc_sentiment_list,
-            apc_summary_list,
-            apc_source_reputation_list,
-            apc_article_text_list,
-            apc_summary_lede_list,
-            apc_frameworks_name_list,
-            apc_frameworks_version_list,
-            apc_risk_score_list,
-            apc_categories_list,
-            apc_risk_areas_list,
-            apc_events_list,
-            apc_keywords_list,
-            apc_event_stage_list,
-            apc_ner_type_list,
-            apc_ner_entities_list,
-            apc_ner_attributes_list,
-            apc_relevance_score_list,
-            apc_locations_list,
-            apc_article_category_list,
-            apc_network_map_list,
-            apc_risk_event_list,
-            apc_event_chronology_list,
-            apc_regulatory_action_list,
-            apc_regulator_list,
-            apc_penalty_amount_list,
-        ):
-            json_data["FEATURES"].append(
-                {
-                    "APC_GROUP_ID": self.clean_val(apc_group_id),
-                    "APC_ARTICLE_ID": self.clean_val(apc_article_id),
-                    "APC_DATE_PUBLISHED": self.clean_val(apc_date_published),
-                    "APC_MONTH_PUBLISHED": self.clean_val(apc_month_published),
-                    "APC_YEAR_PUBLISHED": self.clean_val(apc_year_published),
-                    "APC_HEADING": self.clean_val(apc_heading),
-                    "APC_NEWS_LINK": self.clean_val(apc_news_link),
-                    "APC_LANGUAGE": self.clean_val(apc_language),
-                    "APC_NEWS_PROVIDER": self.clean_val(apc_news_provider),
-                    "APC_SENTIMENT": self.clean_val(apc_sentiment),
-                    "APC_SUMMARY": self.clean_val(apc_summary),
-                    "APC_SOURCE_REPUTATION": self.clean_val(apc_source_reputation),
-                    "APC_ARTICLE_TEXT": self.clean_val(apc_article_text),
-                    "APC_SUMMARY_LEDE": self.clean_val(apc_summary_lede),
-                    "APC_FRAMEWORKS_NAME": self.clean_val(apc_frameworks_name),
-                    "APC_FRAMEWORKS_VERSION": self.clean_val(apc_frameworks_version),
-                    "APC_RISK_SCORE": self.clean_val(apc_risk_score),
-                    "APC_CATEGORIES": self.clean_val(apc_categories),
-                    "APC_RISK_AREAS": self.clean_val(apc_risk_areas),
-                    "APC_EVENTS": self.clean_val(apc_events),
-                    "APC_KEYWORDS": self.clean_val(apc_keywords),
-                    "APC_EVENT_STAGE": self.clean_val(apc_event_stage),
-                    "APC_NER_TYPE": self.clean_val(apc_ner_type),
-                    "APC_NER_ENTITIES": self.clean_val(apc_ner_entities),
-                    "APC_NER_ATTRIBUTES": self.clean_val(apc_ner_attributes),
-                    "APC_RELEVANCE_SCORE": self.clean_val(apc_relevance_score),
-                    "APC_LOCATIONS": self.clean_val(apc_locations),
-                    "APC_ARTICLE_CATEGORY": self.clean_val(apc_article_category),
-                    "APC_NETWORK_MAP": self.clean_val(apc_network_map),
-                    "APC_RISK_EVENT": self.clean_val(apc_risk_event),
-                    "APC_EVENT_CHRONOLOGY": self.clean_val(apc_event_chronology),
-                    "APC_REGULATORY_ACTION": self.clean_val(apc_regulatory_action),
-                    "APC_REGULATOR": self.clean_val(apc_regulator),
-                    "APC_PENALTY_AMOUNT": self.clean_val(apc_penalty_amount),
-                }
-            )
+    # ----------------------------------------
+    def map(self, raw_data, input_row_num=None):
+        json_data = {}
 
-        # Extract court-related lists from raw_data safely using ast.literal_eval
-        court_name_list = raw_data.get("litigation_court_name", []) or []
-        number_of_cases_list = raw_data.get("litigation_number_of_cases", []) or []
-        case_number_list = raw_data.get("litigation_case_number", []) or []
-        litigation_date_date_list = raw_data.get("litigation_date_date", []) or []
-        litigation_date_month_list = raw_data.get("litigation_date_month", []) or []
-        litigation_date_year_list = raw_data.get("litigation_date_year", []) or []
+        # Clean the raw data values lazily as the mapping reads them
+        raw_data = cleaned_record(raw_data, self)
 
-        # Loop through court-related lists simultaneously
-        for (
-            court_name,
-            number_of_cases,
-            case_number,
-            litigation_date_date,
-            litigation_date_month,
-            litigation_date_year,
-        ) in zip_longest(
-            court_name_list,
-            number_of_cases_list,
-            case_number_list,
-            litigation_date_date_list,
-            litigation_date_month_list,
-            litigation_date_year_list,
-        ):
-            json_data["FEATURES"].append(
-                {
-                    "LITIGATION_COURT_NAME": self.clean_val(court_name),
-                    "LITIGATION_NUMBER_OF_CASES": self.clean_val(number_of_cases),
-                    "LITIGATION_CASE_NUMBER": self.clean_val(case_number),
-                    "LITIGATION_DATE_DATE": self.clean_val(litigation_date_date),
-                    "LITIGATION_DATE_MONTH": self.clean_val(litigation_date_month),
-                    "LITIGATION_DATE_YEAR": self.clean_val(litigation_date_year),
-                }
-            )
+        json_data["FEATURES"] = (
+            []
+        )  # Initialize the FEATURES list to hold additional attributes
 
-        # Extract lists from raw_data related to pincode information
-        pincode_high_risk_area = self.clean_val(
-            raw_data.get("pincode_high_risk_area", "")
-        )
-        pincode_risk_type = self.clean_val(raw_data.get("pincode_risk_type", ""))
-        pincode_city = self.clean_val(raw_data.get("pincode_city", ""))
-        pincode_district = self.clean_val(raw_data.get("pincode_district", ""))
-        pincode_state = self.clean_val(raw_data.get("pincode_state", ""))
-        pincode_country = self.clean_val(raw_data.get("pincode_country", ""))
-
-        if any(
-            [
-                pincode_high_risk_area,
-                pincode_risk_type,
-                pincode_city,
-                pincode_district,
-                pincode_state,
-                pincode_country,
-            ]
-        ):
-            json_data["FEATURES"].append(
-                {
-                    "PINCODE_HIGH_RISK_AREA": pincode_high_risk_area,
-                    "PINCODE_RISK_TYPE": pincode_risk_type,
-                    "PINCODE_CITY": pincode_city,
-                    "PINCODE_DISTRICT": pincode_district,
-                    "PINCODE_STATE": pincode_state,
-                    "PINCODE_COUNTRY": pincode_country,
-                }
-            )
+        # Set essential fields for the JSON data
+        json_data["RECORD_ID"] = raw_data["uid"]  # Unique identifier for the record
+        json_data["DATA_SOURCE"] = self.data_source  # Source of the data
 
-        # Process others information as lists
-        others_authority_list = raw_data.get("others_authority", []) or []
-        others_list_name_list = raw_data.get("others_list_name", []) or []
-        others_order_list = raw_data.get("others_order", []) or []
-        others_programme_list = raw_data.get("others_programme", []) or []
-        others_event_start_date_date_list = (
-            raw_data.get("others_event_start_date_date", []) or []
-        )
-        others_event_start_date_month_list = (
-            raw_data.get("others_event_start_date_month", []) or []
-        )
-        others_event_start_date_year_list = (
-            raw_data.get("others_event_start_date_year", []) or []
-        )
-        others_event_end_date_date_list = (
-            raw_data.get("others_event_end_date_date", []) or []
+        # Record type is optional, but should be 'PERSON' or 'ORGANIZATION'
+        # --one slot per subject type with uid examples, not one per record
+        self.update_stat(
+            "!SUBJECT_TYPE",
+            raw_data.get("subject_type", "").upper() or "UNKNOWN",
+            raw_data["uid"],
+        )  # Update statistics based on type
+        json_data["RECORD_TYPE"] = (
+            "PERSON"
+            if raw_data.get("subject_type", "") == "Individual"
+            else "ORGANIZATION"
         )
-        others_event_end_date_month_list = (
-            raw_data.get("others_event_end_date_month", []) or []
+        json_data["TYPE"] = raw_data.get(
+            "subject_type"
+        )  # Store the type from raw_data, if available
+
+        # Set primary names
+        json_data["PRIMARY_NAME_FIRST"] = raw_data.get("first_name")  # First name
+        json_data["PRIMARY_NAME_MIDDLE"] = raw_data.get("middle_name")  # Middle name
+        json_data["PRIMARY_NAME_LAST"] = raw_data.get("last_name")  # Last name
+
+        # Primary name of the organization
+        json_data["PRIMARY_NAME_ORG"] = raw_data.get("name")
+
+        # Store deceased status in 'country' field
+        json_data["country"] = raw_data.get("deceased_status", "")
+
+        # Set SOE status based on raw data
+        json_data["soe_status"] = (
+            "Yes" if "Yes" in raw_data.get("soe_status", "") else ""
         )
-        others_event_end_date_year_list = (
-            raw_data.get("others_event_end_date_year", []) or []
+
+        # Add timestamps to json_data
+        json_data["CREATED_AT"] = raw_data["entered"]
+        json_data["UPDATED_AT"] = raw_data["updated"]
+
+        # Extract and set statuses related to PEP, sanctions, and watchlists
+        json_data["PEP_STATUS"] = self.str_to_bool(
+            raw_data.get("is_pep", False)
+        )  # Default to False if not found
+        json_data["SANCTION_STATUS"] = self.str_to_bool(
+            raw_data.get("is_sanction", False)
+        )  # Default to False if not found
+        json_data["WATCHLIST_STATUS"] = self.str_to_bool(
+            raw_data.get("is_watchlist", False)
+        )  # Default to False if not found
+        json_data["ENFORCEMENT_STATUS"] = self.str_to_bool(
+            raw_data.get("is_enforcement", False)
+        )  # Default to False if not found
+        json_data["APC_STATUS"] = self.str_to_bool(
+            raw_data.get("is_apc", False)
+        )  # Default to False if not found
+
+        # Run the compiled feature groups in FEATURE_GROUPS order
+        if self.feature_limits:
+            # --bounded features are pruned as they arrive and nothing after a
+            # --dropped one is kept, so the groups past it are not mapped at all
+            features = bounded_features(*self.feature_limits, self.codec.dumps)
+            for map_group in self.feature_groups:
+                map_group(raw_data, features)
+                if features.dropped_count:
+                    self.update_stat("!TRUNCATED", "RECORDS", json_data["RECORD_ID"])
+                    self.stats.add_count(
+                        "!TRUNCATED", "FEATURES", features.dropped_count
+                    )
+                    break
+            json_data["FEATURES"] = list(features)
+        else:
+            features = json_data["FEATURES"]
+            for map_group in self.feature_groups:
+                map_group(raw_data, features)
+
+        # --remove empty features and attributes and capture the stats
+        self.remove_empty_tags(json_data, prune_features=not self.feature_limits)
+        self.capture_mapped_stats(json_data)
+
+        return json_data
+
+    # ----------------------------------------
+    def map_many(self, input_rows):
+
+        # --map raw records (dicts, or json lines as str or bytes) one by one,
+        # --lines that are not valid json are counted in the stats and skipped
+        for input_row_num, input_row in enumerate(input_rows, 1):
+            if not isinstance(input_row, dict):
+                try:
+                    input_row = self.codec.loads(input_row)
+                except json.JSONDecodeError:
+                    self.update_stat("!INFO", "BAD_JSON", input_row_num)
+                    continue
+            json_data = self.map(input_row, input_row_num)
+            if json_data:
+                yield json_data
+
+    # ----------------------------------------
+    def map_stream(self, input_file_handle, chunk_size=8388608):
+
+        # --map every line of an open json lines file, text or binary
+        if isinstance(input_file_handle, io.TextIOBase):
+            input_lines = (line.rstrip("\n") for line in input_file_handle)
+        else:
+            input_lines = read_lines(input_file_handle, chunk_size)
+        yield from self.map_many(input_lines)
+
+    # ----------------------------------------
+    def fingerprint(self, json_data, encoded_record=None):
+        return self.fingerprinter.fingerprint(json_data, encoded_record)
+
+    # ----------------------------------------
+    def feature_keys(self, feature_groups):
+
+        # --every feature key the given groups can emit
+        feature_keys = set()
+        for spec in feature_groups:
+            if "feature" in spec:
+                feature_keys.add(spec["feature"])
+            for key, _ in spec.get("fields", []):
+                feature_keys.add(key)
+            for key in spec.get("payloads", []):
+                feature_keys.add(key + "_REF")
+            feature_keys.update(spec.get("features", []))
+            if spec.get("method") == "map_identifiers":
+                for template in self.variant_data["IDENTIFIER_TYPES"].values():
+                    feature_keys.update(template)
+                feature_keys.update(OTHER_IDENTIFIER_TYPE)
+        return feature_keys
+
+    # ----------------------------------------
+    def compile_feature_groups(self, feature_groups):
+
+        # --turn the declarative FEATURE_GROUPS spec into one closure per group
+        # --so map() does no per record interpretation of the spec
+        compiled_groups = []
+        for spec in feature_groups:
+            compile_group = getattr(self, "compile_" + spec["kind"] + "_group")
+            map_group = compile_group(spec)
+            if self.group_timing is not None:
+                map_group = self.time_group(spec["group"], map_group)
+            compiled_groups.append(map_group)
+        return compiled_groups
+
+    # ----------------------------------------
+    def time_group(self, group, map_group):
+
+        # --only wrapped around the groups when timing is on, so map() runs the
+        # --bare closures and pays nothing for it otherwise
+        timing = self.group_timing.setdefault(group, [0, 0, 0])
+        perf_counter_ns = time.perf_counter_ns
+
+        def timed_group(raw_data, features):
+            feature_count = len(features)
+            start_ns = perf_counter_ns()
+            map_group(raw_data, features)
+            timing[0] += 1
+            timing[1] += perf_counter_ns() - start_ns
+            timing[2] += len(features) - feature_count
+
+        return timed_group
+
+    # ----------------------------------------
+    def compile_value_group(self, spec):
+        feature, column = spec["feature"], spec["column"]
+
+        def map_group(raw_data, features):
+            value = raw_data.value(column)
+            if value:
+                features.append({feature: value})
+
+        return map_group
+
+    # ----------------------------------------
+    def compile_list_group(self, spec):
+        feature, column = spec["feature"], spec["column"]
+
+        def map_group(raw_data, features):
+            for value in raw_data.column(column):
+                if value:
+                    features.append({feature: value})
+
+        return map_group
+
+    # ----------------------------------------
+    def compile_split_group(self, spec):
+        feature, column = spec["feature"], spec["column"]
+
+        def map_group(raw_data, features):
+            for item in raw_data.get(column, "").split("|"):
+                if item.strip():
+                    features.append({feature: item.strip()})
+
+        return map_group
+
+    # ----------------------------------------
+    def compile_date_group(self, spec):
+        feature, columns = spec["feature"], spec["columns"]
+        required = spec.get("required")
+
+        def map_group(raw_data, features):
+            if required and not raw_data.get(required, ""):
+                return
+            date_lists = [raw_data.column(column) for column in columns]
+            for year, month, date in zip_longest(*date_lists, fillvalue=""):
+                value = compose_date(year, month, date)
+                if value:
+                    features.append({feature: value})
+
+        return map_group
+
+    # ----------------------------------------
+    def compile_zip_group(self, spec):
+        keys = tuple(key for key, _ in spec["fields"])
+        columns = tuple(column for _, column in spec["fields"])
+        if self.payload_store and spec.get("payloads"):
+            return self.compile_payload_zip_group(spec, keys, columns)
+
+        def map_group(raw_data, features):
+            column_lists = [raw_data.column(column) for column in columns]
+            if not any(column_lists):
+                return
+            for values in zip_longest(*column_lists, fillvalue=""):
+                features.append(dict(zip(keys, values)))
+
+        return map_group
+
+    # ----------------------------------------
+    def compile_payload_zip_group(self, spec, keys, columns):
+        store_payload = self.payload_store.put
+        payload_indexes = frozenset(
+            index for index, key in enumerate(keys) if key in spec["payloads"]
         )
-        others_associated_subject_type_list = (
-            raw_data.get("others_associated_subject_type", []) or []
+        keys = tuple(
+            key + "_REF" if index in payload_indexes else key
+            for index, key in enumerate(keys)
         )
-        others_event_summary_list = raw_data.get("others_event_summary", []) or []
-        others_reasoning_taxonomy_list = (
-            raw_data.get("others_reasoning_taxonomy", []) or []
+
+        def map_group(raw_data, features):
+            column_lists = [raw_data.column(column) for column in columns]
+            if not any(column_lists):
+                return
+            for values in zip_longest(*column_lists, fillvalue=""):
+                values = list(values)
+                for index in payload_indexes:
+                    if values[index]:
+                        values[index] = store_payload(values[index])
+                features.append(dict(zip(keys, values)))
+
+        return map_group
+
+    # ----------------------------------------
+    def compile_fields_group(self, spec):
+        fields = tuple(spec["fields"])
+
+        def map_group(raw_data, features):
+            features.append({key: raw_data.value(column) for key, column in fields})
+
+        return map_group
+
+    # ----------------------------------------
+    def compile_method_group(self, spec):
+        return getattr(self, spec["method"])
+
+    # ----------------------------------------
+    def map_aliases(self, raw_data, features):
+
+        # Check if 'alias_name' exists in the raw data
+        if not raw_data.get("alias_name"):
+            return
+
+        alias_name_key = (
+            "ALIAS_NAME_FULL"
+            if raw_data.get("subject_type", "") == "Individual"
+            else "ALIAS_NAME_ORG"
         )
 
-        # Loop through the lists simultaneously and clean values
+        # Iterate through the alias lists simultaneously
+        for alias_name, alias_type, alias_script, alias_language in zip_longest(
+            raw_data.column("alias_name"),
+            raw_data.column("alias_type"),
+            raw_data.column("alias_script"),
+            raw_data.column("alias_language"),
+            fillvalue="",
+        ):
+            if alias_name:  # Ensure alias_name is not empty
+                features.append(
+                    {
+                        alias_name_key: alias_name,
+                        "ALIAS_TYPE": alias_type,
+                        "ALIAS_SCRIPT": alias_script,
+                        "ALIAS_LANGUAGE": alias_language,
+                    }
+                )
+
+    # ----------------------------------------
+    def map_relationships(self, raw_data, features):
+
+        # Append relationship details to json_data
+        for rel_subject_type, rel_name, rel_type, rel_type_desc, rel_uid in zip_longest(
+            raw_data.column("association_subject_type"),
+            raw_data.column("association_name"),
+            raw_data.column("association_relationship_type"),
+            raw_data.column("association_relationship_type_description"),
+            raw_data.column("association_relationship_uid"),
+            fillvalue="",
+        ):
+            try:
+                # Always append the base relationship record
+                features.append(
+                    {
+                        "RELATIONSHIP_SUBJECT_TYPE": rel_subject_type,
+                        "RELATIONSHIP_NAME": rel_name,
+                        "RELATIONSHIP_TYPE": rel_type,
+                        "RELATIONSHIP_TYPE_DESCRIPTION": rel_type_desc,
+                        "RELATIONSHIP_UID": rel_uid,
+                    }
+                )
+
+                # Append relationship pointers if we have a UID, as one unit so
+                # a feature limit keeps or drops the whole pointer
+                if rel_uid:
+                    pointer = [
+                        {"REL_POINTER_KEY": rel_uid},
+                        {"REL_ANCHOR_DOMAIN": self.data_source + "_UID"},
+                        {"REL_ANCHOR_KEY": raw_data["uid"]},
+                    ]
+                    if rel_type:
+                        pointer.append({"REL_POINTER_ROLE": rel_type})
+                    features.extend(pointer)
+
+            except Exception as ex:
+                print(f"id {raw_data.get('uid')} relationship parse error {ex}")
+
+    # ----------------------------------------
+    def map_identifiers(self, raw_data, features):
+
         for (
-            others_authority,
-            others_list_name,
-            others_order,
-            others_programme,
-            others_event_start_date_date,
-            others_event_start_date_month,
-            others_event_start_date_year,
-            others_event_end_date_date,
-            others_event_end_date_month,
-            others_event_end_date_year,
-            others_associated_subject_type,
-            others_event_summary,
-            others_reasoning_taxonomy,
+            raw_type,
+            value,
+            country,
+            country_code,
+            issuing_authority,
+            issue_y,
+            issue_m,
+            issue_d,
+            expiry_y,
+            expiry_m,
+            expiry_d,
         ) in zip_longest(
-            others_authority_list,
-            others_list_name_list,
-            others_order_list,
-            others_programme_list,
-            others_event_start_date_date_list,
-            others_event_start_date_month_list,
-            others_event_start_date_year_list,
-            others_event_end_date_date_list,
-            others_event_end_date_month_list,
-            others_event_end_date_year_list,
-            others_associated_subject_type_list,
-            others_event_summary_list,
-            others_reasoning_taxonomy_list,
+            raw_data.column("identifier_name"),
+            raw_data.column("identifier_value"),
+            raw_data.column("identifier_country"),
+            raw_data.column("identifier_country_code"),
+            raw_data.column("identifier_issuing_authority"),
+            raw_data.column("identifier_issue_date_year"),
+            raw_data.column("identifier_issue_date_month"),
+            raw_data.column("identifier_issue_date_date"),
+            raw_data.column("identifier_expiry_date_year"),
+            raw_data.column("identifier_expiry_date_month"),
+            raw_data.column("identifier_expiry_date_date"),
+            fillvalue="",
         ):
-            json_data["FEATURES"].append(
-                {
-                    "OTHERS_AUTHORITY": self.clean_val(others_authority),
-                    "OTHERS_LIST_NAME": self.clean_val(others_list_name),
-                    "OTHERS_ORDER": self.clean_val(others_order),
-                    "OTHERS_PROGRAMME": self.clean_val(others_programme),
-                    "OTHERS_EVENT_START_DATE_DATE": self.clean_val(
-                        others_event_start_date_date
-                    ),
-                    "OTHERS_EVENT_START_DATE_MONTH": self.clean_val(
-                        others_event_start_date_month
-                    ),
-                    "OTHERS_EVENT_START_DATE_YEAR": self.clean_val(
-                        others_event_start_date_year
-                    ),
-                    "OTHERS_EVENT_END_DATE_DATE": self.clean_val(
-                        others_event_end_date_date
-                    ),
-                    "OTHERS_EVENT_END_DATE_MONTH": self.clean_val(
-                        others_event_end_date_month
-                    ),
-                    "OTHERS_EVENT_END_DATE_YEAR": self.clean_val(
-                        others_event_end_date_year
-                    ),
-                    "OTHERS_ASSOCIATED_SUBJECT_TYPE": self.clean_val(
-                        others_associated_subject_type
-                    ),
-                    "OTHERS_EVENT_SUMMARY": self.clean_val(others_event_summary),
-                    "OTHERS_REASONING_TAXONOMY": self.clean_val(
-                        others_reasoning_taxonomy
-                    ),
-                }
-            )
+            try:
+                raw_type = raw_type.upper()
+                value = value.upper().lstrip("0")
+                identifier_issue_date = compose_date(issue_y, issue_m, issue_d)
+                identifier_expiry_date = compose_date(expiry_y, expiry_m, expiry_d)
 
-        # Remove empty dictionaries or dictionaries with only empty values
-        json_data["FEATURES"] = [
-            item
-            for item in json_data["FEATURES"]
-            if any(value for value in item.values() if value not in [None, "", [], {}])
-        ]
+                # Update statistics for identifier type
+                self.update_stat("!IDTYPE", raw_type, value)
 
-        # --remove empty attributes and capture the stats
-        json_data = self.remove_empty_tags(json_data)
-        self.capture_mapped_stats(json_data)
+                # Append identifier details based on type
+                build_identifier = self.identifier_builders.get(
+                    raw_type, self.other_identifier_builder
+                )
+                features.append(
+                    build_identifier(
+                        {
+                            "raw_type": raw_type,
+                            "value": value,
+                            "country": country,
+                            "country_code": country_code,
+                            "issuing_authority": issuing_authority,
+                            "issue_date": identifier_issue_date,
+                            "expiry_date": identifier_expiry_date,
+                        }
+                    )
+                )
+            except Exception as ex:
+                print(
+                    f"id {raw_data['uid']} identifier parse error {ex}"
+                )  # Log any parsing errors
 
-        return json_data
+    # ----------------------------------------
+    def str_to_bool(self, value):
+
+        # Function to convert string representations to boolean
+        if isinstance(value, str):
+            value = value.lower()  # Normalize to lowercase
+            if value in ("true", "t", "1"):
+                return "True"
+            elif value in ("false", "f", "0"):
+                return "False"
+        return (
+            "True" if bool(value) else "False"
+        )  # Convert to boolean and return as string
 
     # ----------------------------------------
-    def load_reference_data(self):
+    def load_reference_data(self, reference_file=None):
 
         # --garabage values
         self.variant_data = {}
-        self.variant_data["GARBAGE_VALUES"] = ["NULL", "NUL", "N/A", "~"]
+        garbage_values = ["NULL", "NUL", "N/A", "~"]
+        self.variant_data["IDENTIFIER_TYPES"] = dict(IDENTIFIER_TYPES)
+
+        # --optional json file extending the built in tables
+        if reference_file:
+            with open(reference_file, "r", encoding="utf-8") as file_handle:
+                reference_data = json.load(file_handle)
+            if not isinstance(reference_data, dict):
+                raise ValueError("it must hold a JSON object")
+            reference_garbage_values = reference_data.get("GARBAGE_VALUES", [])
+            if not isinstance(reference_garbage_values, list):
+                raise ValueError("GARBAGE_VALUES must be a list")
+            for garbage_value in reference_garbage_values:
+                if not isinstance(garbage_value, str):
+                    raise ValueError(f"garbage value {garbage_value!r} is not a string")
+                garbage_values.append(garbage_value.upper())
+            reference_identifier_types = reference_data.get("IDENTIFIER_TYPES", {})
+            if not isinstance(reference_identifier_types, dict):
+                raise ValueError("IDENTIFIER_TYPES must be an object")
+            for raw_type, template in reference_identifier_types.items():
+                self.variant_data["IDENTIFIER_TYPES"][raw_type.upper()] = template
+
+        self.variant_data["GARBAGE_VALUES"] = frozenset(garbage_values)
+
+        # --identifier type -> feature builder dispatch table
+        self.identifier_builders = {
+            raw_type: self.compile_identifier_builder(template)
+            for raw_type, template in self.variant_data["IDENTIFIER_TYPES"].items()
+        }
+        self.other_identifier_builder = self.compile_identifier_builder(
+            OTHER_IDENTIFIER_TYPE
+        )
+
+    # ----------------------------------------
+    def compile_identifier_builder(self, template):
+        if not isinstance(template, dict):
+            raise ValueError(f"identifier template {template!r} is not an object")
+        fields = []
+        for key, source in template.items():
+            if not isinstance(source, str):
+                raise ValueError(
+                    f"identifier template value {source!r} is not a string"
+                )
+            if source.startswith("$"):
+                if source[1:] not in IDENTIFIER_FIELDS:
+                    raise ValueError(f"unknown identifier field {source} for {key}")
+                fields.append((key, source[1:], True))
+            else:
+                fields.append((key, source, False))
+
+        def build_identifier(values):
+            return {
+                key: values[source] if is_field else source
+                for key, source, is_field in fields
+            }
+
+        return build_identifier
+
+    # -----------------------------------
+    def clean_value(self, raw_value):
+        if isinstance(raw_value, list):
+            # clean each element in the list
+            return [self.clean_value(x) for x in raw_value]
+        return self.clean_item(raw_value)
 
     # -----------------------------------
-    def clean_value(self, raw_value):
+    def clean_item(self, raw_value):
+
+        # --clean_val(clean_value(x)) in one step, used directly on list items
         if raw_value is None:
             return ""
         if isinstance(raw_value, list):
-            # clean each element in the list
-            return [self.clean_value(x) for x in raw_value]
+            return self.clean_val(self.clean_value(raw_value))
         # If it's a single value, clean as before
+        if (
+            raw_value.__class__ is str
+            and len(raw_value) <= NORMALIZE_CACHE_MAX_LENGTH
+        ):
+            return self.normalize_short_value(raw_value)
+        return self.normalize_value(raw_value)
+
+    # -----------------------------------
+    def normalize_value(self, raw_value):
         new_value = " ".join(str(raw_value).strip().split())
         if new_value.upper() in self.variant_data["GARBAGE_VALUES"]:
             return ""
         return new_value
 
+    # -----------------------------------
+    def capture_counter_stats(self):
+
+        # --fold the normalize cache hits and misses since the last capture into
+        # --the stats so they can be merged across workers like any other count
+        cache_info = self.normalize_short_value.cache_info()
+        for cat2, total in (("HITS", cache_info.hits), ("MISSES", cache_info.misses)):
+            self.stats.add_count(
+                "!NORMALIZE_CACHE", cat2, total - self.normalize_cache_captured[cat2]
+            )
+            self.normalize_cache_captured[cat2] = total
+
+        # --same for the group timing, calls, microseconds and features emitted
+        # --are counted per group and the leftover nanoseconds carried over
+        for group, timing in (self.group_timing or {}).items():
+            self.stats.add_count("!GROUP_CALLS", group, timing[0])
+            self.stats.add_count("!GROUP_MICROSECONDS", group, timing[1] // 1000)
+            self.stats.add_count("!GROUP_FEATURES", group, timing[2])
+            timing[:] = [0, timing[1] % 1000, 0]
+
     # -----------------------------------
     def compute_record_hash(self, target_dict, attr_list=None):
         if attr_list:
@@ -1770,6 +2025,8 @@ class mapper:
 
     # ----------------------------------------
     def format_date(self, raw_date):
+        from dateutil.parser import parse as dateparse
+
         try:
             return datetime.strftime(dateparse(raw_date), "%Y-%m-%d")
         except:
@@ -1777,54 +2034,66 @@ class mapper:
             return ""
 
     # ----------------------------------------
-    def remove_empty_tags(self, d):
-        if isinstance(d, dict):
-            for k, v in list(d.items()):
-                if v is None or len(str(v).strip()) == 0:
-                    del d[k]
-                else:
-                    self.remove_empty_tags(v)
-        if isinstance(d, list):
-            for v in d:
-                self.remove_empty_tags(v)
-        return d
+    def remove_empty_tags(self, json_data, prune_features=True):
+
+        # --the output is exactly two levels deep: top level attributes and the
+        # --FEATURES dictionaries, so prune both in one pass without recursing
+        empty_keys = [key for key, value in json_data.items() if is_empty_tag(value)]
+        for key in empty_keys:
+            del json_data[key]
+        if not prune_features:
+            return json_data
+
+        # --drop features with no non-empty value, then any empty keys they carry
+        features = []
+        for item in json_data.get("FEATURES", []):
+            if not any(item.values()):
+                continue
+            for value in item.values():
+                if is_empty_tag(value):
+                    item = {
+                        key: value
+                        for key, value in item.items()
+                        if not is_empty_tag(value)
+                    }
+                    break
+            features.append(item)
+        if "FEATURES" in json_data:
+            json_data["FEATURES"] = features
+        return json_data
 
     # ----------------------------------------
     def update_stat(self, cat1, cat2, example=None):
+        self.stats.update(cat1, cat2, example)
 
-        if cat1 not in self.stat_pack:
-            self.stat_pack[cat1] = {}
-        if cat2 not in self.stat_pack[cat1]:
-            self.stat_pack[cat1][cat2] = {}
-            self.stat_pack[cat1][cat2]["count"] = 0
+    # ----------------------------------------
+    def merge_stat_pack(self, other_stat_pack):
 
-        self.stat_pack[cat1][cat2]["count"] += 1
-        if example:
-            if "examples" not in self.stat_pack[cat1][cat2]:
-                self.stat_pack[cat1][cat2]["examples"] = []
-            if example not in self.stat_pack[cat1][cat2]["examples"]:
-                if len(self.stat_pack[cat1][cat2]["examples"]) < 5:
-                    self.stat_pack[cat1][cat2]["examples"].append(example)
-                else:
-                    randomSampleI = random.randint(2, 4)
-                    self.stat_pack[cat1][cat2]["examples"][randomSampleI] = example
-        return
+        # --fold another mapper's stats (e.g. from a pool worker) into this one
+        self.stats.merge(other_stat_pack)
 
     # ----------------------------------------
     def capture_mapped_stats(self, json_data):
+        self.stats.capture_record(json_data)
 
-        if "DATA_SOURCE" in json_data:
-            data_source = json_data["DATA_SOURCE"]
-        else:
-            data_source = "UNKNOWN_DSRC"
+    # ----------------------------------------
+    @property
+    def stat_pack(self):
+        return self.stats.stat_pack()
 
-        for key1 in json_data:
-            if type(json_data[key1]) != list:
-                self.update_stat(data_source, key1, json_data[key1])
-            else:
-                for subrecord in json_data[key1]:
-                    for key2 in subrecord:
-                        self.update_stat(data_source, key2, subrecord[key2])
+    # ----------------------------------------
+    def close(self):
+        if self.owned_payload_store:
+            self.owned_payload_store.close()
+            self.owned_payload_store = None
+
+    # ----------------------------------------
+    def __enter__(self):
+        return self
+
+    # ----------------------------------------
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     # ----------------------------------------
     def clean_val(self, value):
@@ -1842,6 +2111,53 @@ class mapper:
             return ""
 
 
+# ----------------------------------------
+def is_empty_tag(value):
+
+    # --same test as str(value).strip() == "" without serializing whole
+    # --lists or dictionaries just to find out they are not blank
+    if value is None:
+        return True
+    if value.__class__ is str:
+        return not value.strip()
+    if isinstance(value, (list, dict, tuple, bool, int, float)):
+        return False
+    return not str(value).strip()
+
+
+# ----------------------------------------
+def select_feature_groups(feature_groups, include_groups=None, exclude_groups=None):
+
+    # --project the spec down to the wanted groups before it is compiled, so the
+    # --columns of a skipped group are never read, cleaned or counted
+    group_names = {spec["group"] for spec in feature_groups}
+    unknown_groups = sorted(
+        set(include_groups or []).union(exclude_groups or []) - group_names
+    )
+    if unknown_groups:
+        raise ValueError(f"unknown feature group {', '.join(unknown_groups)}")
+    return [
+        spec
+        for spec in feature_groups
+        if (not include_groups or spec["group"] in include_groups)
+        and spec["group"] not in (exclude_groups or [])
+    ]
+
+
+# ----------------------------------------
+def compose_date(y, m, d):
+    # Construct a date based on the available components
+    if y and m and d:
+        return f"{y}-{m}-{d}"
+    elif y and m:
+        return f"{y}-{m}"
+    elif m and d:
+        return f"{m}/{d}"
+    elif y:
+        return y
+    return ""
+
+
 # ----------------------------------------
 def signal_handler(signal, frame):
     print("USER INTERUPT! Shutting down ... (please wait)")
@@ -1850,6 +2166,493 @@ def signal_handler(signal, frame):
     return
 
 
+# ----------------------------------------
+def init_worker(worker_args, in_process=False):
+    # --each pool worker owns its own mapper; the parent handles interrupts
+    global args, worker_mapper, worker_codec
+    if not in_process:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    args = worker_args
+    worker_mapper = mapper(
+        args.data_source,
+        mapper_options(args, payload_store() if args.payload_store else None),
+    )
+    worker_codec = json_codec(args.json_backend)
+    if args.mmap:
+        global worker_input_map
+        worker_input_map = map_input_file(args.input_file)
+
+
+# ----------------------------------------
+def mapper_options(args, store=None):
+    return {
+        "reference_file": args.reference_file,
+        "json_backend": args.json_backend,
+        "stats_sample_rate": args.stats_sample_rate,
+        "collect_stats": not args.no_stats,
+        "payload_store": store,
+        "include_groups": args.include_groups,
+        "exclude_groups": args.exclude_groups,
+        "fingerprint_algorithm": args.fingerprint_algorithm,
+        "fingerprint_groups": args.fingerprint_groups,
+        "time_groups": args.time_groups,
+        "max_features": args.max_features,
+        "max_feature_bytes": args.max_feature_bytes,
+    }
+
+
+# ----------------------------------------
+def map_batch(batch):
+    start_row_num, lines = batch
+    output_lines = []
+    record_hashes = []
+    bad_row_count = 0
+    for input_row_num, line in enumerate(lines, start_row_num):
+        try:
+            input_row = worker_codec.loads(line)
+        except json.JSONDecodeError as e:
+            print(f"Skipping line {input_row_num} due to JSON parse error: {e}")
+            bad_row_count += 1
+            continue
+
+        json_data = worker_mapper.map(input_row, input_row_num)
+        if json_data:
+            output_line = worker_codec.dumps(json_data)
+            output_lines.append(output_line)
+            if args.state_index:
+                record_hashes.append(
+                    (
+                        json_data.get("RECORD_ID"),
+                        worker_mapper.fingerprint(json_data, output_line),
+                    )
+                )
+
+    # --hand back only the stats for this batch so the parent can merge them
+    worker_mapper.capture_counter_stats()
+    stat_pack = worker_mapper.stat_pack
+    worker_mapper.stats.reset()
+    payloads = {}
+    if worker_mapper.payload_store:
+        payloads = worker_mapper.payload_store.take_pending()
+    input_bytes = sum(len(line) + 1 for line in lines)
+    return (
+        len(lines),
+        input_bytes,
+        output_lines,
+        stat_pack,
+        payloads,
+        record_hashes,
+        bad_row_count,
+    )
+
+
+# ----------------------------------------
+def map_mapped_batch(batch):
+    # --the batch is only a byte range, each worker slices the lines out of its
+    # --own mapping of the input so they share the page cache and nothing is pickled
+    start_row_num, start_offset, end_offset = batch
+    lines = list(
+        read_mapped_lines(
+            worker_input_map,
+            start_offset,
+            end_offset,
+            worker_codec.accepts_memoryview,
+        )
+    )
+    return map_batch((start_row_num, lines))
+
+
+# ----------------------------------------
+def detect_compression(file_name, check_magic=False):
+    if check_magic:
+        with open(file_name, "rb") as file_handle:
+            file_start = file_handle.read(6)
+        for magic, compression in COMPRESSION_MAGIC.items():
+            if file_start.startswith(magic):
+                return compression
+    return COMPRESSION_EXTENSIONS.get(os.path.splitext(file_name)[1].lower())
+
+
+# ----------------------------------------
+def import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        print("\nPlease install the zstandard module to read or write .zst files\n")
+        sys.exit(1)
+    return zstandard
+
+
+# ----------------------------------------
+def open_input_file(file_name):
+    # --compressed input is decompressed as a stream, never to disk
+    compression = detect_compression(file_name, check_magic=True)
+    if compression == "gzip":
+        return gzip.open(file_name, "rb")
+    if compression == "bz2":
+        return bz2.open(file_name, "rb")
+    if compression == "xz":
+        return lzma.open(file_name, "rb")
+    if compression == "zstd":
+        decompressor = import_zstandard().ZstdDecompressor()
+        return decompressor.stream_reader(
+            open(file_name, "rb"), read_across_frames=True
+        )
+    return open(file_name, "rb")
+
+
+# ----------------------------------------
+def open_output_file(
+    file_name, compress_level=None, compress_threads=0, resume_offset=None
+):
+    # --a resumed run drops whatever was written after its checkpoint and appends
+    if resume_offset is not None:
+        file_handle = open(file_name, "r+b")
+        file_handle.truncate(resume_offset)
+        file_handle.seek(resume_offset)
+        return file_handle
+    compression = detect_compression(file_name)
+    if compression and compress_level is None:
+        compress_level = COMPRESSION_DEFAULT_LEVELS[compression]
+    if compression == "gzip":
+        return gzip.open(file_name, "wb", compresslevel=compress_level)
+    if compression == "bz2":
+        return bz2.open(file_name, "wb", compresslevel=compress_level)
+    if compression == "xz":
+        return lzma.open(file_name, "wb", preset=compress_level)
+    if compression == "zstd":
+        zstandard = import_zstandard()
+        compressor = zstandard.ZstdCompressor(
+            level=compress_level, threads=compress_threads
+        )
+        return compressor.stream_writer(open(file_name, "wb"))
+    return open(file_name, "wb")
+
+
+# ----------------------------------------
+def read_lines(input_file_handle, chunk_size, byte_limit=None):
+    # --split large raw byte chunks on newlines, the decoders take bytes as is
+    remainder = b""
+    while True:
+        if byte_limit is not None:
+            chunk = input_file_handle.read(min(chunk_size, byte_limit))
+            byte_limit -= len(chunk)
+        else:
+            chunk = input_file_handle.read(chunk_size)
+        if not chunk:
+            break
+        lines = (remainder + chunk).split(b"\n")
+        remainder = lines.pop()
+        yield from lines
+    if remainder:
+        yield remainder
+
+
+# ----------------------------------------
+def map_input_file(file_name):
+    # --the mapping is never closed, line memoryviews may outlive the loop
+    with open(file_name, "rb") as file_handle:
+        if os.fstat(file_handle.fileno()).st_size == 0:
+            return b""
+        input_map = mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(input_map, "madvise"):
+        input_map.madvise(mmap.MADV_SEQUENTIAL)
+    return input_map
+
+
+# ----------------------------------------
+def read_mapped_lines(input_map, start_offset, end_offset, as_memoryview=False):
+    # --same lines as read_lines, sliced out of the mapping without a read buffer
+    lines = memoryview(input_map) if as_memoryview else input_map
+    find = input_map.find
+    position = start_offset
+    while position < end_offset:
+        line_end = find(b"\n", position, end_offset)
+        if line_end < 0:
+            yield lines[position:end_offset]
+            break
+        yield lines[position:line_end]
+        position = line_end + 1
+
+
+# ----------------------------------------
+def read_mapped_batches(
+    input_map, start_offset, end_offset, batch_size, start_row_num=1
+):
+    # --newline aligned byte ranges of batch_size lines for map_mapped_batch
+    find = input_map.find
+    position = start_offset
+    while position < end_offset and not shut_down:
+        batch_start = position
+        row_count = 0
+        while row_count < batch_size and position < end_offset:
+            line_end = find(b"\n", position, end_offset)
+            position = end_offset if line_end < 0 else line_end + 1
+            row_count += 1
+        yield start_row_num, batch_start, position
+        start_row_num += row_count
+
+
+# ----------------------------------------
+def parse_shard(shard):
+    try:
+        shard_number, shard_count = (int(part) for part in shard.split("/"))
+    except ValueError:
+        raise ValueError(f"{shard} is not in K/N form")
+    if not 1 <= shard_number <= shard_count:
+        raise ValueError(f"{shard} needs 1 <= K <= N")
+    return shard_number, shard_count
+
+
+# ----------------------------------------
+def shard_range(file_name, shard_number, shard_count):
+
+    # --split the file size evenly, then move both ends forward to the next
+    # --line start so every line belongs to exactly one shard
+    file_size = os.path.getsize(file_name)
+    with open(file_name, "rb") as file_handle:
+
+        def line_start(offset):
+            if offset <= 0 or offset >= file_size:
+                return min(max(offset, 0), file_size)
+            file_handle.seek(offset - 1)
+            file_handle.readline()
+            return file_handle.tell()
+
+        return (
+            line_start(file_size * (shard_number - 1) // shard_count),
+            line_start(file_size * shard_number // shard_count),
+        )
+
+
+# ----------------------------------------
+def merge_shards(shard_files, output_file, log_files, log_file):
+
+    # --shards compressed like the output are concatenated as is, every format
+    # --supported here reads concatenated streams as one; otherwise re-encode
+    if shard_files:
+        import shutil
+
+        compression = detect_compression(output_file)
+        raw_copy = all(
+            detect_compression(shard_file, check_magic=True) == compression
+            for shard_file in shard_files
+        )
+        if raw_copy:
+            output_file_handle = open(output_file, "wb")
+        else:
+            output_file_handle = open_output_file(output_file)
+        with output_file_handle:
+            for shard_file in shard_files:
+                if raw_copy:
+                    shard_file_handle = open(shard_file, "rb")
+                else:
+                    shard_file_handle = open_input_file(shard_file)
+                with shard_file_handle:
+                    shutil.copyfileobj(shard_file_handle, output_file_handle, 1048576)
+        print(f"{len(shard_files)} shard outputs merged into {output_file}")
+
+    if log_files:
+        stats = stats_collector()
+        run_info = {"status": "merged", "shards": len(log_files)}
+        for shard_log_file in log_files:
+            with open(shard_log_file) as file_handle:
+                shard_log = json.load(file_handle)
+            stats.merge(shard_log["stat_pack"])
+            for count_key in ("input_row_count", "output_row_count"):
+                run_info[count_key] = run_info.get(count_key, 0) + shard_log[
+                    "run"
+                ].get(count_key, 0)
+        write_stat_pack(log_file, stats.stat_pack(), run_info)
+        print(f"{len(log_files)} statistics logs merged into {log_file}")
+
+
+# ----------------------------------------
+def write_stat_pack(log_file, stat_pack, run_info):
+
+    # --replaced in one rename so anyone watching the log never reads half of it
+    with open(log_file + ".tmp", "w") as file_handle:
+        json.dump(
+            {"run": run_info, "stat_pack": stat_pack},
+            file_handle,
+            indent=4,
+            sort_keys=True,
+        )
+    os.replace(log_file + ".tmp", log_file)
+
+
+# ----------------------------------------
+def read_batches(input_lines, batch_size, start_row_num=1):
+    lines = []
+    for line in input_lines:
+        lines.append(line)
+        if len(lines) == batch_size:
+            yield start_row_num, lines
+            start_row_num += len(lines)
+            lines = []
+        if shut_down:
+            break
+    if lines:
+        yield start_row_num, lines
+
+
+# ----------------------------------------
+def process_parallel(
+    batches,
+    map_function,
+    output_file_handle,
+    mapper_obj,
+    progress,
+    state=None,
+    stats_log=None,
+):
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+    collector = batch_collector(
+        output_file_handle, mapper_obj, progress, state, stats_log
+    )
+
+    def collect(future):
+        collector(future.result())
+
+    # --keep a bounded number of batches in flight so memory stays flat
+    max_pending = args.workers * 2
+    with ProcessPoolExecutor(
+        max_workers=args.workers, initializer=init_worker, initargs=(args,)
+    ) as executor:
+        # --checkpoints need the output to be a prefix of the input, so they
+        # --collect batches in order too
+        if args.ordered or args.checkpoint_rows or args.resume:
+            pending = collections.deque()
+            for batch in batches:
+                pending.append(executor.submit(map_function, batch))
+                if len(pending) >= max_pending:
+                    collect(pending.popleft())
+            while pending:
+                collect(pending.popleft())
+        else:
+            pending = set()
+            for batch in batches:
+                pending.add(executor.submit(map_function, batch))
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future)
+            for future in pending:
+                collect(future)
+
+    return progress["input_row_count"], progress["output_row_count"]
+
+
+# ----------------------------------------
+async def process_pipeline(
+    batches,
+    map_function,
+    output_file_handle,
+    mapper_obj,
+    progress,
+    state=None,
+    stats_log=None,
+):
+
+    # --reader, mapper and writer stages joined by bounded queues so reading,
+    # --mapping and writing overlap; a full queue holds the stage before it back
+    import asyncio
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    loop = asyncio.get_running_loop()
+    queue_size = max(args.workers, 1) * 2
+    read_queue = asyncio.Queue(queue_size)
+    write_queue = asyncio.Queue(queue_size)
+    collector = batch_collector(
+        output_file_handle, mapper_obj, progress, state, stats_log
+    )
+
+    # --blocking reads and writes each get their own thread, mapping goes to the
+    # --worker pool or, without workers, to one thread with its own mapper
+    if args.workers > 1:
+        map_executor = ProcessPoolExecutor(
+            max_workers=args.workers, initializer=init_worker, initargs=(args,)
+        )
+    else:
+        map_executor = ThreadPoolExecutor(
+            max_workers=1, initializer=init_worker, initargs=(args, True)
+        )
+    read_executor = ThreadPoolExecutor(max_workers=1)
+    write_executor = ThreadPoolExecutor(max_workers=1)
+
+    async def read_stage():
+        # --read_batches stops at shut_down, the end marker then flows downstream
+        while True:
+            batch = await loop.run_in_executor(read_executor, next, batches, None)
+            await read_queue.put(batch)
+            if batch is None:
+                return
+
+    async def map_stage():
+        while True:
+            batch = await read_queue.get()
+            if batch is None:
+                break
+            # --after an interrupt batches already read are dropped, not mapped
+            if shut_down:
+                continue
+            mapped_batch = loop.run_in_executor(map_executor, map_function, batch)
+            await write_queue.put(mapped_batch)
+        await write_queue.put(None)
+
+    async def write_stage():
+        # --batches are written in input order, so checkpoints stay valid
+        while True:
+            mapped_batch = await write_queue.get()
+            if mapped_batch is None:
+                return
+            batch_result = await mapped_batch
+            await loop.run_in_executor(write_executor, collector, batch_result)
+
+    with map_executor, read_executor, write_executor:
+        await asyncio.gather(read_stage(), map_stage(), write_stage())
+
+    return progress["input_row_count"], progress["output_row_count"]
+
+
+# ----------------------------------------
+def save_checkpoint(output_file_handle, mapper_obj, progress):
+
+    # --everything up to input_offset is in the output up to output_offset,
+    # --written to a temp file and renamed so a crash never leaves half of one
+    mapper_obj.capture_counter_stats()
+    checkpoint = {
+        "input_file": args.input_file,
+        "shard": args.shard,
+        "output_file": args.output_file,
+        "input_offset": progress["input_offset"],
+        "output_offset": output_file_handle.sync(),
+        "input_row_count": progress["input_row_count"],
+        "output_row_count": progress["output_row_count"],
+        "bad_row_count": progress["bad_row_count"],
+        "checkpoint_rows": args.checkpoint_rows,
+        "stat_pack": mapper_obj.stat_pack,
+    }
+    checkpoint_file = args.output_file + ".checkpoint"
+    with open(checkpoint_file + ".tmp", "w") as file_handle:
+        json.dump(checkpoint, file_handle)
+    os.replace(checkpoint_file + ".tmp", checkpoint_file)
+
+
+# ----------------------------------------
+def load_checkpoint(checkpoint_file):
+    with open(checkpoint_file) as file_handle:
+        checkpoint = json.load(file_handle)
+    if checkpoint.get("input_file") != args.input_file:
+        raise ValueError(f"it belongs to input file {checkpoint.get('input_file')}")
+    if checkpoint.get("shard") != args.shard:
+        raise ValueError(f"it belongs to shard {checkpoint.get('shard')}")
+    if os.path.getsize(args.output_file) < checkpoint["output_offset"]:
+        raise ValueError(f"{args.output_file} is shorter than the checkpoint")
+    return checkpoint
+
+
 # ----------------------------------------
 if __name__ == "__main__":
     proc_start_time = time.time()
@@ -1869,11 +2672,231 @@ if __name__ == "__main__":
         dest="log_file",
         help="optional name of the statistics log file",
     )
+    parser.add_argument(
+        "--stats_snapshot_rows",
+        "--stats-snapshot-rows",
+        dest="stats_snapshot_rows",
+        type=int,
+        default=100000,
+        help="rows between statistics log snapshots (default 100000, 0 writes it only at the end)",
+    )
     parser.add_argument(
         "-d", "--data_source", dest="data_source", help="data source code (required)"
     )
+    parser.add_argument(
+        "--reference_file",
+        dest="reference_file",
+        help="optional json file of extra identifier types and garbage values",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        dest="workers",
+        type=int,
+        default=0,
+        help="optional number of worker processes to map with (default is to map in this process)",
+    )
+    parser.add_argument(
+        "--batch_size",
+        dest="batch_size",
+        type=int,
+        default=1000,
+        help="number of input lines handed to a worker at a time (default 1000)",
+    )
+    parser.add_argument(
+        "--ordered",
+        dest="ordered",
+        action="store_true",
+        default=False,
+        help="keep the output in the same order as the input when using workers",
+    )
+    parser.add_argument(
+        "--json_backend",
+        "--json-backend",
+        dest="json_backend",
+        choices=["auto"] + JSON_BACKENDS,
+        default="auto",
+        help="json library used to decode input lines (default auto picks the fastest installed)",
+    )
+    parser.add_argument(
+        "--read_buffer_mb",
+        dest="read_buffer_mb",
+        type=float,
+        default=8,
+        help="size of the chunks read from the input file in megabytes (default 8)",
+    )
+    parser.add_argument(
+        "--write_buffer_mb",
+        dest="write_buffer_mb",
+        type=float,
+        default=8,
+        help="output is written each time this many megabytes are buffered (default 8)",
+    )
+    parser.add_argument(
+        "--compress_level",
+        dest="compress_level",
+        type=int,
+        help="compression level when the output file ends in .gz, .bz2, .xz or .zst",
+    )
+    parser.add_argument(
+        "--compress_threads",
+        dest="compress_threads",
+        type=int,
+        default=-1,
+        help="zstd compression threads (default -1 uses all cores, 0 compresses inline)",
+    )
+    parser.add_argument(
+        "--stats_sample_rate",
+        "--stats-sample-rate",
+        dest="stats_sample_rate",
+        type=float,
+        default=1.0,
+        help="fraction of records whose mapped attributes feed the statistics (default 1.0)",
+    )
+    parser.add_argument(
+        "--no_stats",
+        "--no-stats",
+        dest="no_stats",
+        action="store_true",
+        default=False,
+        help="turn statistics collection off completely",
+    )
+    parser.add_argument(
+        "--payload_store",
+        dest="payload_store",
+        type=str,
+        help="sqlite file that receives large apc text payloads, features keep only a hash reference",
+    )
+    parser.add_argument(
+        "--include_groups",
+        "--include-groups",
+        dest="include_groups",
+        type=str,
+        help="comma separated feature groups to map, all others are skipped",
+    )
+    parser.add_argument(
+        "--exclude_groups",
+        "--exclude-groups",
+        dest="exclude_groups",
+        type=str,
+        help="comma separated feature groups to skip",
+    )
+    parser.add_argument(
+        "--state_index",
+        "--state-index",
+        dest="state_index",
+        type=str,
+        help="sqlite record hash index, only new or changed records and deletes are written",
+    )
+    parser.add_argument(
+        "--checkpoint_rows",
+        "--checkpoint-rows",
+        dest="checkpoint_rows",
+        type=int,
+        default=0,
+        help="rows between checkpoints for --resume (default 0, no checkpoints)",
+    )
+    parser.add_argument(
+        "--resume",
+        dest="resume",
+        action="store_true",
+        default=False,
+        help="continue an interrupted run from its last checkpoint",
+    )
+    parser.add_argument(
+        "--pipeline",
+        dest="pipeline",
+        action="store_true",
+        default=False,
+        help="overlap reading, mapping and writing in an asyncio pipeline",
+    )
+    parser.add_argument(
+        "--mmap",
+        dest="mmap",
+        action="store_true",
+        default=False,
+        help="memory map the uncompressed input file instead of reading it in chunks",
+    )
+    parser.add_argument(
+        "--shard",
+        dest="shard",
+        type=str,
+        help="map only shard K of N newline aligned byte ranges of the input file, e.g. 2/8",
+    )
+    parser.add_argument(
+        "--merge",
+        dest="merge",
+        nargs="+",
+        help="concatenate these shard output files into the output file and exit",
+    )
+    parser.add_argument(
+        "--merge_logs",
+        "--merge-logs",
+        dest="merge_logs",
+        nargs="+",
+        help="combine these shard statistics logs into the log file and exit",
+    )
+    parser.add_argument(
+        "--fingerprint_algorithm",
+        "--fingerprint-algorithm",
+        dest="fingerprint_algorithm",
+        choices=["auto"] + FINGERPRINT_ALGORITHMS,
+        default="auto",
+        help="hash used to detect changed records (default auto picks the fastest installed)",
+    )
+    parser.add_argument(
+        "--fingerprint_groups",
+        "--fingerprint-groups",
+        dest="fingerprint_groups",
+        type=str,
+        help="comma separated feature groups that count as a change, others are ignored",
+    )
+    parser.add_argument(
+        "--time_groups",
+        "--time-groups",
+        dest="time_groups",
+        action="store_true",
+        default=False,
+        help="report the calls, time and features of each feature group in the statistics log",
+    )
+    parser.add_argument(
+        "--max_features",
+        "--max-features",
+        dest="max_features",
+        type=int,
+        help="most FEATURES entries written per record, the rest are dropped and counted",
+    )
+    parser.add_argument(
+        "--max_feature_bytes",
+        "--max-feature-bytes",
+        dest="max_feature_bytes",
+        type=int,
+        help="most encoded FEATURES bytes written per record, the rest are dropped and counted",
+    )
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        action="store_true",
+        default=False,
+        help="run the mapping under cProfile and print the most expensive functions",
+    )
     args = parser.parse_args()
 
+    # --merge mode stitches the outputs and statistics of --shard runs together
+    if args.merge or args.merge_logs:
+        if args.merge and not args.output_file:
+            print("\nPlease supply the merged output file name on the command line\n")
+            sys.exit(1)
+        if args.merge_logs and not args.log_file:
+            print("\nPlease supply the merged log file name on the command line\n")
+            sys.exit(1)
+        for shard_file in (args.merge or []) + (args.merge_logs or []):
+            if not os.path.exists(shard_file):
+                print(f"\nShard file {shard_file} does not exist\n")
+                sys.exit(1)
+        merge_shards(args.merge, args.output_file, args.merge_logs, args.log_file)
+        sys.exit(0)
+
     if not args.input_file or not os.path.exists(args.input_file):
         print("\nPlease supply a valid input file name on the command line\n")
         sys.exit(1)
@@ -1883,32 +2906,318 @@ if __name__ == "__main__":
     if not args.data_source:
         print("\nPlease supply a data source code on the command line\n")
         sys.exit(1)
+    if args.reference_file and not os.path.exists(args.reference_file):
+        print("\nPlease supply a valid reference file name on the command line\n")
+        sys.exit(1)
+    if args.workers < 0 or args.batch_size < 1:
+        print("\nPlease supply a positive number of workers and batch size\n")
+        sys.exit(1)
+    if args.read_buffer_mb <= 0 or args.write_buffer_mb < 0:
+        print("\nPlease supply positive read and write buffer sizes\n")
+        sys.exit(1)
+    if not 0.0 <= args.stats_sample_rate <= 1.0:
+        print("\nPlease supply a statistics sample rate between 0 and 1\n")
+        sys.exit(1)
+    for group_arg in ("include_groups", "exclude_groups", "fingerprint_groups"):
+        if getattr(args, group_arg):
+            group_names = getattr(args, group_arg).split(",")
+            setattr(
+                args,
+                group_arg,
+                [group.strip() for group in group_names if group.strip()],
+            )
+    try:
+        select_feature_groups(FEATURE_GROUPS, args.include_groups, args.exclude_groups)
+        select_feature_groups(FEATURE_GROUPS, args.fingerprint_groups)
+    except ValueError as err:
+        print(f"\nPlease supply valid feature groups: {err}\n")
+        sys.exit(1)
+    try:
+        record_fingerprinter(args.fingerprint_algorithm)
+    except ImportError as err:
+        print(f"\n{err}\n")
+        sys.exit(1)
+
+    # --checkpoints rewind the output file, which a compressed stream can not do,
+    # --and a resumed run would report every earlier record as deleted
+    checkpoint_supported = not (
+        detect_compression(args.output_file) or args.state_index
+    )
+    if (args.checkpoint_rows or args.resume) and not checkpoint_supported:
+        print("\nCheckpoints need an uncompressed output file and no state index\n")
+        sys.exit(1)
+    if args.checkpoint_rows < 0:
+        print("\nPlease supply a positive number of checkpoint rows\n")
+        sys.exit(1)
+    if (args.max_features is not None and args.max_features < 1) or (
+        args.max_feature_bytes is not None and args.max_feature_bytes < 1
+    ):
+        print("\nPlease supply a positive feature limit\n")
+        sys.exit(1)
+    if args.time_groups and not args.log_file:
+        print("\nGroup timing is reported in the statistics log, please supply one\n")
+        sys.exit(1)
+    if args.time_groups and args.no_stats:
+        print("\nGroup timing is kept with the statistics, it can not be used with --no_stats\n")
+        sys.exit(1)
+    if args.profile and (args.workers > 1 or args.pipeline):
+        print("\nThe profile only covers this process, run it without --workers or --pipeline\n")
+        sys.exit(1)
+    if args.stats_snapshot_rows < 0:
+        print("\nPlease supply a positive number of statistics snapshot rows\n")
+        sys.exit(1)
+    if args.mmap and detect_compression(args.input_file, check_magic=True):
+        print("\nMemory mapping needs an uncompressed input file\n")
+        sys.exit(1)
 
-    input_file_handle = open(args.input_file, "r", encoding="utf-8")
-    output_file_handle = open(args.output_file, "w", encoding="utf-8")
+    shard_start, shard_end = 0, None
+    if args.shard:
+        try:
+            shard_number, shard_count = parse_shard(args.shard)
+        except ValueError as err:
+            print(f"\nPlease supply a valid shard: {err}\n")
+            sys.exit(1)
+        if detect_compression(args.input_file, check_magic=True):
+            print("\nSharding needs an uncompressed input file\n")
+            sys.exit(1)
+        # --a shard only sees part of the records, so a shared index would see the
+        # --others as deleted and a per shard one loses records that move shards
+        if args.state_index:
+            print("\nSharding can not be combined with a state index\n")
+            sys.exit(1)
+        shard_start, shard_end = shard_range(args.input_file, shard_number, shard_count)
+        print(f"\nMapping shard {args.shard}: bytes {shard_start} to {shard_end}\n")
+
+    checkpoint = None
+    if args.resume:
+        try:
+            checkpoint = load_checkpoint(args.output_file + ".checkpoint")
+        except (OSError, ValueError, KeyError) as err:
+            print(f"\nCannot resume from {args.output_file}.checkpoint: {err}\n")
+            sys.exit(1)
+
+        # --a resumed run keeps checkpointing the way the interrupted one did
+        if not args.checkpoint_rows:
+            args.checkpoint_rows = checkpoint.get("checkpoint_rows", 0)
+    try:
+        codec = json_codec(args.json_backend)
+    except ImportError as err:
+        print(f"\n{err}\n")
+        sys.exit(1)
 
-    mapper_obj = mapper()  # renamed to avoid shadowing the class/function
+    progress = {
+        "input_offset": shard_start,
+        "input_row_count": 0,
+        "output_row_count": 0,
+        "bad_row_count": 0,
+    }
+    if checkpoint:
+        for key in progress:
+            progress[key] = checkpoint.get(key, 0)
+        print(f"\nResuming after row {checkpoint['input_row_count']}\n")
+
+    if args.mmap:
+        input_file_handle = None
+        input_map = map_input_file(args.input_file)
+        input_end = shard_end if shard_end is not None else len(input_map)
+        input_lines = read_mapped_lines(
+            input_map, progress["input_offset"], input_end, codec.accepts_memoryview
+        )
+    else:
+        input_file_handle = open_input_file(args.input_file)
+        if progress["input_offset"]:
+            input_file_handle.seek(progress["input_offset"])
+        input_lines = read_lines(
+            input_file_handle,
+            int(args.read_buffer_mb * 1048576) or 1,
+            shard_end - progress["input_offset"] if shard_end is not None else None,
+        )
+    output_file_handle = buffered_writer(
+        open_output_file(
+            args.output_file,
+            args.compress_level,
+            args.compress_threads,
+            checkpoint["output_offset"] if checkpoint else None,
+        ),
+        int(args.write_buffer_mb * 1048576),
+    )
 
-    input_row_count = 0
-    output_row_count = 0
+    if args.payload_store or args.state_index:
+        import sqlite3
 
-    for line in input_file_handle:
-        input_row_count += 1
+    store = None
+    if args.payload_store:
         try:
-            input_row = json.loads(line)
-        except json.JSONDecodeError as e:
-            print(f"Skipping line {input_row_count} due to JSON parse error: {e}")
-            continue
+            store = payload_store(args.payload_store)
+        except sqlite3.Error as err:
+            print(f"\nCould not open payload store {args.payload_store}: {err}\n")
+            sys.exit(1)
 
-        json_data = mapper_obj.map(input_row, input_row_count)
-        if json_data:
-            output_file_handle.write(json.dumps(json_data) + "\n")
-            output_row_count += 1
+    state = None
+    if args.state_index:
+        try:
+            state = state_index(args.state_index)
+        except sqlite3.Error as err:
+            print(f"\nCould not open state index {args.state_index}: {err}\n")
+            sys.exit(1)
+
+    try:
+        mapper_obj = mapper(
+            args.data_source, mapper_options(args, store)
+        )  # renamed to avoid shadowing the class/function
+    except ValueError as err:
+        print(f"\nInvalid reference file {args.reference_file}: {err}\n")
+        sys.exit(1)
 
-        if input_row_count % 1000 == 0:
-            print(f"{input_row_count} rows processed, {output_row_count} rows written")
-        if shut_down:
-            break
+    if checkpoint:
+        mapper_obj.merge_stat_pack(checkpoint["stat_pack"])
+
+    input_row_count = progress["input_row_count"]
+    output_row_count = progress["output_row_count"]
+
+    stats_log = None
+    if args.log_file:
+        stats_log = stats_log_writer(
+            args.log_file, args.stats_snapshot_rows, input_row_count
+        )
+
+    profiler = None
+    if args.profile:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    # --a record that raises must not take the mapped lines or the payloads
+    # --still buffered with it, so both are flushed and closed on the way out
+    try:
+        if args.workers > 1 or args.pipeline:
+            if args.mmap:
+                batches = read_mapped_batches(
+                    input_map,
+                    progress["input_offset"],
+                    input_end,
+                    args.batch_size,
+                    input_row_count + 1,
+                )
+                map_function = map_mapped_batch
+            else:
+                batches = read_batches(
+                    input_lines, args.batch_size, input_row_count + 1
+                )
+                map_function = map_batch
+            if args.pipeline:
+                import asyncio
+
+                input_row_count, output_row_count = asyncio.run(
+                    process_pipeline(
+                        batches,
+                        map_function,
+                        output_file_handle,
+                        mapper_obj,
+                        progress,
+                        state,
+                        stats_log,
+                    )
+                )
+            else:
+                input_row_count, output_row_count = process_parallel(
+                    batches,
+                    map_function,
+                    output_file_handle,
+                    mapper_obj,
+                    progress,
+                    state,
+                    stats_log,
+                )
+        else:
+            input_offset = progress["input_offset"]
+            next_checkpoint_count = input_row_count + args.checkpoint_rows
+            for line in input_lines:
+                input_row_count += 1
+                input_offset += len(line) + 1
+                try:
+                    input_row = codec.loads(line)
+                except json.JSONDecodeError as e:
+                    print(
+                        f"Skipping line {input_row_count} due to JSON parse error: {e}"
+                    )
+                    progress["bad_row_count"] += 1
+                    continue
+
+                json_data = mapper_obj.map(input_row, input_row_count)
+                if json_data:
+                    output_line = codec.dumps(json_data)
+                    record_id = json_data.get("RECORD_ID")
+                    if (
+                        not state
+                        or record_id is None
+                        or state.changed(
+                            record_id, mapper_obj.fingerprint(json_data, output_line)
+                        )
+                    ):
+                        output_file_handle.write(output_line)
+                        output_row_count += 1
+
+                if input_row_count % 1000 == 0:
+                    print(
+                        f"{input_row_count} rows processed, "
+                        f"{output_row_count} rows written"
+                    )
+                if args.checkpoint_rows and input_row_count >= next_checkpoint_count:
+                    progress["input_offset"] = input_offset
+                    progress["input_row_count"] = input_row_count
+                    progress["output_row_count"] = output_row_count
+                    save_checkpoint(output_file_handle, mapper_obj, progress)
+                    next_checkpoint_count = input_row_count + args.checkpoint_rows
+                if stats_log and input_row_count >= stats_log.next_snapshot_count:
+                    stats_log.write(mapper_obj, input_row_count, output_row_count)
+                if shut_down:
+                    break
+            progress["input_offset"] = input_offset
+            progress["input_row_count"] = input_row_count
+            progress["output_row_count"] = output_row_count
+    except BaseException:
+        output_file_handle.close()
+        if store:
+            store.close()
+        raise
+
+    if profiler:
+        profiler.disable()
+
+    # --records of the last run that did not show up this time are deleted, but
+    # --not when some lines could not be read as they may have held any of them
+    if state and progress["bad_row_count"]:
+        print(
+            f"\n{progress['bad_row_count']} lines could not be parsed, "
+            "no deletes written this run\n"
+        )
+    elif state and not shut_down:
+        for record_id in state.deleted_record_ids():
+            output_file_handle.write(
+                codec.dumps(
+                    {
+                        "DATA_SOURCE": args.data_source,
+                        "RECORD_ID": record_id,
+                        "DSRC_ACTION": "D",
+                    }
+                )
+            )
+
+    mapper_obj.capture_counter_stats()
+    if stats_log:
+        stats_log.write(
+            mapper_obj,
+            input_row_count,
+            output_row_count,
+            "completed" if not shut_down else "aborted",
+        )
+    cache_stats = mapper_obj.stat_pack.get("!NORMALIZE_CACHE", {})
+    cache_hits = cache_stats.get("HITS", {}).get("count", 0)
+    cache_misses = cache_stats.get("MISSES", {}).get("count", 0)
+    if cache_hits or cache_misses:
+        print(f"normalize cache: {cache_hits} hits, {cache_misses} misses")
 
     elapsed_mins = round((time.time() - proc_start_time) / 60, 1)
     run_status = (
@@ -1918,7 +3227,36 @@ if __name__ == "__main__":
         f"{input_row_count} rows processed, {output_row_count} rows written, {run_status}\n"
     )
 
+    if profiler:
+        import pstats
+
+        # --the raw profile goes next to the statistics log for later digging
+        profile_stats = pstats.Stats(profiler, stream=sys.stdout)
+        profile_stats.sort_stats("cumulative").print_stats(30)
+        if args.log_file:
+            profile_stats.dump_stats(args.log_file + ".prof")
+            print(f"profile written to {args.log_file}.prof\n")
+
+    if store:
+        store.close()
+        print(f"{store.stored_count} payloads written to {args.payload_store}\n")
+    if args.checkpoint_rows or args.resume:
+        if shut_down:
+            save_checkpoint(output_file_handle, mapper_obj, progress)
+            print("use --resume to continue from where this run stopped\n")
+        elif os.path.exists(args.output_file + ".checkpoint"):
+            os.remove(args.output_file + ".checkpoint")
+    if state:
+        print(
+            f"{state.changed_count} new or changed, {state.unchanged_count} unchanged"
+            f" and {state.deleted_count} deleted records\n"
+        )
+        # --flush the output before the index records this run as delivered
+        output_file_handle.flush()
+        state.close(commit=not shut_down)
+
     output_file_handle.close()
-    input_file_handle.close()
+    if input_file_handle:
+        input_file_handle.close()
 
     sys.exit(0)
\ No newline at end of file